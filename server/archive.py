@@ -0,0 +1,214 @@
+"""
+ZIP 打包下载：把多个对象边读边解密、边写入 ZIP 流，不落临时文件，也不在内存中攒整个归档。
+
+输出端不可 seek，zipfile 会为每个条目写数据描述符（data descriptor），
+条目大小和 CRC 在数据之后给出，因此可以一边读取一边输出。
+
+读取端按归档顺序预取：后台最多同时读取 prefetch 个对象，
+每个对象最多缓冲 queue_size 个已解密的分块，内存占用与对象大小无关；
+客户端读得慢时预取线程阻塞在有界队列上，不会无限制地从 MinIO 拉取数据。
+"""
+import posixpath
+import queue
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Optional
+
+from metrics import submit
+
+# 读取失败的文件记录在归档末尾的该文件中
+ERRORS_NAME = "_errors.txt"
+# 输出过程中读取失败的条目已经写出了部分数据，在中央目录中给文件名加上该后缀
+INCOMPLETE_SUFFIX = ".incomplete"
+
+_END = object()
+
+
+def archive_entries(names: Iterable[str], base: str) -> list:
+    """返回 [(对象名, 归档内路径)]，归档内路径相对于 base，以 / 结尾的是文件夹"""
+    entries = []
+    for name in sorted(set(names)):
+        arcname = name[len(base):] if name.startswith(base) else name
+        arcname = "/".join(part for part in arcname.split("/") if part not in ("", ".", ".."))
+        if not arcname:
+            continue
+        entries.append((name, arcname + "/" if name.endswith("/") else arcname))
+    return entries
+
+
+def common_base(names: Iterable[str]) -> str:
+    """所选对象/文件夹的公共上级目录（以 / 结尾，没有时为空串）"""
+    parents = [posixpath.dirname(name.rstrip("/")) for name in names]
+    if not parents:
+        return ""
+    base = posixpath.commonpath(parents) if all(parents) else ""
+    return base + "/" if base else ""
+
+
+class _Sink:
+    """zipfile 的只写输出，写入的数据暂存，由生成器取走后发给客户端"""
+
+    def __init__(self):
+        self._parts = []
+        self.pending = 0
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        self.pending += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        self.pending = 0
+        return data
+
+
+class _Prefetcher:
+    """
+    按顺序预取对象：open_object(name) 返回 (元数据, 明文分块迭代器)，
+    在后台线程中执行并把元数据、分块依次放入每个对象自己的有界队列
+    """
+
+    def __init__(self, open_object: Callable, names: Iterable[str], prefetch: int, queue_size: int):
+        self._open_object = open_object
+        self._names = iter(names)
+        self._queue_size = max(1, queue_size)
+        self._pending = deque()
+        self._cancelled = threading.Event()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, prefetch), thread_name_prefix="archive")
+        for _ in range(max(1, prefetch)):
+            self._submit()
+
+    def _submit(self):
+        name = next(self._names, None)
+        if name is None:
+            return
+        items = queue.Queue(self._queue_size)
+        self._pending.append(items)
+        # 预取线程中的读取、解密耗时仍计入发起打包的请求
+        submit(self._pool, self._fetch, name, items)
+
+    def _put(self, items: queue.Queue, item) -> bool:
+        """放入队列，下载被取消时返回 False"""
+        while not self._cancelled.is_set():
+            try:
+                items.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fetch(self, name: str, items: queue.Queue):
+        chunks = None
+        try:
+            info, chunks = self._open_object(name)
+            if not self._put(items, info):
+                return
+            for chunk in chunks:
+                if not self._put(items, chunk):
+                    return
+            self._put(items, _END)
+        except Exception as e:
+            self._put(items, e)
+        finally:
+            # 提前结束时关闭分块迭代器，及时归还 MinIO 连接
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+
+    def next(self):
+        """取出下一个对象，返回 (元数据, 分块生成器)；读取失败时抛出对应异常"""
+        items = self._pending.popleft()
+        # 补上一个待预取的对象；线程池大小不变，同时读取的对象数仍不超过 prefetch
+        self._submit()
+        info = items.get()
+        if isinstance(info, Exception):
+            raise info
+        return info, self._drain(items)
+
+    @staticmethod
+    def _drain(items: queue.Queue):
+        while True:
+            item = items.get()
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def close(self):
+        self._cancelled.set()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _date_time(last_modified) -> tuple:
+    if last_modified is None:
+        return (1980, 1, 1, 0, 0, 0)
+    return max(tuple(last_modified.timetuple())[:6], (1980, 1, 1, 0, 0, 0))
+
+
+def _mark_incomplete(archive: zipfile.ZipFile, zinfo: zipfile.ZipInfo) -> int:
+    """把已写出部分数据的条目在中央目录中改名，返回已写出的明文字节数"""
+    archive.NameToInfo.pop(zinfo.filename, None)
+    zinfo.filename = zinfo.orig_filename = zinfo.filename + INCOMPLETE_SUFFIX
+    archive.NameToInfo[zinfo.filename] = zinfo
+    return zinfo.file_size
+
+
+def stream_zip(entries: list, open_object: Callable, prefetch: int = 4, queue_size: int = 8,
+               compression: int = zipfile.ZIP_STORED, compresslevel: Optional[int] = None):
+    """
+    生成 ZIP 流的各个片段。entries 为 archive_entries() 的结果；
+    open_object(name) 返回 ({"size", "last_modified"}, 明文分块迭代器)，会在预取线程中调用。
+
+    文件在输出第一块数据之前读取失败（对象不存在、无法解密等）时不写入该条目；
+    已经开始输出后才失败的，条目头和部分数据已经发给客户端，无法撤回，
+    该条目以截断后的内容结束（CRC 与截断的数据相符，解压时不会报错），
+    因此在中央目录中把它改名为 "原名.incomplete"（条目头里仍是原名，unzip 等工具以中央目录为准并给出警告）。
+    两种情况的原因都写入末尾的 _errors.txt
+    """
+    sink = _Sink()
+    errors = []
+    prefetcher = _Prefetcher(
+        open_object, [name for name, arcname in entries if not arcname.endswith("/")], prefetch, queue_size
+    )
+    try:
+        with zipfile.ZipFile(sink, "w", compression=compression, compresslevel=compresslevel) as archive:
+            for name, arcname in entries:
+                if arcname.endswith("/"):
+                    archive.writestr(zipfile.ZipInfo(arcname), b"")
+                    continue
+                zinfo = None
+                try:
+                    info, chunks = prefetcher.next()
+                    # 先取到第一块数据再写条目头，打开或解密失败的文件整个跳过
+                    first = next(chunks, b"")
+                    zinfo = zipfile.ZipInfo(arcname, _date_time(info.get("last_modified")))
+                    zinfo.compress_type = compression
+                    zinfo.file_size = info["size"]
+                    with archive.open(zinfo, "w") as target:
+                        target.write(first)
+                        for chunk in chunks:
+                            target.write(chunk)
+                            if sink.pending:
+                                yield sink.drain()
+                except Exception as e:
+                    # 响应已经开始输出，无法再改状态码，只能记录原因
+                    if zinfo is None:
+                        errors.append(f"{name}: skipped: {e}")
+                    else:
+                        written = _mark_incomplete(archive, zinfo)
+                        errors.append(f"{name}: incomplete after {written} bytes: {e}")
+                if sink.pending:
+                    yield sink.drain()
+            if errors:
+                archive.writestr(ERRORS_NAME, "\n".join(errors) + "\n")
+        yield sink.drain()
+    finally:
+        prefetcher.close()
@@ -0,0 +1,229 @@
+"""
+批量对象操作：多对象删除、整个文件夹的服务端移动（改名），以及逐对象处理的有序流水线。
+
+移动按批进行：每批最多 batch_size 个对象，先用有界线程池并发 copy_object 到目标前缀，
+再用一次多对象删除（DeleteObjects）删除复制成功的源对象。
+每一步都是幂等的——中断后用相同参数重新执行即可继续：已删除的源对象不会再出现，
+复制了但还没删除的源对象会被重新复制并覆盖目标。移动作为后台任务（jobs.py）执行，失败后自动重试。
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import Callable, Optional
+
+from minio.commonconfig import REPLACE, CopySource
+from minio.deleteobjects import DeleteObject
+from minio.error import S3Error
+
+# S3 多对象删除单次最多 1000 个键
+DELETE_BATCH_SIZE = 1000
+
+
+def remove_objects(client, bucket_name: str, names: list) -> dict:
+    """多对象删除，返回删除失败的 {对象名: 错误信息}"""
+    errors = {}
+    for start in range(0, len(names), DELETE_BATCH_SIZE):
+        batch = [DeleteObject(name) for name in names[start:start + DELETE_BATCH_SIZE]]
+        for error in client.remove_objects(bucket_name, batch):
+            errors[error.name] = f"{error.code}: {error.message}"
+    return errors
+
+
+def list_prefixes(client, bucket_name: str, prefixes) -> dict:
+    """递归列出各前缀下的所有对象（含文件夹占位对象），返回 {对象名: 大小}"""
+    objects = {}
+    for prefix in prefixes:
+        for obj in client.list_objects(bucket_name, prefix=prefix, recursive=True):
+            objects[obj.object_name] = obj.size
+    return objects
+
+
+def stat_sizes(client, bucket_name: str, names, max_workers: int = 16) -> dict:
+    """并发 stat 指定的对象，返回存在的对象 {对象名: 大小}；不存在的对象不出现在结果中"""
+    names = list(names)
+    if not names:
+        return {}
+
+    def size_of(name: str):
+        try:
+            return client.stat_object(bucket_name, name).size
+        except S3Error as e:
+            if e.code == "NoSuchKey":
+                return None
+            raise
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(names))) as pool:
+        sizes = pool.map(size_of, names)
+        return {name: size for name, size in zip(names, sizes) if size is not None}
+
+
+def object_metadata(stat) -> dict:
+    """对象的 Content-Type 和用户元数据（x-amz-meta-*，键统一为小写），stat 为 stat_object 的结果"""
+    metadata = {"Content-Type": stat.content_type or "application/octet-stream"}
+    for key, value in (stat.metadata or {}).items():
+        if key.lower().startswith("x-amz-meta-"):
+            metadata[key.lower()] = value
+    return metadata
+
+
+def copy_with_metadata(client, bucket_name: str, object_name: str, source_bucket: str, source_name: str, stat=None,
+                       if_match: Optional[str] = None):
+    """
+    服务端复制一个对象，源对象的 Content-Type 和用户元数据（密钥 ID、摘要、明文长度等）显式写入目标（REPLACE）。
+    不能依赖默认的 COPY：源对象超过 5 GiB 时 minio 改用分片复制（compose_object），不传元数据目标就没有元数据。
+    复制以 stat 时的 ETag 为条件，源对象在此期间被改写则失败（PreconditionFailed），元数据不会记到新内容上；
+    传入 if_match 时目标对象的当前 ETag 也必须与之相同，判断与写入在存储端原子完成
+    """
+    stat = stat or client.stat_object(source_bucket, source_name)
+    source = CopySource(source_bucket, source_name, match_etag=stat.etag)
+    if if_match is not None:
+        return client.copy_if_match(bucket_name, object_name, source, if_match, metadata=object_metadata(stat))
+    return client.copy_object(
+        bucket_name, object_name, source, metadata=object_metadata(stat), metadata_directive=REPLACE
+    )
+
+
+class RateLimiter:
+    """
+    令牌桶限速，多个线程共享；rate 为每秒的量（如字节数），不大于 0 表示不限速。
+    单次 acquire 可以超过桶容量，超出部分记为欠账，由调用方和后来者共同等待偿还
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            delay = -self._tokens / self.rate
+        if delay > 0:
+            time.sleep(delay)
+
+
+class ChunkReader:
+    """把分块迭代器包装成只读流（read(size)），可按限速器节流读取"""
+
+    def __init__(self, chunks, limiter: Optional[RateLimiter] = None):
+        self._chunks = iter(chunks)
+        self._limiter = limiter
+        self._buffer = b""
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or not self._buffer:
+            # 空分块不代表结束，跳过
+            data = b"".join(self._chunks) if size < 0 else next((chunk for chunk in self._chunks if chunk), b"")
+            if self._limiter is not None:
+                self._limiter.acquire(len(data))
+            self._buffer += data
+        if 0 <= size < len(self._buffer):
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        else:
+            data, self._buffer = self._buffer, b""
+        return bytes(data)
+
+
+def process_in_order(items, process: Callable, concurrency: int, on_done: Callable):
+    """
+    用有界线程池并发执行 process(item)，同时在途的不超过 concurrency 个，items 按需取用（可以是很长的列表迭代器）。
+    每个条目完成后在调用线程中执行 on_done(item, result, error, checkpoint)，error 为异常或 None；
+    checkpoint 是按 items 的顺序、它及之前的条目全部成功完成的最后一个条目（尚无时为 None），
+    中断后从 checkpoint 之后继续即不会漏掉条目。on_done 抛出异常（如任务被取消）时等在途条目结束后向上抛出
+    """
+    items = iter(items)
+    concurrency = max(1, concurrency)
+    pool = ThreadPoolExecutor(max_workers=concurrency)
+    # 按提交顺序排列的在途及已完成、尚未越过检查点的条目
+    window = deque()
+    pending = {}
+    checkpoint = None
+    blocked = False
+    try:
+        while True:
+            for item in islice(items, concurrency - len(pending)):
+                future = pool.submit(process, item)
+                pending[future] = item
+                window.append((future, item))
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            # 检查点只越过连续成功的条目，失败条目之后的部分留待重新执行时再确认
+            while window and window[0][0].done() and not blocked:
+                if window[0][0].exception() is not None:
+                    blocked = True
+                else:
+                    checkpoint = window.popleft()[1]
+            for future in done:
+                item = pending.pop(future)
+                error = future.exception()
+                on_done(item, None if error else future.result(), error, checkpoint)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+class PrefixMover:
+    """
+    文件夹移动。after_batch(bucket, moved) 在每批复制完成、删除源对象之前调用，
+    moved 为 [(源对象名, 目标对象名, 大小)]，用于同步缓存、索引等附属状态。
+    """
+
+    def __init__(self, concurrency: int = 16, batch_size: int = DELETE_BATCH_SIZE,
+                 after_batch: Optional[Callable] = None):
+        self.concurrency = max(1, concurrency)
+        self.batch_size = min(batch_size, DELETE_BATCH_SIZE)
+        self.after_batch = after_batch
+
+    def _copy(self, client, bucket_name: str, source_name: str, target_name: str):
+        copy_with_metadata(client, bucket_name, target_name, bucket_name, source_name)
+
+    def run(self, client, job, bucket_name: str, source: str, target: str) -> dict:
+        """
+        执行移动，job 为后台任务句柄（jobs.Job），每批结束后报告进度、检查是否被取消；
+        有对象移动失败时抛出异常（任务随后重试，已移动的对象不受影响）
+        """
+        progress = {"copied": 0, "deleted": 0, "failed": {}}
+        objects = client.list_objects(bucket_name, prefix=source, recursive=True)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            while True:
+                batch = list(islice(objects, self.batch_size))
+                if not batch:
+                    break
+                self._move_batch(client, pool, bucket_name, source, target, batch, progress)
+                job.progress(copied=progress["copied"], deleted=progress["deleted"], failed=progress["failed"])
+        job.progress(force=True, copied=progress["copied"], deleted=progress["deleted"], failed=progress["failed"])
+        if progress["failed"]:
+            raise RuntimeError(f"{len(progress['failed'])} objects failed to move")
+        return {"copied": progress["copied"], "deleted": progress["deleted"]}
+
+    def _move_batch(self, client, pool, bucket_name: str, source: str, target: str, batch: list, progress: dict):
+        pairs = [(obj, target + obj.object_name[len(source):]) for obj in batch]
+        futures = [
+            pool.submit(self._copy, client, bucket_name, obj.object_name, target_name)
+            for obj, target_name in pairs
+        ]
+        moved = []
+        for (obj, target_name), future in zip(pairs, futures):
+            try:
+                future.result()
+            except Exception as e:
+                progress["failed"][obj.object_name] = str(e)
+                continue
+            moved.append((obj.object_name, target_name, obj.size))
+        progress["copied"] += len(moved)
+        if not moved:
+            return
+        if self.after_batch:
+            self.after_batch(bucket_name, moved)
+        errors = remove_objects(client, bucket_name, [source_name for source_name, _, _ in moved])
+        progress["failed"].update(errors)
+        progress["deleted"] += len(moved) - len(errors)
@@ -0,0 +1,227 @@
+"""
+热点下载的内容缓存（两级，默认关闭）。
+
+    内存层：小对象缓存解密后的明文，命中时既不访问 MinIO 也不做解密
+    磁盘层：较大的对象缓存 MinIO 中的原始密文（不含对象头，IV 记录在条目中），
+            命中时不访问 MinIO，只做很便宜的 CTR 解密；明文不会落到本地磁盘
+
+两级各自有总容量和单个对象的大小上限，超出时按 LRU 淘汰。
+条目以 (bucket, object) 为键并记录对象的 ETag，ETag 变化即视为失效；
+本服务写入、删除、改名对象时主动失效。最近 revalidate 秒内确认过 ETag 的条目
+直接使用，否则先 stat 一次确认 ETag（外部直接改写 MinIO 时最多滞后 revalidate 秒）。
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+
+class CachedContent:
+    """缓存条目，同时充当下载响应所需的 stat 信息"""
+
+    __slots__ = ("etag", "size", "content_type", "last_modified", "digest", "key_id", "data", "path", "iv", "validated")
+
+    def __init__(self, etag: str, size: int, content_type, last_modified, digest=None, key_id: Optional[str] = None,
+                 data: Optional[bytes] = None, path: Optional[str] = None, iv: Optional[bytes] = None,
+                 validated: Optional[float] = None):
+        self.etag = etag
+        self.size = size
+        self.content_type = content_type
+        self.last_modified = last_modified
+        self.digest = digest
+        # 内存层为明文；磁盘层为密文文件路径及其 IV，密文所用的密钥 ID 记在 key_id
+        self.key_id = key_id
+        self.data = data
+        self.path = path
+        self.iv = iv
+        # 最近一次确认 ETag 的时间；新条目为开始读取对象时 stat 的时间
+        self.validated = validated if validated is not None else time.monotonic()
+
+
+class _FileRange:
+    """按 MinIO 响应的接口（stream / close / release_conn）读取缓存文件的一段"""
+
+    def __init__(self, f, length: int):
+        self._file = f
+        self._remaining = length
+
+    def stream(self, amt: int):
+        while self._remaining > 0:
+            chunk = self._file.read(min(amt, self._remaining))
+            if not chunk:
+                break
+            self._remaining -= len(chunk)
+            yield chunk
+
+    def close(self):
+        self._file.close()
+
+    def release_conn(self):
+        pass
+
+
+class _DiskWriter:
+    """把下载过程中读到的密文写入临时文件，完整读完后才登记到缓存"""
+
+    def __init__(self, cache: "ContentCache", key, meta: dict, iv: bytes):
+        self._cache = cache
+        self._key = key
+        self._meta = dict(meta, validated=time.monotonic())
+        self._iv = iv
+        self.path = os.path.join(cache.directory, uuid.uuid4().hex)
+        self._file = open(self.path, "wb")
+
+    def write(self, chunk: bytes):
+        self._file.write(chunk)
+
+    def commit(self):
+        self._file.close()
+        if not self._cache._store(self._cache._disk, self._key, CachedContent(path=self.path, iv=self._iv, **self._meta)):
+            _remove(self.path)
+
+    def abort(self):
+        self._file.close()
+        _remove(self.path)
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class ContentCache:
+    def __init__(self, memory_size: int = 0, memory_item_size: int = 1024 * 1024,
+                 disk_size: int = 0, disk_item_size: int = 256 * 1024 * 1024,
+                 directory: Optional[str] = None, revalidate: float = 5.0):
+        self.memory_size = memory_size
+        self.memory_item_size = min(memory_item_size, memory_size)
+        self.disk_size = disk_size
+        self.disk_item_size = min(disk_item_size, disk_size)
+        self.revalidate = revalidate
+        self._memory = OrderedDict()
+        self._disk = OrderedDict()
+        self._used = {id(self._memory): 0, id(self._disk): 0}
+        # 最近被失效的键及失效时间：失效之前开始读取的内容不再放入缓存
+        self._invalidated = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.directory = None
+        if disk_size > 0:
+            # 每个进程使用独立目录，启动时清空上次遗留的文件
+            self.directory = os.path.join(directory or tempfile.gettempdir(), f"sm4-content-cache-{os.getpid()}")
+            shutil.rmtree(self.directory, ignore_errors=True)
+            os.makedirs(self.directory)
+
+    @property
+    def enabled(self) -> bool:
+        return self.memory_size > 0 or self.disk_size > 0
+
+    def tier_for(self, size: int) -> Optional[str]:
+        """大小为 size 的对象应放入哪一级缓存，放不下时返回 None"""
+        if self.memory_size > 0 and size <= self.memory_item_size:
+            return "memory"
+        if self.disk_size > 0 and size <= self.disk_item_size:
+            return "disk"
+        return None
+
+    def get(self, bucket_name: str, object_name: str, etag: Optional[str] = None) -> Optional[CachedContent]:
+        """
+        不传 etag 时只返回最近 revalidate 秒内确认过的条目；
+        传入对象当前的 etag 时返回 etag 相同的条目并刷新确认时间
+        """
+        key = (bucket_name, object_name)
+        with self._lock:
+            for tier in (self._memory, self._disk):
+                entry = tier.get(key)
+                if entry is None:
+                    continue
+                if etag is None and time.monotonic() - entry.validated > self.revalidate:
+                    return None
+                if etag is not None:
+                    if entry.etag != etag:
+                        self._evict(tier, key)
+                        break
+                    entry.validated = time.monotonic()
+                tier.move_to_end(key)
+                self.hits += 1
+                return entry
+            if etag is not None:
+                self.misses += 1
+        return None
+
+    def open(self, entry: CachedContent, start: int, stop: int):
+        """打开磁盘层条目中明文 [start, stop) 对应的密文，文件已被淘汰时返回 None"""
+        try:
+            f = open(entry.path, "rb")
+        except OSError:
+            return None
+        f.seek(start)
+        return _FileRange(f, stop - start)
+
+    def collect(self, bucket_name: str, object_name: str, meta: dict, chunks):
+        """转发明文分块，完整读完后放入内存层"""
+        meta = dict(meta, validated=time.monotonic())
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+        self._store(self._memory, (bucket_name, object_name), CachedContent(data=b"".join(parts), **meta))
+
+    def put(self, bucket_name: str, object_name: str, meta: dict, data: bytes):
+        self._store(self._memory, (bucket_name, object_name), CachedContent(data=data, **meta))
+
+    def disk_writer(self, bucket_name: str, object_name: str, meta: dict, iv: bytes) -> _DiskWriter:
+        return _DiskWriter(self, (bucket_name, object_name), meta, iv)
+
+    def _store(self, tier: OrderedDict, key, entry: CachedContent) -> bool:
+        limit = self.memory_size if tier is self._memory else self.disk_size
+        with self._lock:
+            if self._invalidated.get(key, 0) >= entry.validated:
+                # 读取期间对象被改写或删除，读到的可能是旧内容
+                return False
+            for other in (self._memory, self._disk):
+                if key in other:
+                    self._evict(other, key)
+            tier[key] = entry
+            self._used[id(tier)] += entry.size
+            while self._used[id(tier)] > limit and tier:
+                self._evict(tier, next(iter(tier)))
+        return True
+
+    def _evict(self, tier: OrderedDict, key):
+        entry = tier.pop(key)
+        self._used[id(tier)] -= entry.size
+        if entry.path:
+            # 正在读取该文件的下载持有已打开的句柄，删除不影响它们
+            _remove(entry.path)
+
+    def invalidate(self, bucket_name: str, *object_names: str):
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for name in object_names:
+                key = (bucket_name, name)
+                for tier in (self._memory, self._disk):
+                    if key in tier:
+                        self._evict(tier, key)
+                self._invalidated[key] = now
+                self._invalidated.move_to_end(key)
+            while len(self._invalidated) > 10000:
+                self._invalidated.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "memory": {"items": len(self._memory), "bytes": self._used[id(self._memory)], "limit": self.memory_size},
+                "disk": {"items": len(self._disk), "bytes": self._used[id(self._disk)], "limit": self.disk_size},
+                "hits": self.hits,
+                "misses": self.misses,
+            }
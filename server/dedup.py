@@ -0,0 +1,196 @@
+"""
+内容寻址去重存储。
+
+开启去重后，上传的明文先边读边计算 SM3 并暂存到本地临时文件，
+加密后的数据以 SM3 摘要为键只在去重存储桶中保存一份（blobs/<sm3>），
+用户可见的 object_name 只是一个很小的引用对象，记录摘要和明文长度。
+同一内容再次上传时只需写入引用，不必重新加密和传输。
+
+引用计数用去重存储桶中的标记对象 refs/<sm3>/<bucket>/<object> 表示：
+每个引用对应一个标记，最后一个标记删除后才回收数据块。
+标记与引用一一对应，重复登记或重复释放都是幂等的。
+
+登记引用与回收数据块按摘要互斥，锁是去重存储桶中的 locks/<sm3> 对象，用条件写入（If-None-Match: *）创建，
+因此多个工作进程、多台服务器共用同一存储时同样有效；持有者崩溃留下的锁超过 lock_stale 秒后视为失效。
+"""
+import io
+import struct
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Optional
+
+from minio.error import S3Error
+
+import sm3_hasher
+from encryption import STREAM_CHUNK_SIZE
+from storage import LockTimeout, object_lock
+
+# 引用对象：魔数 + SM3 摘要 + 明文字节数
+REF_MAGIC = b"SM4REF\x00\x01"
+REF_FORMAT = struct.Struct(">8s32sQ")
+
+
+class DedupLockTimeout(LockTimeout):
+    """等待摘要锁超时"""
+
+
+class DedupStore:
+    def __init__(self, bucket_name: str = "sm4-blobs", spool_size: int = 16 * 1024 * 1024,
+                 lock_timeout: float = 30, lock_stale: float = 60, absent_ttl: float = 5):
+        self.bucket_name = bucket_name
+        # 明文超过 spool_size 时临时文件落盘，否则留在内存中
+        self.spool_size = spool_size
+        self.lock_timeout = lock_timeout
+        self.lock_stale = lock_stale
+        # 去重存储桶不存在的结果缓存的秒数（存在的结果一直缓存）
+        self.absent_ttl = absent_ttl
+        self._bucket_ready = False
+        self._absent_until = 0.0
+
+    @staticmethod
+    def blob_name(digest: str) -> str:
+        return f"blobs/{digest}"
+
+    @staticmethod
+    def _marker(digest: str, bucket_name: str, object_name: str) -> str:
+        return f"refs/{digest}/{bucket_name}/{object_name}"
+
+    @staticmethod
+    def _lock_name(digest: str) -> str:
+        return f"locks/{digest}"
+
+    @contextmanager
+    def _locked(self, client, digest: str):
+        """
+        持有摘要锁：登记引用与回收数据块互斥，避免刚登记的引用指向被回收的数据块。
+        锁被占用时退避重试，超过 lock_timeout 秒抛出 DedupLockTimeout
+        """
+        try:
+            with object_lock(client, self.bucket_name, self._lock_name(digest), self.lock_timeout, self.lock_stale):
+                yield
+        except LockTimeout:
+            raise DedupLockTimeout(f"Timed out waiting for the dedup lock of {digest}")
+
+    def _ensure_bucket(self, client):
+        if not self._bucket_ready:
+            if not client.bucket_exists(self.bucket_name):
+                client.make_bucket(self.bucket_name)
+            self._bucket_ready = True
+
+    def _blob_exists(self, client, digest: str) -> bool:
+        try:
+            client.stat_object(self.bucket_name, self.blob_name(digest))
+            return True
+        except S3Error as e:
+            if e.code == "NoSuchKey":
+                return False
+            raise
+
+    def in_use(self, client) -> bool:
+        """
+        是否启用过去重（去重存储桶存在）。不存在时任何对象都不可能是引用，调用方可以省去读取引用的请求；
+        其他进程刚开始使用去重时，最多 absent_ttl 秒后才能看到
+        """
+        if self._bucket_ready:
+            return True
+        now = time.monotonic()
+        if now < self._absent_until:
+            return False
+        if client.bucket_exists(self.bucket_name):
+            self._bucket_ready = True
+            return True
+        self._absent_until = now + self.absent_ttl
+        return False
+
+    @staticmethod
+    def encode_ref(digest: str, size: int) -> bytes:
+        return REF_FORMAT.pack(REF_MAGIC, bytes.fromhex(digest), size)
+
+    def read_ref(self, client, bucket_name: str, object_name: str, missing_ok: bool = True):
+        """
+        读取引用对象，返回 (摘要, 明文字节数)；不是引用时返回 None。
+        对象不存在时 missing_ok 为 True 返回 None，否则抛出 NoSuchKey，可顺带代替一次 stat
+        """
+        try:
+            response = client.get_object(bucket_name, object_name, offset=0, length=REF_FORMAT.size)
+        except S3Error as e:
+            if e.code == "NoSuchKey" and missing_ok:
+                return None
+            raise
+        try:
+            data = response.read()
+        finally:
+            response.close()
+            response.release_conn()
+        if len(data) != REF_FORMAT.size or not data.startswith(REF_MAGIC):
+            return None
+        _, digest, size = REF_FORMAT.unpack(data)
+        return digest.hex(), size
+
+    def find_refs(self, client, bucket_name: str, objects: dict, max_workers: int = 16) -> dict:
+        """
+        从 {对象名: 大小} 中找出去重引用，返回 {对象名: 摘要}。
+        大小未知（None）或等于引用对象大小的才需要读取；从未启用过去重时直接返回空
+        """
+        if not self.in_use(client):
+            return {}
+        names = [name for name, size in objects.items() if size is None or size == REF_FORMAT.size]
+        if not names:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(names))) as pool:
+            refs = pool.map(lambda name: self.read_ref(client, bucket_name, name), names)
+            return {name: ref[0] for name, ref in zip(names, refs) if ref is not None}
+
+    def put(self, client, bucket_name: str, object_name: str, source, upload, content_type: Optional[str] = None) -> dict:
+        """
+        去重上传 source。upload(bucket, name, stream, size, content_type, digest) 负责把明文加密写入
+        MinIO，只在数据块尚不存在时调用，digest 为已算出的明文 SM3。
+        返回摘要、明文字节数、引用对象的 ETag 以及是否命中已有数据块。
+        """
+        self._ensure_bucket(client)
+        previous = self.read_ref(client, bucket_name, object_name)
+
+        hasher = sm3_hasher.new()
+        size = 0
+        with tempfile.SpooledTemporaryFile(max_size=self.spool_size) as spool:
+            while True:
+                chunk = source.read(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                spool.write(chunk)
+                size += len(chunk)
+            digest = hasher.hexdigest()
+
+            # 先登记引用再检查数据块，与 release 的回收互斥
+            with self._locked(client, digest):
+                client.put_object(self.bucket_name, self._marker(digest, bucket_name, object_name), io.BytesIO(b""), 0)
+                deduplicated = self._blob_exists(client, digest)
+            if not deduplicated:
+                spool.seek(0)
+                upload(self.bucket_name, self.blob_name(digest), spool, size, content_type, digest)
+
+        ref = self.encode_ref(digest, size)
+        result = client.put_object(
+            bucket_name, object_name, io.BytesIO(ref), len(ref),
+            content_type=content_type or "application/octet-stream"
+        )
+        if previous is not None and previous[0] != digest:
+            self.release(client, bucket_name, object_name, previous[0])
+        return {"sm3": digest, "size": size, "etag": result.etag, "deduplicated": deduplicated}
+
+    def release(self, client, bucket_name: str, object_name: str, digest: str):
+        """删除一个引用，没有其他引用时回收数据块"""
+        with self._locked(client, digest):
+            client.remove_object(self.bucket_name, self._marker(digest, bucket_name, object_name))
+            remaining = client.list_objects(self.bucket_name, prefix=f"refs/{digest}/", recursive=True)
+            if next(iter(remaining), None) is None:
+                client.remove_object(self.bucket_name, self.blob_name(digest))
+
+    def rename(self, client, bucket_name: str, source_name: str, target_name: str, digest: str):
+        """引用对象改名后同步引用标记"""
+        client.put_object(self.bucket_name, self._marker(digest, bucket_name, target_name), io.BytesIO(b""), 0)
+        client.remove_object(self.bucket_name, self._marker(digest, bucket_name, source_name))
+
@@ -0,0 +1,173 @@
+"""
+加密服务：SM4 加解密、SM3 哈希以及上传时使用的流式加密格式。
+
+密钥按 ID 管理（KeyRing）：新写入的对象总是用当前密钥加密，并把密钥 ID 记录在对象的用户元数据中，
+读取时按元数据选择密钥；没有记录密钥 ID 的对象（引入密钥轮换之前写入的）使用 LEGACY_KEY_ID 对应的密钥。
+"""
+import os
+import struct
+from typing import Optional
+
+import sm3_hasher
+from metrics import phase
+from sm4_engines import CipherContextPool, select_engine
+
+# 流式加密参数：按固定大小的分块边读边加密，避免整个文件驻留内存
+STREAM_CHUNK_SIZE = 64 * 1024
+# 对象头：魔数 + 分块大小 + CTR 初始计数器(IV)
+STREAM_MAGIC = b"SM4CTR\x00\x01"
+STREAM_HEADER = struct.Struct(">8sI16s")
+
+# 对象用户元数据中记录的加密密钥 ID
+KEY_ID_METADATA = "x-amz-meta-key-id"
+# 没有记录密钥 ID 的对象所用的密钥 ID，及未配置该 ID 时使用的内置密钥
+LEGACY_KEY_ID = "default"
+LEGACY_KEY = b"0123456789abcdef"
+
+
+class EncryptionService:
+    def __init__(self, key: bytes, engine: Optional[str] = None, key_id: Optional[str] = None):
+        self.key = key
+        self.key_id = key_id
+        # 启动时选择可用的最快 SM4 实现并扩展好轮密钥，各线程从中派生独立上下文
+        self.contexts = CipherContextPool(select_engine(key, engine))
+
+    @property
+    def engine_name(self) -> str:
+        """当前使用的 SM4 引擎名"""
+        return self.contexts.engine.name
+
+    def encrypt(self, plaintext: bytes) -> bytes:
+        """SM4 加密（ECB + PKCS7 填充）"""
+        pad = 16 - len(plaintext) % 16
+        return self.contexts.get().encrypt_blocks(plaintext + bytes([pad]) * pad)
+
+    def decrypt(self, ciphertext: bytes) -> bytes:
+        """SM4 解密（ECB + PKCS7 填充）"""
+        data = self.contexts.get().decrypt_blocks(ciphertext)
+        return data[:-data[-1]] if data else data
+
+    def crypt_ctr(self, data: bytes, iv: bytes, offset: int = 0) -> bytes:
+        """SM4-CTR 加解密（对称操作），offset 为该段数据在明文中的字节偏移"""
+        return self.contexts.get().ctr(data, iv, offset)
+
+    def ctr_stream(self, iv: bytes, offset: int = 0):
+        """创建顺序 CTR 流，适合边读边加解密（只能在当前线程内使用）"""
+        return self.contexts.get().ctr_stream(iv, offset)
+
+    @staticmethod
+    def hash_data(data: bytes) -> str:
+        """SM3 哈希"""
+        return sm3_hasher.sm3_hexdigest(data)
+
+    @staticmethod
+    def sm3():
+        """创建增量 SM3 哈希对象，适合在上传/下载流中边读边计算"""
+        return sm3_hasher.new()
+
+
+class UnknownKeyError(KeyError):
+    """对象记录的密钥 ID 不在密钥环中（密钥已被移除或配置缺失）"""
+
+
+def parse_keys(spec: str) -> dict:
+    """
+    解析密钥配置：逗号或换行分隔的 "密钥ID:十六进制密钥"（SM4 密钥 16 字节，即 32 个十六进制字符），
+    空行和 # 开头的行被忽略
+    """
+    keys = {}
+    for item in spec.replace(",", "\n").splitlines():
+        item = item.strip()
+        if not item or item.startswith("#"):
+            continue
+        key_id, sep, value = item.partition(":")
+        key_id = key_id.strip()
+        try:
+            key = bytes.fromhex(value.strip())
+        except ValueError:
+            key = b""
+        if not sep or not key_id or len(key) != 16:
+            raise ValueError(f"Invalid key entry {key_id or item!r}: expected <id>:<32 hex digits>")
+        if key_id in keys:
+            raise ValueError(f"Duplicate key id {key_id!r}")
+        keys[key_id] = key
+    return keys
+
+
+class KeyRing:
+    """
+    按 ID 保存所有可用密钥的加密服务：active 加密新数据，get(key_id) 解密已有对象。
+    轮换时把新密钥加入配置并设为当前密钥，旧密钥保留到所有对象都重新加密完为止
+    """
+
+    def __init__(self, keys: dict, active_id: Optional[str] = None, engine: Optional[str] = None):
+        keys = dict(keys)
+        # 未指定当前密钥时使用配置中的最后一个，追加新密钥即完成轮换
+        active_id = active_id or (list(keys)[-1] if keys else LEGACY_KEY_ID)
+        # 旧对象没有记录密钥 ID，未显式配置时用内置密钥解密
+        keys.setdefault(LEGACY_KEY_ID, LEGACY_KEY)
+        if active_id not in keys:
+            raise ValueError(f"Active key id {active_id!r} is not configured")
+        self.active_id = active_id
+        self._services = {
+            key_id: EncryptionService(key, engine, key_id=key_id) for key_id, key in keys.items()
+        }
+
+    @classmethod
+    def from_config(cls, spec: str = "", active_id: Optional[str] = None, engine: Optional[str] = None) -> "KeyRing":
+        return cls(parse_keys(spec), active_id, engine)
+
+    @property
+    def active(self) -> EncryptionService:
+        """加密新数据使用的当前密钥"""
+        return self._services[self.active_id]
+
+    @property
+    def ids(self) -> list:
+        return list(self._services)
+
+    def get(self, key_id: Optional[str]) -> EncryptionService:
+        """按对象记录的密钥 ID 取加密服务，None 表示没有记录（旧对象）"""
+        try:
+            return self._services[key_id or LEGACY_KEY_ID]
+        except KeyError:
+            raise UnknownKeyError(f"Unknown encryption key id: {key_id}") from None
+
+
+class EncryptedUploadStream:
+    """
+    把上传文件流包装成边读边加密的只读流，供 put_object(length=-1) 按分片读取。
+    内存占用只与分块/分片大小有关，与文件大小无关。
+    读取过程中同时累计明文长度和明文 SM3（读完后取 sm3.hexdigest()）；
+    摘要事先已知时传 hashing=False 省去计算，sm3 为 None。
+    """
+
+    def __init__(self, source, service: EncryptionService, chunk_size: int = STREAM_CHUNK_SIZE, hashing: bool = True):
+        self.source = source
+        self.service = service
+        self.chunk_size = chunk_size
+        self.iv = os.urandom(16)
+        self.plaintext_size = 0
+        self.sm3 = service.sm3() if hashing else None
+        self._cipher = service.ctr_stream(self.iv)
+        self._buffer = bytearray(STREAM_HEADER.pack(STREAM_MAGIC, chunk_size, self.iv))
+        self._eof = False
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            with phase("read"):
+                chunk = self.source.read(self.chunk_size)
+            if not chunk:
+                self._eof = True
+                break
+            with phase("encrypt"):
+                self._buffer += self._cipher.update(chunk)
+            if self.sm3 is not None:
+                with phase("hash"):
+                    self.sm3.update(chunk)
+            self.plaintext_size += len(chunk)
+        if size < 0 or size > len(self._buffer):
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
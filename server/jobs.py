@@ -0,0 +1,364 @@
+"""
+后台任务队列：耗时的批量操作（移动文件夹、补算摘要、重新加密等）提交后立即返回任务 ID，
+由工作线程在后台执行，客户端通过 /jobs/<id> 查询进度，不再受 HTTP 请求超时限制，也不占用服务线程。
+
+任务记录保存在 SQLite 中：服务重启后未完成的任务继续执行；多个进程共用同一个数据库时，
+任意进程都可以领取、查询、取消任务，同一时间每个进程最多执行 workers 个任务。
+
+    状态      queued → running → completed / failed / cancelled
+    重试      失败的任务在 max_attempts 次以内按指数退避自动重试；失败或已取消的任务也可以手动重试
+    取消      排队中的任务直接取消；运行中的任务设置取消标记，处理函数在下一次报告进度时退出
+    心跳      运行中的任务定期写心跳，心跳超时（所在进程已退出）的任务会被重新领取
+
+处理函数 handler(job, params) 在工作线程中执行，通过 job.progress(...) 报告进度，
+返回值（可 JSON 序列化）记为任务结果。同一任务可能被执行多次（自动重试、手动重试、进程退出后重新领取），
+处理函数应当是幂等的；再次执行时 job.values 是上一次执行保存的进度，可据此从检查点继续。
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    params TEXT NOT NULL,
+    state TEXT NOT NULL,
+    progress TEXT NOT NULL DEFAULT '{}',
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    not_before REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    heartbeat REAL,
+    worker TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (state, not_before, created);
+"""
+
+ACTIVE_STATES = ("queued", "running")
+FINISHED_STATES = ("completed", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    """任务已被取消，处理函数应停止执行"""
+
+
+class JobStateError(ValueError):
+    """任务当前状态不允许该操作（如重试仍在运行的任务）"""
+
+
+def _timestamp(value: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(value, timezone.utc).isoformat() if value else None
+
+
+def _to_dict(row: sqlite3.Row) -> dict:
+    end = row["finished"] or (time.time() if row["state"] == "running" else None)
+    return {
+        "job_id": row["id"],
+        "type": row["type"],
+        "state": row["state"],
+        "params": json.loads(row["params"]),
+        "progress": json.loads(row["progress"]),
+        "result": json.loads(row["result"]) if row["result"] else None,
+        "error": row["error"],
+        "attempts": row["attempts"],
+        "max_attempts": row["max_attempts"],
+        "cancel_requested": bool(row["cancel_requested"]),
+        "created": _timestamp(row["created"]),
+        "started": _timestamp(row["started"]),
+        "finished": _timestamp(row["finished"]),
+        "elapsed": round(end - row["started"], 3) if row["started"] and end else None,
+    }
+
+
+class Job:
+    """传给处理函数的任务句柄：报告进度、检查是否已被取消"""
+
+    # 进度最多每隔这么多秒写一次数据库（同时检查取消标记）
+    SAVE_INTERVAL = 0.5
+
+    def __init__(self, queue: "JobQueue", job_id: str, job_type: str, attempt: int, progress: Optional[dict] = None):
+        self.queue = queue
+        self.id = job_id
+        self.type = job_type
+        self.attempt = attempt
+        self._progress = dict(progress or {})
+        self._saved = 0.0
+
+    def progress(self, force: bool = False, **values):
+        """更新进度（与已有进度合并）；任务已被取消时抛出 JobCancelled"""
+        self._progress.update(values)
+        now = time.monotonic()
+        if force or now - self._saved >= self.SAVE_INTERVAL:
+            self._saved = now
+            if self.queue._save_progress(self.id, self._progress):
+                raise JobCancelled(self.id)
+
+    def check_cancelled(self):
+        """在长时间的步骤之间调用，任务已被取消时抛出 JobCancelled"""
+        self.progress()
+
+    @property
+    def values(self) -> dict:
+        return dict(self._progress)
+
+
+class JobQueue:
+    def __init__(self, path: str, workers: int = 2, max_attempts: int = 3, retry_delay: float = 5.0,
+                 poll_interval: float = 1.0, stale_after: float = 120.0):
+        self.path = path
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._handlers = {}
+        self._running = set()
+        self._wakeup = threading.Event()
+        self._started = False
+        self._db = None
+        self._lock = threading.Lock()
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """首次使用时才打开任务库（必要时创建所在目录），导入模块本身不产生任何文件"""
+        if self._db is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._db = conn
+        return self._db
+
+    def register(self, job_type: str, handler: Callable):
+        self._handlers[job_type] = handler
+        return handler
+
+    @property
+    def types(self) -> list:
+        return sorted(self._handlers)
+
+    # ---- 提交与查询 ----
+
+    def submit(self, job_type: str, params: dict, max_attempts: Optional[int] = None, unique: bool = False) -> dict:
+        """
+        提交任务并立即返回任务信息；unique 时若已有相同类型、相同参数的任务在排队或运行，直接返回该任务
+        """
+        if job_type not in self._handlers:
+            raise ValueError(f"Unknown job type: {job_type}")
+        encoded = json.dumps(params, sort_keys=True, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = None
+                if unique:
+                    row = self._conn.execute(
+                        "SELECT * FROM jobs WHERE type = ? AND params = ? AND state IN ('queued', 'running') "
+                        "ORDER BY created LIMIT 1", (job_type, encoded)
+                    ).fetchone()
+                if row is None:
+                    job_id = uuid.uuid4().hex
+                    self._conn.execute(
+                        "INSERT INTO jobs (id, type, params, state, max_attempts, created, not_before) "
+                        "VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                        (job_id, job_type, encoded, max_attempts or self.max_attempts, now, now)
+                    )
+                    row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        self._wakeup.set()
+        return _to_dict(row)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _to_dict(row) if row else None
+
+    def list(self, state: Optional[str] = None, job_type: Optional[str] = None, limit: int = 50) -> list:
+        """按创建时间倒序列出任务"""
+        sql, params = "SELECT * FROM jobs WHERE 1 = 1", []
+        if state:
+            sql += " AND state = ?"
+            params.append(state)
+        if job_type:
+            sql += " AND type = ?"
+            params.append(job_type)
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY created DESC LIMIT ?", params + [limit]).fetchall()
+        return [_to_dict(row) for row in rows]
+
+    def cancel(self, job_id: str) -> Optional[dict]:
+        """取消任务：排队中的直接取消，运行中的设置取消标记；已结束的任务不变"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = 'cancelled', finished = ? WHERE id = ? AND state = 'queued'", (now, job_id)
+            )
+            self._conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND state = 'running'", (job_id,))
+        return self.get(job_id)
+
+    def retry(self, job_id: str, params: Optional[dict] = None) -> Optional[dict]:
+        """
+        重新执行失败或已取消的任务（重新计算重试次数），保留已有进度供处理函数从检查点继续；
+        params 中的参数覆盖原有参数（如调整限速）
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT state, params FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            merged = dict(json.loads(row["params"]), **(params or {}))
+            updated = self._conn.execute(
+                "UPDATE jobs SET state = 'queued', attempts = 0, cancel_requested = 0, not_before = ?, "
+                "error = NULL, result = NULL, started = NULL, finished = NULL, params = ? "
+                "WHERE id = ? AND state IN ('failed', 'cancelled')",
+                (time.time(), json.dumps(merged, ensure_ascii=False), job_id)
+            ).rowcount
+        if not updated:
+            raise JobStateError(f"Job {job_id} is {row['state']}, only failed or cancelled jobs can be retried")
+        self._wakeup.set()
+        return self.get(job_id)
+
+    # ---- 执行 ----
+
+    def start(self):
+        """启动工作线程和心跳线程（重复调用无效）"""
+        if self._started:
+            return
+        self._started = True
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True).start()
+        threading.Thread(target=self._beat, name="job-heartbeat", daemon=True).start()
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        """领取一个到期的排队任务；顺带把心跳超时的运行中任务放回队列"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                stale = now - self.stale_after
+                self._conn.execute(
+                    "UPDATE jobs SET state = 'failed', finished = ?, worker = NULL, error = 'Worker lost' "
+                    "WHERE state = 'running' AND heartbeat < ? AND attempts >= max_attempts", (now, stale)
+                )
+                self._conn.execute(
+                    "UPDATE jobs SET state = 'queued', worker = NULL "
+                    "WHERE state = 'running' AND heartbeat < ? AND attempts < max_attempts", (stale,)
+                )
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE state = 'queued' AND not_before <= ? ORDER BY created LIMIT 1", (now,)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET state = 'running', attempts = attempts + 1, started = ?, heartbeat = ?, "
+                        "worker = ?, finished = NULL WHERE id = ?", (now, now, self.worker_id, row["id"])
+                    )
+                    row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return row
+
+    def _work(self):
+        while True:
+            try:
+                row = self._claim()
+            except sqlite3.Error:
+                logger.exception("Failed to claim a job")
+                row = None
+            if row is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._run(row)
+
+    def _run(self, row: sqlite3.Row):
+        job = Job(self, row["id"], row["type"], row["attempts"], json.loads(row["progress"]))
+        handler = self._handlers.get(row["type"])
+        self._running.add(job.id)
+        try:
+            if handler is None:
+                raise ValueError(f"Unknown job type: {row['type']}")
+            result = handler(job, json.loads(row["params"]))
+        except JobCancelled:
+            self._finish(job, "cancelled")
+        except Exception as e:
+            logger.warning("Job %s (%s) attempt %d failed: %s", job.id, job.type, job.attempt, e)
+            if self._cancel_requested(job.id):
+                self._finish(job, "cancelled", error=str(e))
+            elif job.attempt < row["max_attempts"]:
+                delay = self.retry_delay * 2 ** (job.attempt - 1)
+                self._finish(job, "queued", error=str(e), not_before=time.time() + delay)
+            else:
+                self._finish(job, "failed", error=str(e))
+        else:
+            self._finish(job, "completed", result=result)
+        finally:
+            self._running.discard(job.id)
+
+    def _finish(self, job: Job, state: str, result=None, error: Optional[str] = None, not_before: Optional[float] = None):
+        """记录任务结束；任务已被其他工作线程重新领取时不覆盖"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, progress = ?, result = ?, error = ?, "
+                "finished = ?, not_before = COALESCE(?, not_before), worker = NULL "
+                "WHERE id = ? AND state = 'running' AND worker = ?",
+                (state, json.dumps(job.values, ensure_ascii=False),
+                 json.dumps(result, ensure_ascii=False) if result is not None else None, error,
+                 None if state == "queued" else now, not_before, job.id, self.worker_id)
+            )
+        if state == "queued":
+            self._wakeup.set()
+
+    def _save_progress(self, job_id: str, progress: dict) -> bool:
+        """保存进度并刷新心跳，返回任务是否已被请求取消"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET progress = ?, heartbeat = ? WHERE id = ? AND worker = ?",
+                (json.dumps(progress, ensure_ascii=False), time.time(), job_id, self.worker_id)
+            )
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def _cancel_requested(self, job_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def _beat(self):
+        """为本进程正在执行的任务定期刷新心跳，长时间不报告进度的步骤不会被误判为进程已退出"""
+        while True:
+            time.sleep(max(1.0, self.stale_after / 4))
+            running = list(self._running)
+            if not running:
+                continue
+            try:
+                with self._lock:
+                    self._conn.executemany(
+                        "UPDATE jobs SET heartbeat = ? WHERE id = ? AND worker = ?",
+                        [(time.time(), job_id, self.worker_id) for job_id in running]
+                    )
+            except sqlite3.Error:
+                logger.exception("Failed to refresh job heartbeats")
@@ -0,0 +1,123 @@
+"""
+目录列表。
+
+直接使用 S3 的 delimiter 列表：MinIO 在服务端把子目录聚合成公共前缀（CommonPrefixes），
+每个直接子目录只返回一条记录，列表耗时只取决于直接子项的数量，
+而不是该前缀下对象的总数。需要文件夹的总大小和文件数时，再按需并发统计各子目录。
+
+分页列表（page_directory）从上一页的最后一项之后按名称顺序逐项读取，凑够一页即停止，
+不必为了取一页而列出整个目录。
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+
+def prefix_upper(prefix: str) -> str:
+    """以 prefix 开头的所有字符串都小于该上界，用于按名称范围查询某个前缀下的对象"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class DirectoryEntry:
+    """目录中的一项：文件或直接子目录"""
+
+    __slots__ = ("name", "type", "size", "last_modified", "count")
+
+    def __init__(self, name: str, type: str, size: int = 0, last_modified=None, count=None):
+        self.name = name
+        self.type = type
+        self.size = size
+        self.last_modified = last_modified
+        # 子目录下的文件总数，只在统计文件夹信息时填充
+        self.count = count
+
+    @property
+    def is_folder(self) -> bool:
+        return self.type == "folder"
+
+    def to_dict(self) -> dict:
+        data = {
+            "name": self.name,
+            "size": self.size,
+            "last_modified": self.last_modified.isoformat() if self.last_modified else None,
+            "type": self.type,
+        }
+        if self.count is not None:
+            data["count"] = self.count
+        return data
+
+
+def folder_summary(client, bucket_name: str, folder: str):
+    """递归统计文件夹下的文件数、总大小和最近修改时间（文件夹占位对象不计入）"""
+    count = 0
+    size = 0
+    latest = None
+    for obj in client.list_objects(bucket_name, prefix=folder, recursive=True):
+        if obj.is_dir:
+            continue
+        count += 1
+        size += obj.size or 0
+        if obj.last_modified and (latest is None or obj.last_modified > latest):
+            latest = obj.last_modified
+    return count, size, latest
+
+
+def list_directory(client, bucket_name: str, prefix: str, aggregate: bool = False, max_workers: int = 8) -> list:
+    """
+    列出 prefix 下的直接子项，文件夹在前、按名称排序。
+    aggregate 为 True 时并发统计每个子文件夹的文件数和总大小。
+    """
+    entries = []
+    for obj in client.list_objects(bucket_name, prefix=prefix, recursive=False):
+        if obj.is_dir:
+            # 公共前缀即直接子目录；与 prefix 相同的是当前目录自身的占位对象
+            if obj.object_name != prefix:
+                entries.append(DirectoryEntry(obj.object_name, "folder"))
+        else:
+            entries.append(DirectoryEntry(obj.object_name, "file", obj.size, obj.last_modified))
+
+    folders = [entry for entry in entries if entry.is_folder]
+    if aggregate and folders:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(folders))) as pool:
+            summaries = pool.map(lambda entry: folder_summary(client, bucket_name, entry.name), folders)
+            for entry, (count, size, latest) in zip(folders, summaries):
+                entry.count, entry.size, entry.last_modified = count, size, latest
+
+    entries.sort(key=lambda entry: (not entry.is_folder, entry.name))
+    return entries
+
+
+def iter_directory(client, bucket_name: str, prefix: str, kind: str, after: Optional[str] = None):
+    """按名称顺序逐项列出 prefix 下名称大于 after 的直接子文件夹（kind 为 folder）或文件，不统计文件夹信息"""
+    for obj in client.list_objects(bucket_name, prefix=prefix, recursive=False, start_after=after):
+        # 从文件夹名之后开始列举时，该文件夹下的对象会再次聚合成同一个公共前缀
+        if after is not None and obj.object_name <= after:
+            continue
+        if obj.is_dir:
+            if kind == "folder" and obj.object_name != prefix:
+                yield DirectoryEntry(obj.object_name, "folder")
+        elif kind == "file":
+            yield DirectoryEntry(obj.object_name, "file", obj.size, obj.last_modified)
+
+
+def page_directory(iterate: Callable, limit: int, after: Optional[str] = None, kinds=("folder", "file"),
+                   match: Optional[Callable] = None) -> tuple:
+    """
+    取出目录中排在 after 之后的一页（文件夹在前、各自按名称排序），最多 limit 项，返回 (条目列表, 是否还有下一页)。
+    iterate(kind, after) 按名称顺序返回名称大于 after 的文件夹或文件（after 为 None 时从头开始），
+    只读到第 limit + 1 个符合 match 的条目为止
+    """
+    phases = []
+    if after is None or after.endswith("/"):
+        if "folder" in kinds:
+            phases.append(("folder", after))
+        after = None
+    if "file" in kinds:
+        phases.append(("file", after))
+    page = []
+    for kind, start in phases:
+        for entry in iterate(kind, start):
+            if match is None or match(entry):
+                page.append(entry)
+                if len(page) > limit:
+                    return page[:limit], True
+    return page, False
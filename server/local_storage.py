@@ -0,0 +1,564 @@
+"""
+本地文件系统存储后端：实现与 MinIO 客户端相同的接口（见 storage.StorageBackend），
+单机 / 边缘部署或离线测试时不需要 MinIO。
+
+    <root>/index.db              对象索引（SQLite）：名称、大小、ETag、Content-Type、用户元数据、数据文件
+    <root>/data/<bucket>/xx/     对象数据文件，文件名随机
+    <root>/uploads/<upload_id>/  进行中的分片上传
+
+数据文件写入完成后不再修改：改写对象是写新文件、替换索引、再删除旧文件。因此
+    读取时用 mmap 映射数据文件，按块返回内存视图，数据直接从页缓存交给解密，省去一次 read 复制；
+    读取中的对象被覆盖或删除时，已映射的旧文件仍然可以读完；
+    复制对象直接硬链接数据文件，只改元数据的原地复制（上传后写入摘要）只更新索引；
+    合并分片用 os.sendfile 在内核中拷贝，不经过用户态。
+
+对象名按 S3 语义处理（a 与 a/b 可以同时存在，以 / 结尾的是文件夹占位对象），不映射为目录结构。
+多个进程可以共用同一个根目录（SQLite WAL 模式）。
+"""
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Optional
+
+from minio.datatypes import Object, Part
+from minio.deleteobjects import DeleteError
+from minio.error import S3Error
+from minio.helpers import ObjectWriteResult
+from urllib3 import HTTPHeaderDict
+
+from listing import prefix_upper
+from storage import StorageBackend, metadata_headers
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    name TEXT PRIMARY KEY,
+    created TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS objects (
+    bucket TEXT NOT NULL,
+    name TEXT NOT NULL,
+    file TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    etag TEXT NOT NULL,
+    content_type TEXT NOT NULL,
+    metadata TEXT NOT NULL,
+    last_modified TEXT NOT NULL,
+    PRIMARY KEY (bucket, name)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS uploads (
+    id TEXT PRIMARY KEY,
+    bucket TEXT NOT NULL,
+    name TEXT NOT NULL,
+    headers TEXT NOT NULL,
+    created TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS parts (
+    upload_id TEXT NOT NULL,
+    part_number INTEGER NOT NULL,
+    etag TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (upload_id, part_number)
+) WITHOUT ROWID;
+"""
+
+_COPY_CHUNK = 1024 * 1024
+_LIST_PAGE = 1000
+
+
+def _error(code: str, bucket_name: Optional[str] = None, object_name: Optional[str] = None) -> S3Error:
+    return S3Error(
+        code=code, message=code, resource=None, request_id=None, host_id=None, response=None,
+        bucket_name=bucket_name, object_name=object_name
+    )
+
+
+def _user_metadata(metadata: Optional[dict]) -> dict:
+    """用户元数据统一成 x-amz-meta-* 小写键，Content-Type 单独保存"""
+    result = {}
+    for key, value in (metadata or {}).items():
+        key = key.lower()
+        if key == "content-type":
+            continue
+        result[key if key.startswith("x-amz-meta-") else "x-amz-meta-" + key] = str(value)
+    return result
+
+
+def _header_metadata(headers: Optional[dict]) -> dict:
+    return _user_metadata({key: value for key, value in (headers or {}).items() if key.lower().startswith("x-amz-meta-")})
+
+
+def _header(headers: Optional[dict], name: str) -> Optional[str]:
+    for key, value in (headers or {}).items():
+        if key.lower() == name.lower():
+            return value
+    return None
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _append_file(target, path: str):
+    """把 path 的内容追加到已打开的 target，优先用 sendfile 在内核中拷贝"""
+    with open(path, "rb") as source:
+        size = os.fstat(source.fileno()).st_size
+        if hasattr(os, "sendfile"):
+            target.flush()
+            offset = 0
+            try:
+                while offset < size:
+                    sent = os.sendfile(target.fileno(), source.fileno(), offset, size - offset)
+                    if sent == 0:
+                        break
+                    offset += sent
+                # sendfile 不移动 target 的文件对象位置，这里同步一下
+                target.seek(0, os.SEEK_END)
+                if offset == size:
+                    return
+            except OSError:
+                pass
+            source.seek(offset)
+        shutil.copyfileobj(source, target, _COPY_CHUNK)
+
+
+class _MappedResponse:
+    """
+    get_object 的返回值，接口与 urllib3 的 HTTPResponse 一致（read / stream / close / release_conn）。
+    read() 返回 bytes；stream() 直接返回映射内存的视图，不复制数据，使用方应在取下一块前用完当前块
+    """
+
+    def __init__(self, path: str, offset: int, length: int, headers: dict):
+        self.headers = HTTPHeaderDict(headers)
+        self._map = None
+        self._view = memoryview(b"")
+        self._position = 0
+        if length:
+            with open(path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(self._map, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+                # 顺序读取，提示内核加大预读
+                self._map.madvise(mmap.MADV_SEQUENTIAL)
+            self._view = memoryview(self._map)[offset:offset + length]
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        end = len(self._view) if amt is None or amt < 0 else min(len(self._view), self._position + amt)
+        data = bytes(self._view[self._position:end])
+        self._position = end
+        return data
+
+    def stream(self, amt: int = 64 * 1024):
+        while self._position < len(self._view):
+            chunk = self._view[self._position:self._position + amt]
+            self._position += len(chunk)
+            yield chunk
+
+    def close(self):
+        self._view.release()
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # 调用方仍持有 stream() 返回的视图，映射在视图释放后由垃圾回收关闭
+                pass
+            self._map = None
+
+    def release_conn(self):
+        pass
+
+
+class LocalStorage(StorageBackend):
+    """对象保存在本地目录中的存储后端，接口与 Minio 客户端相同"""
+
+    def __init__(self, root: str, fsync: bool = True):
+        self.root = os.path.abspath(root)
+        self.fsync = fsync
+        os.makedirs(os.path.join(self.root, "data"), exist_ok=True)
+        os.makedirs(os.path.join(self.root, "uploads"), exist_ok=True)
+        self._conn = sqlite3.connect(
+            os.path.join(self.root, "index.db"), timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+    def __repr__(self):
+        return f"LocalStorage({self.root!r})"
+
+    # ---- 内部工具 ----
+
+    def _query(self, sql: str, params=()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _check_bucket(self, bucket_name: str):
+        if not self._query("SELECT 1 FROM buckets WHERE name = ?", (bucket_name,)):
+            raise _error("NoSuchBucket", bucket_name)
+
+    def _row(self, bucket_name: str, object_name: str) -> sqlite3.Row:
+        rows = self._query("SELECT * FROM objects WHERE bucket = ? AND name = ?", (bucket_name, object_name))
+        if not rows:
+            self._check_bucket(bucket_name)
+            raise _error("NoSuchKey", bucket_name, object_name)
+        return rows[0]
+
+    def _path(self, bucket_name: str, file: str) -> str:
+        return os.path.join(self.root, "data", bucket_name, file[:2], file)
+
+    def _new_file(self, bucket_name: str) -> tuple:
+        file = uuid.uuid4().hex
+        path = self._path(bucket_name, file)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return file, path
+
+    def _finish_file(self, f):
+        if self.fsync:
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _write_file(self, bucket_name: str, chunks) -> tuple:
+        """写入新的数据文件，返回 (文件名, 大小, MD5)；写入过程中使用 .part 后缀，中途失败的文件易于识别清理"""
+        file, path = self._new_file(bucket_name)
+        md5 = hashlib.md5()
+        size = 0
+        try:
+            with open(path + ".part", "wb") as f:
+                for chunk in chunks:
+                    md5.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+                self._finish_file(f)
+            os.replace(path + ".part", path)
+        except BaseException:
+            _remove(path + ".part")
+            raise
+        return file, size, md5.hexdigest()
+
+    def _commit(self, bucket_name: str, object_name: str, file: str, size: int, etag: str,
+                content_type: Optional[str], metadata: dict, if_none_match: bool = False,
+                if_match: Optional[str] = None) -> ObjectWriteResult:
+        """
+        登记新写入的数据文件并删除被替换的旧文件；if_none_match 时对象已存在则失败，
+        if_match 时对象不存在或 ETag 不同则失败（都在同一事务中原子判断）
+        """
+        last_modified = _now()
+        row = (bucket_name, object_name, file, size, etag, content_type or "application/octet-stream",
+               json.dumps(metadata), last_modified.isoformat())
+        old = None
+        try:
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    if not self._conn.execute("SELECT 1 FROM buckets WHERE name = ?", (bucket_name,)).fetchone():
+                        raise _error("NoSuchBucket", bucket_name)
+                    previous = self._conn.execute(
+                        "SELECT file, etag FROM objects WHERE bucket = ? AND name = ?", (bucket_name, object_name)
+                    ).fetchone()
+                    if previous is not None and if_none_match:
+                        raise _error("PreconditionFailed", bucket_name, object_name)
+                    if if_match is not None and (previous is None or previous["etag"] != if_match.strip('"')):
+                        raise _error("PreconditionFailed", bucket_name, object_name)
+                    self._conn.execute("INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?, ?, ?)", row)
+                    self._conn.execute("COMMIT")
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    raise
+            old = previous["file"] if previous is not None else None
+        except BaseException:
+            _remove(self._path(bucket_name, file))
+            raise
+        if old is not None and old != file:
+            _remove(self._path(bucket_name, old))
+        return ObjectWriteResult(bucket_name, object_name, None, etag, HTTPHeaderDict(), last_modified=last_modified)
+
+    def _replace_metadata(self, row: sqlite3.Row, content_type: str, metadata: dict) -> ObjectWriteResult:
+        """原地复制只改元数据，数据文件不变；对象在此期间被改写时失败，避免把元数据记到新内容上"""
+        last_modified = _now()
+        with self._lock:
+            updated = self._conn.execute(
+                "UPDATE objects SET content_type = ?, metadata = ?, last_modified = ? "
+                "WHERE bucket = ? AND name = ? AND file = ?",
+                (content_type, json.dumps(metadata), last_modified.isoformat(), row["bucket"], row["name"], row["file"])
+            ).rowcount
+        if not updated:
+            raise _error("PreconditionFailed", row["bucket"], row["name"])
+        return ObjectWriteResult(
+            row["bucket"], row["name"], None, row["etag"], HTTPHeaderDict(), last_modified=last_modified
+        )
+
+    def _object(self, row: sqlite3.Row, with_metadata: bool = False) -> Object:
+        return Object(
+            row["bucket"], row["name"],
+            last_modified=datetime.fromisoformat(row["last_modified"]),
+            etag=row["etag"],
+            size=row["size"],
+            content_type=row["content_type"],
+            metadata=HTTPHeaderDict(json.loads(row["metadata"])) if with_metadata else None,
+        )
+
+    # ---- 存储桶 ----
+
+    def bucket_exists(self, bucket_name: str) -> bool:
+        return bool(self._query("SELECT 1 FROM buckets WHERE name = ?", (bucket_name,)))
+
+    def make_bucket(self, bucket_name: str, *args, **kwargs):
+        if not bucket_name or "/" in bucket_name or bucket_name.startswith("."):
+            raise _error("InvalidBucketName", bucket_name)
+        try:
+            with self._lock:
+                self._conn.execute("INSERT INTO buckets VALUES (?, ?)", (bucket_name, _now().isoformat()))
+        except sqlite3.IntegrityError:
+            raise _error("BucketAlreadyOwnedByYou", bucket_name)
+        os.makedirs(os.path.join(self.root, "data", bucket_name), exist_ok=True)
+
+    # ---- 对象 ----
+
+    def put_object(self, bucket_name: str, object_name: str, data, length: int, content_type: str = "application/octet-stream",
+                   metadata: Optional[dict] = None, part_size: int = 0, **kwargs) -> ObjectWriteResult:
+        self._check_bucket(bucket_name)
+        chunk_size = part_size or 5 * 1024 * 1024
+
+        def chunks():
+            remaining = length
+            while remaining != 0:
+                chunk = data.read(chunk_size if remaining < 0 else min(chunk_size, remaining))
+                if not chunk:
+                    break
+                if remaining > 0:
+                    remaining -= len(chunk)
+                yield chunk
+
+        file, size, etag = self._write_file(bucket_name, chunks())
+        return self._commit(bucket_name, object_name, file, size, etag, content_type, _user_metadata(metadata))
+
+    def put_if_absent(self, bucket_name: str, object_name: str, data: bytes, content_type: Optional[str] = None,
+                      metadata: Optional[dict] = None) -> ObjectWriteResult:
+        self._check_bucket(bucket_name)
+        file, size, etag = self._write_file(bucket_name, [bytes(data)])
+        return self._commit(
+            bucket_name, object_name, file, size, etag, content_type, _user_metadata(metadata), if_none_match=True
+        )
+
+    def stat_object(self, bucket_name: str, object_name: str, *args, **kwargs) -> Object:
+        return self._object(self._row(bucket_name, object_name), with_metadata=True)
+
+    def get_object(self, bucket_name: str, object_name: str, offset: int = 0, length: int = 0,
+                   *args, **kwargs) -> _MappedResponse:
+        # 查到索引后数据文件可能恰好被并发的改写删除，重新查一次即可读到新版本
+        for attempt in range(3):
+            row = self._row(bucket_name, object_name)
+            size = row["size"]
+            if offset > size or (offset == size and size):
+                raise _error("InvalidRange", bucket_name, object_name)
+            length = min(length, size - offset) if length else size - offset
+            headers = {"Content-Type": row["content_type"], "ETag": f'"{row["etag"]}"', "Content-Length": str(length)}
+            headers.update(json.loads(row["metadata"]))
+            try:
+                return _MappedResponse(self._path(bucket_name, row["file"]), offset, length, headers)
+            except FileNotFoundError:
+                continue
+        raise _error("NoSuchKey", bucket_name, object_name)
+
+    def list_objects(self, bucket_name: str, prefix: Optional[str] = None, recursive: bool = False,
+                     start_after: Optional[str] = None, **kwargs):
+        self._check_bucket(bucket_name)
+        prefix = prefix or ""
+        lower, inclusive = (start_after, False) if start_after and start_after >= prefix else (prefix, True)
+        upper = prefix_upper(prefix) if prefix else None
+        while True:
+            sql = "SELECT * FROM objects WHERE bucket = ? AND name " + (">= ?" if inclusive else "> ?")
+            params = [bucket_name, lower]
+            if upper is not None:
+                sql += " AND name < ?"
+                params.append(upper)
+            rows = self._query(sql + " ORDER BY name LIMIT ?", params + [_LIST_PAGE])
+            if not rows:
+                return
+            for row in rows:
+                name = row["name"]
+                rest = name[len(prefix):]
+                if not recursive and "/" in rest:
+                    # 非递归时子目录只以公共前缀的形式返回一次，然后跳过该目录下的所有对象
+                    directory = prefix + rest.split("/", 1)[0] + "/"
+                    yield Object(bucket_name, directory)
+                    lower, inclusive = prefix_upper(directory), True
+                    break
+                yield self._object(row)
+                lower, inclusive = name, False
+            else:
+                if len(rows) < _LIST_PAGE:
+                    return
+
+    def remove_object(self, bucket_name: str, object_name: str, *args, **kwargs):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT file FROM objects WHERE bucket = ? AND name = ?", (bucket_name, object_name)
+                ).fetchone()
+                self._conn.execute("DELETE FROM objects WHERE bucket = ? AND name = ?", (bucket_name, object_name))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is not None:
+            _remove(self._path(bucket_name, row["file"]))
+
+    def remove_objects(self, bucket_name: str, delete_object_list, *args, **kwargs):
+        """与真实客户端一样是惰性的：迭代返回值时才执行删除，返回删除失败的 DeleteError"""
+        for obj in delete_object_list:
+            try:
+                self.remove_object(bucket_name, obj.name)
+            except (OSError, sqlite3.Error) as e:
+                yield DeleteError("InternalError", str(e), obj.name, None)
+
+    def copy_object(self, bucket_name: str, object_name: str, source, metadata: Optional[dict] = None,
+                    metadata_directive: Optional[str] = None, **kwargs) -> ObjectWriteResult:
+        return self._copy(bucket_name, object_name, source, (metadata or {}) if metadata_directive == "REPLACE" else None)
+
+    def copy_if_match(self, bucket_name: str, object_name: str, source, etag: str,
+                      metadata: Optional[dict] = None) -> ObjectWriteResult:
+        return self._copy(bucket_name, object_name, source, metadata or None, if_match=etag)
+
+    def _copy(self, bucket_name: str, object_name: str, source, metadata: Optional[dict] = None,
+              if_match: Optional[str] = None) -> ObjectWriteResult:
+        """服务端复制；metadata 为 None 时沿用源对象的元数据，否则整体替换"""
+        row = self._row(source.bucket_name, source.object_name)
+        match_etag = getattr(source, "match_etag", None)
+        if match_etag is not None and match_etag.strip('"') != row["etag"]:
+            raise _error("PreconditionFailed", source.bucket_name, source.object_name)
+        if metadata is not None:
+            content_type = _header(metadata, "Content-Type") or row["content_type"]
+            user_metadata = _user_metadata(metadata)
+        else:
+            content_type, user_metadata = row["content_type"], json.loads(row["metadata"])
+        if (source.bucket_name, source.object_name) == (bucket_name, object_name):
+            if if_match is not None and if_match.strip('"') != row["etag"]:
+                raise _error("PreconditionFailed", bucket_name, object_name)
+            return self._replace_metadata(row, content_type, user_metadata)
+        self._check_bucket(bucket_name)
+        source_path = self._path(source.bucket_name, row["file"])
+        file, path = self._new_file(bucket_name)
+        try:
+            # 数据文件不会被原地修改，可以直接共用（硬链接），跨文件系统时退回内核拷贝
+            os.link(source_path, path)
+        except FileNotFoundError:
+            raise _error("NoSuchKey", source.bucket_name, source.object_name)
+        except OSError:
+            shutil.copyfile(source_path, path + ".part")
+            os.replace(path + ".part", path)
+        return self._commit(
+            bucket_name, object_name, file, row["size"], row["etag"], content_type, user_metadata, if_match=if_match
+        )
+
+    # ---- 分片上传 ----
+
+    def _upload_dir(self, upload_id: str) -> str:
+        return os.path.join(self.root, "uploads", upload_id)
+
+    def _upload(self, bucket_name: str, object_name: str, upload_id: str) -> sqlite3.Row:
+        rows = self._query(
+            "SELECT * FROM uploads WHERE id = ? AND bucket = ? AND name = ?", (upload_id, bucket_name, object_name)
+        )
+        if not rows:
+            raise _error("NoSuchUpload", bucket_name, object_name)
+        return rows[0]
+
+    def create_multipart(self, bucket_name: str, object_name: str, content_type: Optional[str] = None,
+                         metadata: Optional[dict] = None) -> str:
+        self._check_bucket(bucket_name)
+        headers = metadata_headers(content_type, metadata)
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self._upload_dir(upload_id))
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO uploads VALUES (?, ?, ?, ?, ?)",
+                (upload_id, bucket_name, object_name, json.dumps(headers), _now().isoformat())
+            )
+        return upload_id
+
+    def upload_part(self, bucket_name: str, object_name: str, upload_id: str, part_number: int, data) -> str:
+        self._upload(bucket_name, object_name, upload_id)
+        path = os.path.join(self._upload_dir(upload_id), str(part_number))
+        etag = hashlib.md5(data).hexdigest()
+        with open(path + ".part", "wb") as f:
+            f.write(data)
+            self._finish_file(f)
+        os.replace(path + ".part", path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO parts VALUES (?, ?, ?, ?)", (upload_id, part_number, etag, len(data))
+            )
+        return etag
+
+    def list_parts(self, bucket_name: str, object_name: str, upload_id: str, max_parts: Optional[int] = None,
+                   part_number_marker: Optional[int] = None):
+        self._upload(bucket_name, object_name, upload_id)
+        limit = max_parts or 1000
+        rows = self._query(
+            "SELECT * FROM parts WHERE upload_id = ? AND part_number > ? ORDER BY part_number LIMIT ?",
+            (upload_id, int(part_number_marker or 0), limit + 1)
+        )
+        truncated = len(rows) > limit
+        rows = rows[:limit]
+        return SimpleNamespace(
+            parts=[Part(row["part_number"], row["etag"], size=row["size"]) for row in rows],
+            is_truncated=truncated,
+            next_part_number_marker=rows[-1]["part_number"] if truncated else None,
+        )
+
+    def complete_multipart(self, bucket_name: str, object_name: str, upload_id: str, parts,
+                           if_match: Optional[str] = None, if_none_match: bool = False) -> ObjectWriteResult:
+        upload = self._upload(bucket_name, object_name, upload_id)
+        stored = {
+            row["part_number"]: row["etag"]
+            for row in self._query("SELECT part_number, etag FROM parts WHERE upload_id = ?", (upload_id,))
+        }
+        for part in parts:
+            if stored.get(part.part_number) != part.etag.strip('"'):
+                raise _error("InvalidPart", bucket_name, object_name)
+        directory = self._upload_dir(upload_id)
+        file, path = self._new_file(bucket_name)
+        md5 = hashlib.md5()
+        try:
+            with open(path + ".part", "wb") as f:
+                for part in parts:
+                    _append_file(f, os.path.join(directory, str(part.part_number)))
+                    md5.update(bytes.fromhex(stored[part.part_number]))
+                self._finish_file(f)
+                size = f.tell()
+            os.replace(path + ".part", path)
+        except BaseException:
+            _remove(path + ".part")
+            raise
+        upload_headers = json.loads(upload["headers"])
+        # 与 S3 一致：分片上传的 ETag 为各分片 MD5 拼接后的 MD5 加上 -<分片数>
+        result = self._commit(
+            bucket_name, object_name, file, size, f"{md5.hexdigest()}-{len(parts)}",
+            _header(upload_headers, "Content-Type"), _header_metadata(upload_headers),
+            if_none_match=if_none_match, if_match=if_match
+        )
+        self.abort_multipart(bucket_name, object_name, upload_id)
+        return result
+
+    def abort_multipart(self, bucket_name: str, object_name: str, upload_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM parts WHERE upload_id = ?", (upload_id,))
+            self._conn.execute("DELETE FROM uploads WHERE id = ?", (upload_id,))
+        shutil.rmtree(self._upload_dir(upload_id), ignore_errors=True)
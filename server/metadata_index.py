@@ -0,0 +1,407 @@
+"""
+本地元数据索引（SQLite）。
+
+记录存储桶中每个对象的名称、大小、修改时间、Content-Type、明文大小和 SM3 摘要，
+由各写接口实时更新，并由后台定期全量对账（reconcile）修正在本服务之外发生的变化。
+浏览、搜索和存在性检查可直接查本地库，不必每次请求 MinIO。
+
+目录结构单独保存在 folders 表中（包括只由对象路径隐含出的目录），
+列出目录只需按 parent 查询直接子项，与该目录下的对象总数无关。
+
+一个存储桶至少完成过一次对账后才被视为“已就绪”，此前相关查询应回退到 MinIO。
+多个进程可以共用同一个数据库文件（WAL 模式）。
+"""
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from listing import DirectoryEntry, prefix_upper
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    bucket TEXT NOT NULL,
+    name TEXT NOT NULL,
+    parent TEXT NOT NULL,
+    size INTEGER,
+    last_modified TEXT,
+    etag TEXT,
+    content_type TEXT,
+    plaintext_size INTEGER,
+    sm3 TEXT,
+    scan_id INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS objects_parent ON objects (bucket, parent, name);
+CREATE TABLE IF NOT EXISTS folders (
+    bucket TEXT NOT NULL,
+    path TEXT NOT NULL,
+    parent TEXT NOT NULL,
+    PRIMARY KEY (bucket, path)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS folders_parent ON folders (bucket, parent, path);
+CREATE TABLE IF NOT EXISTS buckets (
+    name TEXT PRIMARY KEY,
+    last_scan TEXT
+);
+CREATE TABLE IF NOT EXISTS tombstones (
+    bucket TEXT NOT NULL,
+    name TEXT NOT NULL,
+    deleted INTEGER NOT NULL,
+    PRIMARY KEY (bucket, name)
+) WITHOUT ROWID;
+"""
+
+# 写接口实时写入的记录（总是最新的），已有的 Content-Type / 明文大小 / 摘要在 ETag 未变时保留
+_UPSERT = """
+INSERT INTO objects (bucket, name, parent, size, last_modified, etag, content_type, plaintext_size, sm3, scan_id)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (bucket, name) DO UPDATE SET
+    size = excluded.size,
+    last_modified = excluded.last_modified,
+    content_type = COALESCE(excluded.content_type, CASE WHEN objects.etag = excluded.etag THEN objects.content_type END),
+    plaintext_size = COALESCE(excluded.plaintext_size, CASE WHEN objects.etag = excluded.etag THEN objects.plaintext_size END),
+    sm3 = COALESCE(excluded.sm3, CASE WHEN objects.etag = excluded.etag THEN objects.sm3 END),
+    etag = excluded.etag,
+    scan_id = excluded.scan_id
+"""
+
+# 对账扫描写入的记录：列表结果可能已经过时，有以下情况之一时只刷新 scan_id（避免被当作已删除清理）：
+#   - 索引中的记录是扫描开始后由写接口写入的（scan_id 更大）
+#   - 索引中的记录比列表结果新（last_modified 更晚）
+# 扫描开始后被删除的对象留有墓碑，不会被列表结果写回
+_SCAN_FRESH = (
+    "(objects.scan_id < excluded.scan_id AND (objects.last_modified IS NULL OR excluded.last_modified IS NULL"
+    " OR excluded.last_modified >= objects.last_modified))"
+)
+_SCAN_UPSERT = f"""
+INSERT INTO objects (bucket, name, parent, size, last_modified, etag, content_type, plaintext_size, sm3, scan_id)
+SELECT ?, ?, ?, ?, ?, ?, NULL, NULL, NULL, ?
+WHERE NOT EXISTS (SELECT 1 FROM tombstones WHERE bucket = ? AND name = ? AND deleted >= ?)
+ON CONFLICT (bucket, name) DO UPDATE SET
+    size = CASE WHEN {_SCAN_FRESH} THEN excluded.size ELSE objects.size END,
+    last_modified = CASE WHEN {_SCAN_FRESH} THEN excluded.last_modified ELSE objects.last_modified END,
+    content_type = CASE WHEN NOT {_SCAN_FRESH} OR objects.etag = excluded.etag THEN objects.content_type END,
+    plaintext_size = CASE WHEN NOT {_SCAN_FRESH} OR objects.etag = excluded.etag THEN objects.plaintext_size END,
+    sm3 = CASE WHEN NOT {_SCAN_FRESH} OR objects.etag = excluded.etag THEN objects.sm3 END,
+    etag = CASE WHEN {_SCAN_FRESH} THEN excluded.etag ELSE objects.etag END,
+    scan_id = MAX(objects.scan_id, excluded.scan_id)
+"""
+# 墓碑只用于扫描期间的删除，保留时间远长于一次对账即可
+TOMBSTONE_TTL = 24 * 3600
+
+_COLUMNS = "name, size, last_modified, etag, content_type, plaintext_size, sm3"
+
+
+def parent_of(name: str) -> str:
+    """对象或目录的直接父目录，如 a/b/c.txt -> a/b/，a/b/ -> a/，c.txt -> 空串"""
+    index = name.rstrip("/").rfind("/")
+    return name[:index + 1] if index >= 0 else ""
+
+
+def ancestors_of(name: str) -> list:
+    """对象的所有上级目录（目录占位对象包括其自身），由浅到深"""
+    parts = name.split("/")[:-1]
+    return ["/".join(parts[:i + 1]) + "/" for i in range(len(parts))]
+
+
+def _to_datetime(value: Optional[str]):
+    return datetime.fromisoformat(value) if value else None
+
+
+class MetadataIndex:
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._ready = set()
+        self._reconciler = None
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            for row in self._conn.execute("SELECT name FROM buckets WHERE last_scan IS NOT NULL"):
+                self._ready.add(row["name"])
+
+    def is_ready(self, bucket_name: str) -> bool:
+        """该存储桶是否已完成过对账，可以代替 MinIO 回答查询"""
+        return bucket_name in self._ready
+
+    # ---- 写入 ----
+
+    def _add_folders(self, bucket_name: str, name: str):
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO folders (bucket, path, parent) VALUES (?, ?, ?)",
+            [(bucket_name, path, parent_of(path)) for path in ancestors_of(name)]
+        )
+
+    def _prune_folders(self, bucket_name: str, name: str):
+        """删除不再包含任何对象的隐含目录，由深到浅，遇到非空目录即停止"""
+        for path in reversed(ancestors_of(name)):
+            row = self._conn.execute(
+                "SELECT 1 FROM objects WHERE bucket = ? AND name >= ? AND name < ? LIMIT 1",
+                (bucket_name, path, prefix_upper(path))
+            ).fetchone()
+            if row:
+                break
+            self._conn.execute("DELETE FROM folders WHERE bucket = ? AND path = ?", (bucket_name, path))
+
+    def upsert(self, bucket_name: str, name: str, size: int, etag: Optional[str] = None,
+               last_modified: Optional[datetime] = None, content_type: Optional[str] = None,
+               plaintext_size: Optional[int] = None, sm3: Optional[str] = None):
+        """记录新写入或被修改的对象"""
+        last_modified = last_modified or datetime.now(timezone.utc)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(_UPSERT, (
+                    bucket_name, name, parent_of(name), size, last_modified.isoformat(), etag,
+                    content_type, plaintext_size, sm3, time.time_ns()
+                ))
+                self._conn.execute("DELETE FROM tombstones WHERE bucket = ? AND name = ?", (bucket_name, name))
+                self._add_folders(bucket_name, name)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _bury(self, bucket_name: str, name: str):
+        """记录删除时间，正在进行的对账不会把扫描开始前列出的该对象写回"""
+        self._conn.execute(
+            "INSERT INTO tombstones (bucket, name, deleted) VALUES (?, ?, ?) "
+            "ON CONFLICT (bucket, name) DO UPDATE SET deleted = excluded.deleted",
+            (bucket_name, name, time.time_ns())
+        )
+
+    def delete(self, bucket_name: str, *names: str):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for name in names:
+                    self._conn.execute("DELETE FROM objects WHERE bucket = ? AND name = ?", (bucket_name, name))
+                    self._bury(bucket_name, name)
+                    self._prune_folders(bucket_name, name)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def rename(self, bucket_name: str, source_name: str, target_name: str):
+        """对象改名后保留其余元数据"""
+        self.rename_many(bucket_name, [(source_name, target_name)])
+
+    def rename_many(self, bucket_name: str, pairs):
+        """在一个事务中批量改名，pairs 为 [(源对象名, 目标对象名)]"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for source_name, target_name in pairs:
+                    self._conn.execute(
+                        "DELETE FROM objects WHERE bucket = ? AND name = ?", (bucket_name, target_name)
+                    )
+                    self._conn.execute(
+                        "UPDATE objects SET name = ?, parent = ?, scan_id = ? WHERE bucket = ? AND name = ?",
+                        (target_name, parent_of(target_name), time.time_ns(), bucket_name, source_name)
+                    )
+                    self._conn.execute(
+                        "DELETE FROM tombstones WHERE bucket = ? AND name = ?", (bucket_name, target_name)
+                    )
+                    self._bury(bucket_name, source_name)
+                    self._add_folders(bucket_name, target_name)
+                    self._prune_folders(bucket_name, source_name)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # ---- 查询 ----
+
+    def get(self, bucket_name: str, name: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {_COLUMNS} FROM objects WHERE bucket = ? AND name = ?", (bucket_name, name)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def folder_summary(self, bucket_name: str, folder: str):
+        """文件夹下的文件数、总大小和最近修改时间"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), MAX(last_modified) FROM objects "
+                "WHERE bucket = ? AND name >= ? AND name < ? AND substr(name, -1) != '/'",
+                (bucket_name, folder, prefix_upper(folder))
+            ).fetchone()
+        return row[0], row[1], _to_datetime(row[2])
+
+    def list_directory(self, bucket_name: str, prefix: str, aggregate: bool = False) -> list:
+        """与 listing.list_directory 返回相同结构的目录列表"""
+        with self._lock:
+            folders = [row[0] for row in self._conn.execute(
+                "SELECT path FROM folders WHERE bucket = ? AND parent = ? ORDER BY path",
+                (bucket_name, prefix)
+            )]
+            files = self._conn.execute(
+                "SELECT name, size, last_modified FROM objects "
+                "WHERE bucket = ? AND parent = ? AND substr(name, -1) != '/' ORDER BY name",
+                (bucket_name, prefix)
+            ).fetchall()
+        entries = [DirectoryEntry(path, "folder") for path in folders]
+        if aggregate:
+            for entry in entries:
+                entry.count, entry.size, entry.last_modified = self.folder_summary(bucket_name, entry.name)
+        entries.extend(
+            DirectoryEntry(row["name"], "file", row["size"], _to_datetime(row["last_modified"]))
+            for row in files
+        )
+        return entries
+
+    def iter_directory(self, bucket_name: str, prefix: str, kind: str, after: Optional[str] = None,
+                       batch_size: int = 500):
+        """与 listing.iter_directory 相同：按名称顺序逐批读取 prefix 下名称大于 after 的直接子文件夹或文件"""
+        after = after or ""
+        while True:
+            with self._lock:
+                if kind == "folder":
+                    entries = [DirectoryEntry(row[0], "folder") for row in self._conn.execute(
+                        "SELECT path FROM folders WHERE bucket = ? AND parent = ? AND path > ? ORDER BY path LIMIT ?",
+                        (bucket_name, prefix, after, batch_size)
+                    )]
+                else:
+                    entries = [
+                        DirectoryEntry(row["name"], "file", row["size"], _to_datetime(row["last_modified"]))
+                        for row in self._conn.execute(
+                            "SELECT name, size, last_modified FROM objects WHERE bucket = ? AND parent = ? "
+                            "AND name > ? AND substr(name, -1) != '/' ORDER BY name LIMIT ?",
+                            (bucket_name, prefix, after, batch_size)
+                        )
+                    ]
+            yield from entries
+            if len(entries) < batch_size:
+                return
+            after = entries[-1].name
+
+    def search(self, bucket_name: str, keyword: str, prefix: str = "", limit: int = 100) -> list:
+        """按名称关键字（不区分大小写）搜索 prefix 下的文件和文件夹"""
+        keyword = keyword.lower()
+        if prefix:
+            bounds, args = "AND {col} >= ? AND {col} < ?", (prefix, prefix_upper(prefix))
+        else:
+            bounds, args = "", ()
+        with self._lock:
+            folders = self._conn.execute(
+                f"SELECT path FROM folders WHERE bucket = ? {bounds.format(col='path')} "
+                "AND instr(lower(path), ?) > 0 ORDER BY path LIMIT ?",
+                (bucket_name, *args, keyword, limit)
+            ).fetchall()
+            files = self._conn.execute(
+                f"SELECT name, size, last_modified FROM objects WHERE bucket = ? {bounds.format(col='name')} "
+                "AND substr(name, -1) != '/' AND instr(lower(name), ?) > 0 ORDER BY name LIMIT ?",
+                (bucket_name, *args, keyword, limit)
+            ).fetchall()
+        entries = [DirectoryEntry(row[0], "folder") for row in folders]
+        entries.extend(
+            DirectoryEntry(row["name"], "file", row["size"], _to_datetime(row["last_modified"]))
+            for row in files
+        )
+        return entries[:limit]
+
+    # ---- 对账 ----
+
+    def reconcile(self, client, bucket_name: str, batch_size: int = 1000) -> int:
+        """
+        全量扫描存储桶并与索引对齐，返回扫描到的对象数。
+        扫描期间由写接口写入的记录 scan_id 更大，不会被误删，也不会被过时的列表结果覆盖；
+        扫描期间删除的对象有墓碑，不会被写回。
+        """
+        scan_id = time.time_ns()
+        if not client.bucket_exists(bucket_name):
+            with self._lock:
+                self._conn.execute("DELETE FROM objects WHERE bucket = ?", (bucket_name,))
+                self._conn.execute("DELETE FROM folders WHERE bucket = ?", (bucket_name,))
+            return 0
+
+        count = 0
+        batch = []
+
+        def flush():
+            with self._lock:
+                self._conn.execute("BEGIN")
+                try:
+                    self._conn.executemany(_SCAN_UPSERT, batch)
+                    self._conn.execute("COMMIT")
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    raise
+            batch.clear()
+
+        for obj in client.list_objects(bucket_name, recursive=True):
+            last_modified = obj.last_modified.isoformat() if obj.last_modified else None
+            batch.append((
+                bucket_name, obj.object_name, parent_of(obj.object_name), obj.size or 0,
+                last_modified, obj.etag, scan_id, bucket_name, obj.object_name, scan_id
+            ))
+            count += 1
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    "DELETE FROM objects WHERE bucket = ? AND scan_id < ?", (bucket_name, scan_id)
+                )
+                self._conn.execute(
+                    "DELETE FROM tombstones WHERE bucket = ? AND deleted < ?",
+                    (bucket_name, scan_id - TOMBSTONE_TTL * 10 ** 9)
+                )
+                # 目录表按对象路径重建
+                self._conn.execute("DELETE FROM folders WHERE bucket = ?", (bucket_name,))
+                folders = set()
+                for (name,) in self._conn.execute("SELECT name FROM objects WHERE bucket = ?", (bucket_name,)):
+                    folders.update(ancestors_of(name))
+                self._conn.executemany(
+                    "INSERT INTO folders (bucket, path, parent) VALUES (?, ?, ?)",
+                    [(bucket_name, path, parent_of(path)) for path in folders]
+                )
+                self._conn.execute(
+                    "INSERT INTO buckets (name, last_scan) VALUES (?, ?) "
+                    "ON CONFLICT (name) DO UPDATE SET last_scan = excluded.last_scan",
+                    (bucket_name, datetime.now(timezone.utc).isoformat())
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        self._ready.add(bucket_name)
+        return count
+
+    def start_reconciler(self, client, bucket_names, interval: float):
+        """
+        启动后台对账线程：启动时立即对账一次，之后每 interval 秒一次（interval<=0 只对账一次）。
+        每个实例只启动一个线程，重复调用返回已启动的线程
+        """
+        if self._reconciler is not None:
+            return self._reconciler
+
+        def run():
+            while True:
+                for bucket_name in bucket_names:
+                    try:
+                        count = self.reconcile(client, bucket_name)
+                        logger.info("Metadata index reconciled %s: %d objects", bucket_name, count)
+                    except Exception:
+                        logger.exception("Metadata index reconcile failed for %s", bucket_name)
+                if interval <= 0:
+                    return
+                time.sleep(interval)
+
+        self._reconciler = threading.Thread(target=run, name="metadata-index-reconciler", daemon=True)
+        self._reconciler.start()
+        return self._reconciler
@@ -0,0 +1,431 @@
+"""
+请求级指标与热点路径计时，以 Prometheus 文本格式导出（GET /metrics）。
+
+    请求      各接口的请求数、耗时直方图（含流式响应体的输出时间）、进出字节数、进行中的请求数
+    阶段      请求耗时按阶段拆分：read（读取上传数据）、encrypt / decrypt、hash、storage（MinIO 调用及读取响应体）
+    MinIO     各方法的调用次数（按结果）与耗时直方图
+    剖析      可选：对部分请求开启 cProfile，耗时超过阈值的请求把剖析结果写入目录
+
+阶段按独占时间统计：storage 调用内部嵌套的 read / encrypt / hash（例如 put_object 边读边加密）
+只计入内层阶段，各阶段之和不会超过请求总耗时。分片上传等在线程池中执行的工作
+通过 contextvars 归属到发起它的请求，与请求无关的后台工作记在 endpoint="background" 下。
+
+指标只在本进程内累计，多进程部署时由 Prometheus 分别抓取各进程再汇总。
+"""
+import contextvars
+import cProfile
+import os
+import random
+import re
+import threading
+import time
+import types
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+PREFIX = "sm4_gateway_"
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_enabled = True
+
+
+def set_enabled(enabled: bool):
+    global _enabled
+    _enabled = enabled
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = PREFIX + name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in sorted(items):
+            yield self.name, dict(zip(self.labels, key)), value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self._samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # 各桶计数（非累计）、总和、总数
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self):
+        with self._lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        for key, (counts, total, count) in sorted(items):
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield self.name + "_bucket", dict(labels, le=_format_value(float(bound))), cumulative
+            yield self.name + "_bucket", dict(labels, le="+Inf"), count
+            yield self.name + "_sum", labels, total
+            yield self.name + "_count", labels, count
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, collect: Callable):
+        """
+        注册抓取时才计算的指标：collect() 返回 [(名称, 类型, 说明, [(标签, 值)])]，
+        用于导出缓存、连接池等已有的统计
+        """
+        self._collectors.append(collect)
+        return collect
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            try:
+                families = collect()
+            except Exception:
+                continue
+            for name, kind, help, samples in families:
+                lines.append(f"# HELP {PREFIX}{name} {help}")
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{PREFIX}{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(Counter("requests_total", "HTTP requests by endpoint, method and status", ("endpoint", "method", "status")))
+REQUEST_DURATION = REGISTRY.register(Histogram(
+    "request_duration_seconds", "HTTP request duration including streamed response bodies", ("endpoint", "method")
+))
+REQUEST_BYTES = REGISTRY.register(Counter("request_bytes_total", "HTTP body bytes by endpoint and direction", ("endpoint", "direction")))
+IN_FLIGHT = REGISTRY.register(Gauge("requests_in_flight", "HTTP requests currently being served", ("endpoint",)))
+PHASE_SECONDS = REGISTRY.register(Counter(
+    "phase_seconds_total", "Exclusive time spent in each processing phase", ("endpoint", "phase")
+))
+MINIO_REQUESTS = REGISTRY.register(Counter("minio_requests_total", "MinIO client calls by method and outcome", ("method", "outcome")))
+MINIO_DURATION = REGISTRY.register(Histogram("minio_request_duration_seconds", "MinIO client call duration", ("method",)))
+PROFILES = REGISTRY.register(Counter("profiles_total", "Request profiles written to disk"))
+
+
+class _RequestState:
+    __slots__ = ("endpoint", "method", "routed")
+
+    def __init__(self, method: str):
+        self.endpoint = "unmatched"
+        self.method = method
+        self.routed = False
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar("metrics_request", default=None)
+# 每个线程自己的阶段嵌套栈，记录内层阶段占用的时间
+_local = threading.local()
+
+
+def route(endpoint: Optional[str]):
+    """请求路由完成后调用，记录接口名（未匹配的请求统一记为 unmatched，避免标签无限增长）"""
+    state = _current.get()
+    if state is None or state.routed:
+        return
+    state.endpoint = endpoint or "unmatched"
+    state.routed = True
+    IN_FLIGHT.inc(endpoint=state.endpoint)
+
+
+@contextmanager
+def phase(name: str):
+    """统计一段代码的独占耗时，内层嵌套的阶段不重复计入外层"""
+    if not _enabled:
+        yield
+        return
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    frame = [0.0]
+    stack.append(frame)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stack.pop()
+        if stack:
+            stack[-1][0] += elapsed
+        state = _current.get()
+        PHASE_SECONDS.inc(elapsed - frame[0], endpoint=state.endpoint if state else "background", phase=name)
+
+
+def timed_iter(iterable, name: str):
+    """逐项迭代，把每次取下一项的耗时计入阶段 name（例如读取 MinIO 响应体）"""
+    iterator = iter(iterable)
+    try:
+        while True:
+            with phase(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()
+
+
+def submit(pool, fn, *args):
+    """向线程池提交任务，任务中的阶段耗时仍归属当前请求"""
+    return pool.submit(contextvars.copy_context().run, fn, *args)
+
+
+def _outcome(error: Exception) -> str:
+    return getattr(error, "code", None) or type(error).__name__
+
+
+def _timed_generator(method: str, generator, elapsed: float):
+    """
+    包装惰性生成器（list_objects、remove_objects 在迭代时才发出请求）：每次取下一项的耗时计入 storage 阶段
+    并累加到该次调用的耗时上，迭代结束、出错或提前关闭时才记录调用次数和耗时
+    """
+    outcome = "ok"
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                with phase("storage"):
+                    item = next(generator)
+            except StopIteration:
+                return
+            except Exception as e:
+                outcome = _outcome(e)
+                raise
+            finally:
+                elapsed += time.perf_counter() - started
+            yield item
+    finally:
+        generator.close()
+        MINIO_REQUESTS.inc(method=method, outcome=outcome)
+        MINIO_DURATION.observe(elapsed, method=method)
+
+
+class InstrumentedClient:
+    """
+    包装 MinIO 客户端：统计每个方法的调用次数、耗时，并计入 storage 阶段；其余属性原样透传。
+    返回生成器的方法在迭代过程中计时（见 _timed_generator）
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._client, name)
+        if not callable(attr) or name.startswith("__"):
+            return attr
+
+        def call(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                with phase("storage"):
+                    result = attr(*args, **kwargs)
+            except Exception as e:
+                MINIO_REQUESTS.inc(method=name, outcome=_outcome(e))
+                MINIO_DURATION.observe(time.perf_counter() - started, method=name)
+                raise
+            if isinstance(result, types.GeneratorType):
+                return _timed_generator(name, result, time.perf_counter() - started)
+            MINIO_REQUESTS.inc(method=name, outcome="ok")
+            MINIO_DURATION.observe(time.perf_counter() - started, method=name)
+            return result
+
+        return call
+
+
+def instrument_client(client):
+    return InstrumentedClient(client) if _enabled else client
+
+
+class MetricsMiddleware:
+    """
+    WSGI 中间件：记录请求数、耗时、进出字节数和进行中的请求数。
+    耗时从收到请求开始，到响应体（包括流式输出）发送完毕为止。
+
+    profile_dir 非空时开启剖析：带 X-Profile: 1 头的请求，以及按 profile_sample 比例抽样的请求
+    用 cProfile 记录，耗时达到 profile_slow 秒（或带 X-Profile 头）时写出 .prof 文件。
+    同一时间只剖析一个请求，避免多个剖析器互相干扰。
+    """
+
+    _profile_lock = threading.Lock()
+
+    def __init__(self, wsgi_app, profile_dir: Optional[str] = None, profile_slow: float = 1.0, profile_sample: float = 0.0):
+        self.wsgi_app = wsgi_app
+        self.profile_dir = profile_dir
+        self.profile_slow = profile_slow
+        self.profile_sample = profile_sample
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+
+    def _start_profile(self, environ) -> Optional[cProfile.Profile]:
+        if not self.profile_dir:
+            return None
+        forced = environ.get("HTTP_X_PROFILE") == "1"
+        if not forced and not (self.profile_sample and random.random() < self.profile_sample):
+            return None
+        if not self._profile_lock.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def _finish_profile(self, profiler: cProfile.Profile, state: _RequestState, elapsed: float, forced: bool):
+        profiler.disable()
+        try:
+            if forced or elapsed >= self.profile_slow:
+                endpoint = re.sub(r"[^A-Za-z0-9]+", "_", state.endpoint).strip("_") or "root"
+                name = f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{int(elapsed * 1000)}ms-{os.getpid()}.prof"
+                profiler.dump_stats(os.path.join(self.profile_dir, name))
+                PROFILES.inc()
+        finally:
+            self._profile_lock.release()
+
+    def __call__(self, environ, start_response):
+        if not _enabled:
+            return self.wsgi_app(environ, start_response)
+        state = _RequestState(environ.get("REQUEST_METHOD", "GET"))
+        token = _current.set(state)
+        started = time.perf_counter()
+        profiler = self._start_profile(environ)
+        status = ["500"]
+
+        def capture(status_line, headers, exc_info=None):
+            status[0] = status_line.split(" ", 1)[0]
+            return start_response(status_line, headers, exc_info)
+
+        try:
+            body = self.wsgi_app(environ, capture)
+        except BaseException:
+            self._finish(state, token, started, status[0], environ, 0, profiler)
+            raise
+        return _CountingBody(body, lambda sent: self._finish(state, token, started, status[0], environ, sent, profiler))
+
+    def _finish(self, state: _RequestState, token, started: float, status: str, environ, sent: int, profiler):
+        elapsed = time.perf_counter() - started
+        if profiler is not None:
+            self._finish_profile(profiler, state, elapsed, environ.get("HTTP_X_PROFILE") == "1")
+        REQUESTS.inc(endpoint=state.endpoint, method=state.method, status=status)
+        REQUEST_DURATION.observe(elapsed, endpoint=state.endpoint, method=state.method)
+        try:
+            received = int(environ.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            received = 0
+        if received:
+            REQUEST_BYTES.inc(received, endpoint=state.endpoint, direction="in")
+        if sent:
+            REQUEST_BYTES.inc(sent, endpoint=state.endpoint, direction="out")
+        if state.routed:
+            IN_FLIGHT.dec(endpoint=state.endpoint)
+        try:
+            _current.reset(token)
+        except ValueError:
+            # 响应体在其他上下文中关闭时无法复原，不影响统计
+            pass
+
+
+class _CountingBody:
+    """包装 WSGI 响应体，统计发送的字节数，并在关闭时结束请求统计"""
+
+    def __init__(self, body, on_close: Callable):
+        self._body = body
+        self._on_close = on_close
+        self._sent = 0
+        self._closed = False
+
+    def __iter__(self):
+        for chunk in self._body:
+            self._sent += len(chunk)
+            yield chunk
+        # 响应体输出完毕即结束统计，服务器随后调用的 close() 不再重复记录
+        self.close()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            close = getattr(self._body, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self._on_close(self._sent)
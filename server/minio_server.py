@@ -1,128 +1,1079 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-from minio import Minio
+from werkzeug.datastructures import ContentRange
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
 from minio.error import S3Error
-from minio.commonconfig import CopySource  # 添加这行导入
-import io
+from minio.commonconfig import CopySource, REPLACE  # 添加这行导入
+from urllib.parse import quote
+import base64
+import bisect
+import json
 import os
+import unicodedata
+import uuid
+import zipfile
+from typing import Optional
+
+from encryption import (
+    EncryptedUploadStream,
+    KEY_ID_METADATA,
+    LEGACY_KEY_ID,
+    KeyRing,
+    STREAM_CHUNK_SIZE,
+    STREAM_HEADER,
+    STREAM_MAGIC,
+    UnknownKeyError,
+)
+from archive import archive_entries, common_base, stream_zip
+from bulk_ops import (
+    ChunkReader,
+    PrefixMover,
+    RateLimiter,
+    copy_with_metadata,
+    list_prefixes,
+    process_in_order,
+    remove_objects,
+    stat_sizes,
+)
+from cache import TTLCache
+from content_cache import ContentCache
+from dedup import DedupStore, REF_FORMAT
+from jobs import ACTIVE_STATES, JobQueue, JobStateError
+from listing import DirectoryEntry, iter_directory, list_directory, page_directory
+from metadata_index import MetadataIndex, ancestors_of
+from metrics import MetricsMiddleware, instrument_client, phase, timed_iter
+from multipart_upload import ParallelUploader, ResumableUploads, UploadSessionError
+from preview import PreviewError, PreviewStore, PreviewUnavailable, preview_kind, preview_size, render_preview
+from storage import StorageConfig, create_storage, pool_stats
+import metrics
+import sm3_hasher
+
+# 请求指标（GET /metrics，Prometheus 文本格式，默认开启）与按需剖析：
+# METRICS_PROFILE_DIR 非空时，带 X-Profile: 1 头或按 METRICS_PROFILE_SAMPLE 比例抽中的请求会被剖析，
+# 耗时超过 METRICS_PROFILE_SLOW 秒（或带 X-Profile 头）时把 cProfile 结果写入该目录
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+METRICS_PROFILE_DIR = os.environ.get("METRICS_PROFILE_DIR") or None
+METRICS_PROFILE_SLOW = float(os.environ.get("METRICS_PROFILE_SLOW", 1.0))
+METRICS_PROFILE_SAMPLE = float(os.environ.get("METRICS_PROFILE_SAMPLE", 0))
+metrics.set_enabled(METRICS_ENABLED)
 
 app = Flask(__name__)
 # 允许所有来源的跨域请求
 CORS(app)
-
-# 配置MinIO客户端
-minio_client = Minio(
-    "152.32.131.180:9001",
-    access_key="xfjU0Z4xhXJfRmPkSoFr",
-    secret_key="OonSCnhPLfifHWbvVpTtKEuZ9sIm7M5lsrfk6gwq",
-    secure=False  # 如果使用HTTPS则为True
+app.wsgi_app = MetricsMiddleware(
+    app.wsgi_app,
+    profile_dir=METRICS_PROFILE_DIR,
+    profile_slow=METRICS_PROFILE_SLOW,
+    profile_sample=METRICS_PROFILE_SAMPLE
 )
 
+
+@app.before_request
+def _record_endpoint():
+    metrics.route(request.url_rule.rule if request.url_rule else None)
+
+
+# 存储后端（MinIO 或本地目录，由 STORAGE_BACKEND 等环境变量配置，见 storage.py），
+# 进程内所有线程共享同一客户端及连接池；每次调用的次数和耗时计入指标
+storage_config = StorageConfig()
+minio_client = instrument_client(create_storage(storage_config))
+
 # 默认存储桶名称
 DEFAULT_BUCKET = "test"
 
-from gmssl.sm4 import CryptSM4, SM4_ENCRYPT, SM4_DECRYPT
-from gmssl.sm3 import sm3_hash
+# put_object(length=-1) 的分片大小，MinIO 要求不小于 5MiB
+UPLOAD_PART_SIZE = 5 * 1024 * 1024
+
+# 大文件分片并行上传：分片大小、同时在途的分片数、加密进程数（0 表示在上传线程内加密）
+MULTIPART_PART_SIZE = int(os.environ.get("MULTIPART_PART_SIZE", 16 * 1024 * 1024))
+MULTIPART_CONCURRENCY = int(os.environ.get("MULTIPART_CONCURRENCY", 4))
+MULTIPART_CIPHER_PROCESSES = int(os.environ.get("MULTIPART_CIPHER_PROCESSES", 0))
+# 可续传分块上传的默认分块大小
+RESUMABLE_CHUNK_SIZE = int(os.environ.get("RESUMABLE_CHUNK_SIZE", 8 * 1024 * 1024))
+
+# 目录列表缓存：按 (bucket, prefix) 缓存，写操作会主动失效；
+# 缓存只在本进程内有效，多进程部署时其他进程最多滞后 LIST_CACHE_TTL 秒
+LIST_CACHE_TTL = float(os.environ.get("LIST_CACHE_TTL", 30))
+LIST_CACHE_SIZE = int(os.environ.get("LIST_CACHE_SIZE", 256))
+# 存储桶/文件夹存在性缓存的有效期（秒），只缓存“存在”的结果
+EXISTS_CACHE_TTL = float(os.environ.get("EXISTS_CACHE_TTL", 300))
+
+# 可选的本地元数据索引（SQLite 文件路径，留空则不启用）；
+# 启用后后台每 METADATA_INDEX_SCAN_INTERVAL 秒与 MinIO 对账一次
+METADATA_INDEX_PATH = os.environ.get("METADATA_INDEX_PATH", "")
+METADATA_INDEX_SCAN_INTERVAL = float(os.environ.get("METADATA_INDEX_SCAN_INTERVAL", 600))
+METADATA_INDEX_BUCKETS = os.environ.get("METADATA_INDEX_BUCKETS", DEFAULT_BUCKET).split(",")
+
+# 内容寻址去重：默认关闭，可通过 DEDUP_UPLOADS=1 开启，或上传时传 dedup 参数单独指定
+DEDUP_UPLOADS = os.environ.get("DEDUP_UPLOADS", "0") == "1"
+DEDUP_BUCKET = os.environ.get("DEDUP_BUCKET", "sm4-blobs")
+# 服务端内部使用的存储桶（续传分块锁、重新加密的暂存对象），首次使用时创建；
+# 与去重存储桶分开，暂存对象不会让从未启用去重的部署被当作启用了去重
+SYSTEM_BUCKET = os.environ.get("SYSTEM_BUCKET", "sm4-system")
+# 重新加密时暂存新密文的位置（系统存储桶中，不出现在用户的存储桶里）
+REENCRYPT_STAGING_PREFIX = "staging/reencrypt/"
+
+# 文件夹移动时并发复制的线程数
+MOVE_CONCURRENCY = int(os.environ.get("MOVE_CONCURRENCY", 16))
+
+# 服务端运行时数据（任务库等）的默认目录，已被 git 忽略
+DATA_DIR = os.environ.get("DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+
+# 后台任务（见 jobs.py）：任务库路径（多进程共用同一文件，首次使用时创建）、每个进程同时执行的任务数、
+# 失败后最多执行的次数及首次重试前的等待秒数、补算摘要 / 重新加密时每个任务并发处理的对象数
+JOBS_DB_PATH = os.environ.get("JOBS_DB_PATH", os.path.join(DATA_DIR, "jobs.db"))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+JOB_RETRY_DELAY = float(os.environ.get("JOB_RETRY_DELAY", 5))
+JOB_OBJECT_CONCURRENCY = int(os.environ.get("JOB_OBJECT_CONCURRENCY", 4))
+# 任务进度中最多保留的失败对象数
+JOB_ERRORS_LIMIT = 100
+
+# 下载时是否默认校验明文 SM3；可信的内部调用方可用 verify=0 跳过校验
+DOWNLOAD_VERIFY = os.environ.get("DOWNLOAD_VERIFY", "1") == "1"
+# 对象用户元数据中记录的明文摘要和明文长度
+DIGEST_METADATA = "x-amz-meta-sm3"
+PLAINTEXT_SIZE_METADATA = "x-amz-meta-plaintext-size"
+
+# 热点下载的内容缓存（默认关闭）：内存层缓存小对象的明文，磁盘层缓存较大对象的密文；
+# 容量单位 MiB，单个对象上限单位字节。缓存只在本进程内主动失效，
+# 多进程部署时其他进程改写的对象最多滞后 CONTENT_CACHE_REVALIDATE 秒
+CONTENT_CACHE_MEMORY_MB = int(os.environ.get("CONTENT_CACHE_MEMORY_MB", 0))
+CONTENT_CACHE_MEMORY_ITEM = int(os.environ.get("CONTENT_CACHE_MEMORY_ITEM", 1024 * 1024))
+CONTENT_CACHE_DISK_MB = int(os.environ.get("CONTENT_CACHE_DISK_MB", 0))
+CONTENT_CACHE_DISK_ITEM = int(os.environ.get("CONTENT_CACHE_DISK_ITEM", 256 * 1024 * 1024))
+CONTENT_CACHE_DIR = os.environ.get("CONTENT_CACHE_DIR") or None
+CONTENT_CACHE_REVALIDATE = float(os.environ.get("CONTENT_CACHE_REVALIDATE", 5))
+
+# 预览图（加密的派生对象）所在的存储桶、可生成预览的源文件大小上限、浏览器缓存时间（秒）
+PREVIEW_BUCKET = os.environ.get("PREVIEW_BUCKET", "sm4-previews")
+PREVIEW_MAX_SOURCE = int(os.environ.get("PREVIEW_MAX_SOURCE", 64 * 1024 * 1024))
+PREVIEW_MAX_AGE = int(os.environ.get("PREVIEW_MAX_AGE", 86400))
+
+# 打包下载：同时预取的对象数、每个对象最多缓冲的已解密分块数（每块 STREAM_CHUNK_SIZE）
+ARCHIVE_PREFETCH = int(os.environ.get("ARCHIVE_PREFETCH", 4))
+ARCHIVE_READ_AHEAD = int(os.environ.get("ARCHIVE_READ_AHEAD", 8))
+
+# 加密密钥环（见 encryption.py）：ENCRYPTION_KEYS 为逗号分隔的 "密钥ID:32位十六进制密钥"，
+# 也可以写在 ENCRYPTION_KEYS_FILE 指向的文件中（每行一个，便于以文件形式挂载密钥）；
+# ENCRYPTION_KEY_ID 指定加密新数据的当前密钥，默认为配置中的最后一个。
+# 没有记录密钥 ID 的旧对象使用 ID 为 default 的密钥，未配置时为原来内置的固定密钥。
+# 轮换密钥：加入新密钥并设为当前密钥，再用 reencrypt 任务把已有对象改用新密钥（旧密钥在完成前需保留）
+ENCRYPTION_KEYS = os.environ.get("ENCRYPTION_KEYS", "")
+ENCRYPTION_KEYS_FILE = os.environ.get("ENCRYPTION_KEYS_FILE") or None
+ENCRYPTION_KEY_ID = os.environ.get("ENCRYPTION_KEY_ID") or None
+if ENCRYPTION_KEYS_FILE:
+    with open(ENCRYPTION_KEYS_FILE, encoding="utf-8") as f:
+        ENCRYPTION_KEYS = ENCRYPTION_KEYS + "\n" + f.read()
+
+# 可通过环境变量 SM4_ENGINE 指定引擎（cryptography / numpy / gmssl），默认自动选择最快的；
+# SM3 实现同理可用 SM3_BACKEND 指定（openssl / cryptography / python）
+key_ring = KeyRing.from_config(ENCRYPTION_KEYS, ENCRYPTION_KEY_ID, engine=os.environ.get("SM4_ENGINE"))
+
+parallel_uploader = ParallelUploader(
+    key_ring.active,
+    part_size=MULTIPART_PART_SIZE,
+    concurrency=MULTIPART_CONCURRENCY,
+    cipher_processes=MULTIPART_CIPHER_PROCESSES
+)
+
+resumable_uploads = ResumableUploads(key_ring, chunk_size=RESUMABLE_CHUNK_SIZE, lock_bucket=SYSTEM_BUCKET)
 
-class EncryptionService:
-    def __init__(self, key: bytes):
-        self.key = key
-        self.crypt_sm4 = CryptSM4()
+list_cache = TTLCache(maxsize=LIST_CACHE_SIZE, ttl=LIST_CACHE_TTL)
+bucket_cache = TTLCache(maxsize=64, ttl=EXISTS_CACHE_TTL)
+folder_cache = TTLCache(maxsize=LIST_CACHE_SIZE, ttl=EXISTS_CACHE_TTL)
+prefix_mover = PrefixMover(
+    concurrency=MOVE_CONCURRENCY,
+    after_batch=lambda bucket_name, moved: _after_move_batch(bucket_name, moved)  # 定义在后文
+)
+job_queue = JobQueue(JOBS_DB_PATH, workers=JOB_WORKERS, max_attempts=JOB_MAX_ATTEMPTS, retry_delay=JOB_RETRY_DELAY)
+dedup_store = DedupStore(DEDUP_BUCKET, spool_size=MULTIPART_PART_SIZE)
+content_cache = ContentCache(
+    memory_size=CONTENT_CACHE_MEMORY_MB * 1024 * 1024,
+    memory_item_size=CONTENT_CACHE_MEMORY_ITEM,
+    disk_size=CONTENT_CACHE_DISK_MB * 1024 * 1024,
+    disk_item_size=CONTENT_CACHE_DISK_ITEM,
+    directory=CONTENT_CACHE_DIR,
+    revalidate=CONTENT_CACHE_REVALIDATE
+)
+preview_store = PreviewStore(key_ring, PREVIEW_BUCKET)
 
-    def encrypt(self, plaintext: bytes) -> bytes:
-        """SM4 加密"""
-        self.crypt_sm4.set_key(self.key, SM4_ENCRYPT)
-        return self.crypt_sm4.crypt_ecb(plaintext)
+metadata_index = MetadataIndex(METADATA_INDEX_PATH) if METADATA_INDEX_PATH else None
 
-    def decrypt(self, ciphertext: bytes) -> bytes:
-        """SM4 解密"""
-        self.crypt_sm4.set_key(self.key, SM4_DECRYPT)
-        return self.crypt_sm4.crypt_ecb(ciphertext)
 
-    @staticmethod
-    def hash_data(data: bytes) -> str:
-        """SM3 哈希"""
-        return sm3_hash(list(data))
+def _stream_size(stream):
+    """获取上传文件流的大小，不可 seek 时返回 None"""
+    try:
+        position = stream.tell()
+        size = stream.seek(0, os.SEEK_END)
+        stream.seek(position)
+        return size - position
+    except (AttributeError, OSError, ValueError):
+        return None
 
-# 初始化加密服务，使用一个固定的密钥（实际应用中应该安全地管理密钥）
-encryption_service = EncryptionService(key=b"0123456789abcdef")
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    if 'file' not in request.files:
+    # 表单在首次访问时解析，上传数据落到临时文件，计入读取阶段
+    with phase("read"):
+        files = request.files
+    if 'file' not in files:
         return jsonify({"error": "No file part"}), 400
     
-    file = request.files['file']
+    file = files['file']
     if file.filename == '':
         return jsonify({"error": "No selected file"}), 400
     
     bucket_name = request.form.get('bucket', DEFAULT_BUCKET)
     object_name = request.form.get('object_name', file.filename)  # 确保字段名一致
+    dedup = request.form.get('dedup', '1' if DEDUP_UPLOADS else '0') in ('1', 'true')
     
     try:
-        if not minio_client.bucket_exists(bucket_name):
-            minio_client.make_bucket(bucket_name)
+        _ensure_bucket(bucket_name)
+        
+        if dedup:
+            # 内容已存在时只写入引用对象
+            result = dedup_store.put(
+                minio_client, bucket_name, object_name, file.stream, _put_encrypted, file.content_type
+            )
+            _record_write(bucket_name, object_name, REF_FORMAT.size, result["etag"],
+                          content_type=file.content_type, plaintext_size=result["size"], sm3=result["sm3"])
+            return jsonify({
+                "message": "File uploaded and encrypted successfully",
+                "object": object_name,
+                "sm3": result["sm3"],
+                "deduplicated": result["deduplicated"]
+            }), 200
         
-        # 读取文件内容并加密
-        file_data = file.read()
-        encrypted_data = encryption_service.encrypt(file_data)
+        # 覆盖去重引用时需要释放原来的引用
+        previous = _previous_ref(bucket_name, object_name)
+        plaintext_size, etag, digest = _put_encrypted(
+            bucket_name, object_name, file.stream, _stream_size(file.stream), file.content_type
+        )
+        if previous is not None:
+            dedup_store.release(minio_client, bucket_name, object_name, previous[0])
+        _record_write(bucket_name, object_name, STREAM_HEADER.size + plaintext_size, etag,
+                      content_type=file.content_type, plaintext_size=plaintext_size, sm3=digest)
         
-        # 上传加密后的文件
-        minio_client.put_object(
+        return jsonify({
+            "message": "File uploaded and encrypted successfully",
+            "object": object_name,
+            "sm3": digest
+        }), 200
+    except Exception as e:
+        _forget_bucket(bucket_name, e)
+        return jsonify({"error": str(e)}), 500
+
+def _previous_ref(bucket_name: str, object_name: str):
+    """
+    覆盖写入前读取原对象的去重引用（摘要, 明文字节数），不是引用或不存在时返回 None。
+    从未启用去重时不发请求；索引已就绪时只有大小等于引用对象的才需要读取
+    """
+    if not dedup_store.in_use(minio_client):
+        return None
+    if metadata_index and metadata_index.is_ready(bucket_name):
+        entry = metadata_index.get(bucket_name, object_name)
+        if entry is None or entry["size"] != REF_FORMAT.size:
+            return None
+    return dedup_store.read_ref(minio_client, bucket_name, object_name)
+
+def _hash_source(source) -> Optional[str]:
+    """计算可 seek 的上传流剩余部分的明文 SM3，算完回到原位置；不可 seek 时返回 None"""
+    try:
+        position = source.tell()
+    except (AttributeError, OSError, ValueError):
+        return None
+    hasher = sm3_hasher.new()
+    with phase("hash"):
+        for chunk in iter(lambda: source.read(STREAM_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    source.seek(position)
+    return hasher.hexdigest()
+
+def _put_encrypted(bucket_name: str, object_name: str, source, size, content_type, digest: Optional[str] = None):
+    """
+    用当前密钥加密写入一个对象，返回 (明文字节数, ETag, 明文 SM3)；size 未知时传 None，digest 为已知的明文 SM3。
+    密钥 ID、明文摘要和长度在写入时一并作为用户元数据提交（普通上传和分片上传都是），
+    摘要未知时先读一遍可 seek 的 source 算出摘要；只有不可 seek 的流才在写入完成后补记摘要
+    """
+    service = key_ring.active
+    if digest is None and size is not None:
+        digest = _hash_source(source)
+    metadata = {KEY_ID_METADATA: service.key_id}
+    if digest is not None and size is not None:
+        metadata[DIGEST_METADATA] = digest
+        metadata[PLAINTEXT_SIZE_METADATA] = str(size)
+    hashing = DIGEST_METADATA not in metadata
+    if size is not None and MULTIPART_CONCURRENCY > 1 and size >= 2 * MULTIPART_PART_SIZE:
+        # 大文件：多个分片并行加密、并行上传（parallel_uploader 同样使用当前密钥）
+        plaintext_size, etag, streamed = parallel_uploader.upload(
+            minio_client, bucket_name, object_name, source, content_type, metadata=metadata, hashing=hashing
+        )
+    else:
+        # 边读边加密，分片流式上传
+        stream = EncryptedUploadStream(source, service, hashing=hashing)
+        result = minio_client.put_object(
             bucket_name,
             object_name,
-            io.BytesIO(encrypted_data),
-            length=len(encrypted_data),
-            content_type=file.content_type
+            stream,
+            length=-1,
+            part_size=UPLOAD_PART_SIZE,
+            content_type=content_type,
+            metadata=metadata
         )
+        plaintext_size, etag = stream.plaintext_size, result.etag
+        streamed = stream.sm3.hexdigest() if hashing else None
+    if hashing:
+        # 以本次写入的 ETag 为条件补记，期间被并发改写时不会把摘要记到别人的内容上
+        etag = _store_digest(bucket_name, object_name, streamed, plaintext_size, content_type, service.key_id, etag=etag)
+        return plaintext_size, etag, streamed
+    if plaintext_size != size:
+        # 实际读到的长度与提交的元数据不符，不能留下元数据错误的对象
+        minio_client.remove_object(bucket_name, object_name)
+        raise ValueError(f"Expected {size} bytes for {object_name}, read {plaintext_size}")
+    return plaintext_size, etag, digest
+
+def _store_digest(bucket_name: str, object_name: str, digest: str, plaintext_size: int, content_type,
+                  key_id: Optional[str], etag: Optional[str] = None) -> str:
+    """
+    把明文 SM3 和明文长度写入对象的用户元数据（服务端原地复制，不重新传输数据），返回新的 ETag；
+    用户元数据整体替换，密钥 ID（旧对象没有）需一并写回。
+    传入 etag 时对象已被改写则失败（PreconditionFailed），摘要不会记到新内容上
+    """
+    metadata = {
+        "Content-Type": content_type or "application/octet-stream",
+        DIGEST_METADATA: digest,
+        PLAINTEXT_SIZE_METADATA: str(plaintext_size),
+    }
+    if key_id:
+        metadata[KEY_ID_METADATA] = key_id
+    result = minio_client.copy_object(
+        bucket_name,
+        object_name,
+        CopySource(bucket_name, object_name, match_etag=etag),
+        metadata=metadata,
+        metadata_directive=REPLACE
+    )
+    return result.etag
+
+def _digest_object(bucket_name: str, object_name: str, stat, limiter=None) -> tuple:
+    """
+    读一遍对象的明文算出 SM3，以 stat 的 ETag 为条件写入元数据并同步索引，返回 (明文 SM3, 明文字节数)；
+    期间对象被改写时抛出 PreconditionFailed
+    """
+    info, chunks = _open_plaintext(bucket_name, object_name, verify=False)
+    hasher = sm3_hasher.new()
+    for chunk in chunks:
+        if limiter is not None:
+            limiter.acquire(len(chunk))
+        with phase("hash"):
+            hasher.update(chunk)
+    digest = hasher.hexdigest()
+    key_id = (stat.metadata or {}).get(KEY_ID_METADATA)
+    etag = _store_digest(bucket_name, object_name, digest, info["size"], stat.content_type, key_id, etag=stat.etag)
+    _record_write(bucket_name, object_name, stat.size, etag,
+                  content_type=stat.content_type, plaintext_size=info["size"], sm3=digest)
+    return digest, info["size"]
+
+@app.route('/upload/initiate', methods=['POST'])
+def initiate_upload():
+    """
+    创建可续传的分块上传会话
+    参数：bucket、object_name、size（文件总字节数）、content_type、chunk_size（可选）
+    """
+    bucket_name = request.args.get('bucket', DEFAULT_BUCKET)
+    object_name = request.args.get('object_name')
+    size = request.args.get('size', type=int)
+    chunk_size = request.args.get('chunk_size', type=int)
+    
+    if not object_name or size is None:
+        return jsonify({"error": "object_name and size parameters are required"}), 400
+    
+    try:
+        _ensure_bucket(bucket_name)
         
+        session = resumable_uploads.initiate(
+            minio_client, bucket_name, object_name, size,
+            content_type=request.args.get('content_type'),
+            chunk_size=chunk_size
+        )
+        return jsonify(session), 200
+    except UploadSessionError as e:
+        return jsonify({"error": str(e)}), 400
+    except S3Error as e:
+        return jsonify({"error": str(e)}), 500
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/upload/chunk', methods=['PUT'])
+def upload_chunk():
+    """
+    上传一个分块（请求体为该分块的原始字节，边读边加密，不整体缓存请求体），可多个分块并行上传；
+    已到达的分块只能以相同内容重传
+    参数：upload_id、part_number（从 1 开始）
+    """
+    upload_id = request.args.get('upload_id')
+    part_number = request.args.get('part_number', type=int)
+    
+    if not upload_id or part_number is None:
+        return jsonify({"error": "upload_id and part_number parameters are required"}), 400
+    
+    try:
+        etag = resumable_uploads.put_chunk(
+            minio_client, upload_id, part_number, request.stream, request.content_length
+        )
+        return jsonify({
+            "message": "Chunk uploaded successfully",
+            "part_number": part_number,
+            "etag": etag
+        }), 200
+    except UploadSessionError as e:
+        return jsonify({"error": str(e)}), 400
+    except S3Error as e:
+        return jsonify({"error": str(e)}), 404 if e.code == "NoSuchUpload" else 500
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/upload/status', methods=['GET'])
+def upload_status():
+    """
+    查询上传会话中已到达和缺失的分块，用于断点续传
+    """
+    upload_id = request.args.get('upload_id')
+    
+    if not upload_id:
+        return jsonify({"error": "upload_id parameter is required"}), 400
+    
+    try:
+        return jsonify(resumable_uploads.status(minio_client, upload_id)), 200
+    except UploadSessionError as e:
+        return jsonify({"error": str(e)}), 400
+    except S3Error as e:
+        return jsonify({"error": str(e)}), 404 if e.code == "NoSuchUpload" else 500
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/upload/complete', methods=['POST'])
+def complete_upload():
+    """
+    所有分块到齐后合并为最终对象。
+    分块可能乱序、并行到达，明文 SM3 在合并后读一遍对象算出，与 /upload 一样写入元数据；
+    被覆盖的对象如果是去重引用，合并成功后释放该引用
+    """
+    upload_id = request.args.get('upload_id')
+    
+    if not upload_id:
+        return jsonify({"error": "upload_id parameter is required"}), 400
+    
+    try:
+        session = resumable_uploads.decode(upload_id)
+        bucket_name, object_name = session["bucket"], session["object"]
+        previous = _previous_ref(bucket_name, object_name)
+        session = resumable_uploads.complete(minio_client, upload_id)
+        if previous is not None:
+            dedup_store.release(minio_client, bucket_name, object_name, previous[0])
+        stat = minio_client.stat_object(bucket_name, object_name)
+        digest = None
+        if stat.etag == session["etag"]:
+            try:
+                digest = _digest_object(bucket_name, object_name, stat)[0]
+            except S3Error as e:
+                # 合并之后又被并发改写，由改写方记录
+                if e.code != "PreconditionFailed":
+                    raise
         return jsonify({
             "message": "File uploaded and encrypted successfully",
-            "object": object_name
+            "bucket": bucket_name,
+            "object": object_name,
+            "sm3": digest
         }), 200
+    except UploadSessionError as e:
+        return jsonify({"error": str(e)}), 400
+    except S3Error as e:
+        return jsonify({"error": str(e)}), 404 if e.code == "NoSuchUpload" else 500
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/upload/abort', methods=['DELETE'])
+def abort_upload():
+    """
+    放弃上传会话并清理已上传的分块
+    """
+    upload_id = request.args.get('upload_id')
+    
+    if not upload_id:
+        return jsonify({"error": "upload_id parameter is required"}), 400
+    
+    try:
+        session = resumable_uploads.abort(minio_client, upload_id)
+        return jsonify({
+            "message": "Upload aborted",
+            "bucket": session["bucket"],
+            "object": session["object"]
+        }), 200
+    except UploadSessionError as e:
+        return jsonify({"error": str(e)}), 400
+    except S3Error as e:
+        return jsonify({"error": str(e)}), 404 if e.code == "NoSuchUpload" else 500
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def _read_stream_header(bucket_name: str, object_name: str):
+    """读取对象头，流式(CTR)格式返回 IV，旧的 ECB 格式返回 None"""
+    response = minio_client.get_object(bucket_name, object_name, offset=0, length=STREAM_HEADER.size)
+    try:
+        with phase("storage"):
+            header = response.read()
+    finally:
+        response.close()
+        response.release_conn()
+    if len(header) == STREAM_HEADER.size and header.startswith(STREAM_MAGIC):
+        return STREAM_HEADER.unpack(header)[2]
+    return None
+
+
+def _resolve_source(bucket_name: str, object_name: str, stat):
+    """
+    数据实际所在的位置：去重引用对象解析到去重存储桶中的数据块。
+    返回 (存储桶, 对象名, 密文大小, 明文摘要, 密钥 ID)，旧对象没有记录密钥 ID 时为 None
+    """
+    metadata = stat.metadata or {}
+    digest = metadata.get(DIGEST_METADATA)
+    if stat.size == REF_FORMAT.size:
+        ref = dedup_store.read_ref(minio_client, bucket_name, object_name)
+        if ref is not None:
+            digest = ref[0]
+            blob_name = dedup_store.blob_name(digest)
+            blob = minio_client.stat_object(dedup_store.bucket_name, blob_name)
+            return dedup_store.bucket_name, blob_name, blob.size, digest, (blob.metadata or {}).get(KEY_ID_METADATA)
+    return bucket_name, object_name, stat.size, digest, metadata.get(KEY_ID_METADATA)
+
+
+def _read_plaintext(bucket_name: str, object_name: str, key_id: Optional[str]) -> bytes:
+    """整体读取并解密对象（CTR 或旧的 ECB 格式），只用于大小受限的对象"""
+    service = key_ring.get(key_id)
+    response = minio_client.get_object(bucket_name, object_name)
+    try:
+        with phase("storage"):
+            data = response.read()
+    finally:
+        response.close()
+        response.release_conn()
+    with phase("decrypt"):
+        if len(data) >= STREAM_HEADER.size and data.startswith(STREAM_MAGIC):
+            iv = STREAM_HEADER.unpack_from(data)[2]
+            return service.crypt_ctr(data[STREAM_HEADER.size:], iv)
+        return service.decrypt(data)
+
+
+def _iter_decrypted(response, service, iv: bytes, offset: int, tee=None):
+    """
+    用 service（对象所用密钥的加密服务）边读边解密 MinIO 对象流，offset 为这段密文对应的明文起始偏移；
+    传入 tee 时同时把密文写入磁盘缓存，完整读完才提交
+    """
+    cipher = service.ctr_stream(iv, offset)
+    completed = False
+    try:
+        for chunk in timed_iter(response.stream(STREAM_CHUNK_SIZE), "storage"):
+            if tee is not None:
+                tee.write(chunk)
+            with phase("decrypt"):
+                plaintext = cipher.update(chunk)
+            yield plaintext
+        completed = True
+    finally:
+        response.close()
+        response.release_conn()
+        if tee is not None:
+            tee.commit() if completed else tee.abort()
+
+
+def _requested_range(stat, etag: str, total: int):
+    """
+    解析 Range / If-Range，返回 (start, stop)；
+    无 Range、多段 Range 或 If-Range 不匹配时返回 None（按完整文件响应），
+    范围无法满足时抛出 RequestedRangeNotSatisfiable
+    """
+    byte_range = request.range
+    if byte_range is None or len(byte_range.ranges) != 1:
+        return None
+    if_range = request.if_range
+    if if_range.etag and if_range.etag != etag:
+        return None
+    if if_range.date and stat.last_modified and stat.last_modified.replace(microsecond=0) > if_range.date:
+        return None
+    bounds = byte_range.range_for_length(total)
+    if bounds is None:
+        raise RequestedRangeNotSatisfiable(length=total)
+    return bounds
+
+
+class IntegrityError(Exception):
+    """解密后的明文与上传时记录的 SM3 不一致"""
+
+
+def _iter_verified(chunks, digest: str, bucket_name: str, object_name: str):
+    """
+    边输出边计算明文 SM3。最后一块在校验通过后才输出，
+    不一致时中断响应（并丢弃该对象的缓存内容），客户端会收到长度不足的响应而不是错误的完整文件
+    """
+    hasher = sm3_hasher.new()
+    previous = None
+    for chunk in chunks:
+        with phase("hash"):
+            hasher.update(chunk)
+        if previous is not None:
+            yield previous
+        previous = chunk
+    if hasher.hexdigest() != digest:
+        app.logger.error("SM3 mismatch for %s: expected %s, got %s", object_name, digest, hasher.hexdigest())
+        content_cache.invalidate(bucket_name, object_name)
+        raise IntegrityError(f"SM3 mismatch for {object_name}")
+    if previous is not None:
+        yield previous
+
+
+def _not_modified(stat, etag: str):
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.last_modified = stat.last_modified
+    return response
+
+
+def _download_response(body, stat, etag: str, digest, object_name: str, total: int, bounds):
+    """构造（部分）下载响应，附带断点续传和缓存校验所需的头"""
+    if bounds is None:
+        response = Response(body, status=200, mimetype=stat.content_type or "application/octet-stream", direct_passthrough=True)
+        response.content_length = total
+    else:
+        start, stop = bounds
+        response = Response(body, status=206, mimetype=stat.content_type or "application/octet-stream", direct_passthrough=True)
+        response.content_length = stop - start
+        response.content_range = ContentRange("bytes", start, stop, total)
+    response.accept_ranges = "bytes"
+    response.set_etag(etag)
+    response.last_modified = stat.last_modified
+    if digest:
+        # RFC 3230 实例摘要：始终是完整明文的摘要，与本次返回的范围无关
+        response.headers["Digest"] = "sm3=" + base64.b64encode(bytes.fromhex(digest)).decode()
+    _set_attachment(response, object_name)
+    return response
+
+
+def _set_attachment(response, filename: str):
+    """Content-Disposition: attachment，非 ASCII 文件名按 RFC 6266 附带 UTF-8 版本"""
+    try:
+        filename.encode("ascii")
+        disposition = {"filename": filename}
+    except UnicodeEncodeError:
+        disposition = {
+            "filename": unicodedata.normalize("NFKD", filename).encode("ascii", "ignore").decode("ascii"),
+            "filename*": "UTF-8''" + quote(filename, safe="!#$&+^`|~"),
+        }
+    response.headers.set("Content-Disposition", "attachment", **disposition)
+
+
+def _cached_download(entry, bucket_name: str, object_name: str, verify: bool):
+    """用内容缓存中的条目响应下载，磁盘层文件已被淘汰（或其密钥已被移除）时返回 None"""
+    etag = entry.digest or entry.etag
+    if request.if_none_match.contains(etag):
+        return _not_modified(entry, etag)
+    bounds = _requested_range(entry, etag, entry.size)
+    start, stop = bounds if bounds is not None else (0, entry.size)
+    if entry.data is not None:
+        # 内存层的明文放入缓存前已校验过
+        body = [entry.data[start:stop]]
+    else:
+        try:
+            service = key_ring.get(entry.key_id)
+        except UnknownKeyError:
+            return None
+        reader = content_cache.open(entry, start, stop)
+        if reader is None:
+            return None
+        body = _iter_decrypted(reader, service, entry.iv, start)
+        if verify and entry.digest and bounds is None:
+            body = _iter_verified(body, entry.digest, bucket_name, object_name)
+    return _download_response(body, entry, etag, entry.digest, object_name, entry.size, bounds)
+
+
 @app.route('/download', methods=['GET'])
 def download_file():
     """
-    从MinIO下载文件并解密
+    从MinIO流式下载文件并边读边解密，支持 Range / If-Range 断点续传。
+    上传时记录了明文 SM3 的对象以摘要作为 ETag 并返回 Digest 头，支持 If-None-Match；
+    完整下载时边输出边校验摘要，verify=0 可跳过校验（供可信的内部调用方使用）
     """
     bucket_name = request.args.get('bucket', DEFAULT_BUCKET)
     object_name = request.args.get('object_name')
+    verify = request.args.get('verify', '1' if DOWNLOAD_VERIFY else '0') in ('1', 'true')
     
     if not object_name:
         return jsonify({"error": "object_name parameter is required"}), 400
     
     try:
-        # 获取加密的文件数据
-        response = minio_client.get_object(bucket_name, object_name)
-        encrypted_data = response.read()
-        
-        # 解密文件数据
-        decrypted_data = encryption_service.decrypt(encrypted_data)
-        
-        # 创建文件流
-        file_stream = io.BytesIO(decrypted_data)
-        file_stream.seek(0)
-        
-        # 发送解密后的文件
-        return send_file(
-            file_stream,
-            as_attachment=True,
-            download_name=object_name,
-            mimetype=response.headers.get('content-type')
-        )
+        # 最近确认过的缓存条目直接使用，否则先用 stat 确认 ETag 未变
+        entry = content_cache.get(bucket_name, object_name) if content_cache.enabled else None
+        stat = None
+        if entry is None:
+            stat = minio_client.stat_object(bucket_name, object_name)
+            if content_cache.enabled:
+                entry = content_cache.get(bucket_name, object_name, stat.etag)
+        if entry is not None:
+            response = _cached_download(entry, bucket_name, object_name, verify)
+            if response is not None:
+                return response
+            stat = stat or minio_client.stat_object(bucket_name, object_name)
+
+        # 去重引用对象：数据在去重存储桶的数据块中，响应头仍以引用对象为准
+        source_bucket, source_name, size, digest, key_id = _resolve_source(bucket_name, object_name, stat)
+        service = key_ring.get(key_id)
+        # 明文摘要是比密文 ETag 更好的强校验值：内容相同则 ETag 相同
+        etag = digest or stat.etag
+        if request.if_none_match.contains(etag):
+            return _not_modified(stat, etag)
+        iv = None
+        if size >= STREAM_HEADER.size:
+            iv = _read_stream_header(source_bucket, source_name)
+
+        if iv is None:
+            # 旧格式（整文件 ECB）无法按块定位，只能整体解密后再截取
+            response = minio_client.get_object(source_bucket, source_name)
+            try:
+                with phase("storage"):
+                    data = response.read()
+            finally:
+                response.close()
+                response.release_conn()
+            with phase("decrypt"):
+                decrypted_data = service.decrypt(data)
+            total = len(decrypted_data)
+            if content_cache.tier_for(total) == "memory":
+                content_cache.put(bucket_name, object_name, _cache_meta(stat, total, digest, key_id), decrypted_data)
+            bounds = _requested_range(stat, etag, total)
+            body = [decrypted_data if bounds is None else decrypted_data[bounds[0]:bounds[1]]]
+            return _download_response(body, stat, etag, digest, object_name, total, bounds)
+
+        # CTR 格式下明文偏移与密文偏移一一对应（仅相差对象头），只拉取需要的字节
+        total = size - STREAM_HEADER.size
+        bounds = _requested_range(stat, etag, total)
+        start, stop = bounds if bounds is not None else (0, total)
+        if stop > start:
+            # 只有完整下载才写入缓存：小对象缓存校验后的明文，较大的对象缓存密文
+            tier = content_cache.tier_for(total) if bounds is None else None
+            tee = None
+            if tier == "disk":
+                tee = content_cache.disk_writer(bucket_name, object_name, _cache_meta(stat, total, digest, key_id), iv)
+            response = minio_client.get_object(
+                source_bucket, source_name,
+                offset=STREAM_HEADER.size + start,
+                length=stop - start
+            )
+            body = _iter_decrypted(response, service, iv, start, tee)
+            # 只有完整下载才能校验整体摘要
+            if verify and digest and bounds is None:
+                body = _iter_verified(body, digest, bucket_name, object_name)
+            if tier == "memory" and (verify or not digest):
+                body = content_cache.collect(bucket_name, object_name, _cache_meta(stat, total, digest, key_id), body)
+        else:
+            body = []
+        return _download_response(body, stat, etag, digest, object_name, total, bounds)
         
+    except RequestedRangeNotSatisfiable as e:
+        return jsonify({"error": "Requested range not satisfiable"}), 416, {
+            "Content-Range": f"bytes */{e.length}"
+        }
+    except S3Error as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def _open_plaintext(bucket_name: str, object_name: str, verify: bool):
+    """
+    打开对象的明文流，返回 ({"size", "last_modified", "sm3"}, 明文分块迭代器)。
+    对象头与数据在同一次请求中读取；旧的 ECB 格式只能整体解密。
+    sm3 是边读边校验的明文摘要（不一致时迭代器在输出最后一块之前抛出 IntegrityError），不校验时为 None
+    """
+    stat = minio_client.stat_object(bucket_name, object_name)
+    source_bucket, source_name, size, digest, key_id = _resolve_source(bucket_name, object_name, stat)
+    service = key_ring.get(key_id)
+    response = minio_client.get_object(source_bucket, source_name)
+    try:
+        with phase("storage"):
+            header = response.read(STREAM_HEADER.size)
+        if len(header) == STREAM_HEADER.size and header.startswith(STREAM_MAGIC):
+            chunks = _iter_decrypted(response, service, STREAM_HEADER.unpack(header)[2], 0)
+            verified = digest if verify else None
+            if verified:
+                chunks = _iter_verified(chunks, digest, bucket_name, object_name)
+            return {"size": size - STREAM_HEADER.size, "last_modified": stat.last_modified, "sm3": verified}, chunks
+        with phase("storage"):
+            data = header + response.read()
+        with phase("decrypt"):
+            data = service.decrypt(data)
+    except BaseException:
+        response.close()
+        response.release_conn()
+        raise
+    response.close()
+    response.release_conn()
+    return {"size": len(data), "last_modified": stat.last_modified, "sm3": None}, iter([data])
+
+
+@app.route('/download-archive', methods=['GET', 'POST'])
+def download_archive():
+    """
+    把文件夹和/或多个对象打包成 ZIP 流式下载。
+    GET 参数 prefix、key 均可重复；POST 时也可提交 JSON {"prefixes": [...], "keys": [...], "name": "..."}。
+    以 / 结尾的 key 按文件夹处理。归档内路径相对于所选内容的公共上级目录；
+    对象在后台按顺序预取并边解密边写入 ZIP，不落临时文件。
+    compress=1 时使用 deflate 压缩（默认只存储，常见的大文件本身已经压缩过）。
+    响应开始后才读取失败的文件：尚未输出数据的被跳过，输出到一半的以截断内容结束并改名为 "原名.incomplete"，
+    失败原因都写入归档中的 _errors.txt（见 archive.stream_zip）
+    """
+    body = request.get_json(silent=True) or {}
+    bucket_name = body.get('bucket') or request.args.get('bucket', DEFAULT_BUCKET)
+    keys = list(body.get('keys') or []) + request.args.getlist('key')
+    prefixes = list(body.get('prefixes') or []) + request.args.getlist('prefix')
+    prefixes = [prefix if prefix.endswith('/') else prefix + '/' for prefix in prefixes]
+    prefixes += [key for key in keys if key.endswith('/')]
+    keys = [key for key in keys if key and not key.endswith('/')]
+    verify = request.args.get('verify', '1' if DOWNLOAD_VERIFY else '0') in ('1', 'true')
+    compress = str(body.get('compress', request.args.get('compress', '0'))) in ('1', 'true')
+
+    if not keys and not prefixes:
+        return jsonify({"error": "prefix or key parameter is required"}), 400
+
+    try:
+        # 先列出全部对象名再开始输出，存储桶不存在等错误仍能返回正常的状态码
+        names = list(list_prefixes(minio_client, bucket_name, prefixes)) + keys
+        entries = archive_entries(names, common_base(prefixes + keys))
+        if not entries:
+            return jsonify({"error": "No objects found"}), 404
     except S3Error as e:
         return jsonify({"error": str(e)}), 404
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+    selected = prefixes + keys
+    name = body.get('name') or request.args.get('name')
+    if not name:
+        name = (selected[0].rstrip('/').rsplit('/', 1)[-1] if len(selected) == 1 else "") or "archive"
+    if not name.lower().endswith('.zip'):
+        name += '.zip'
+
+    chunks = stream_zip(
+        entries,
+        lambda object_name: _open_plaintext(bucket_name, object_name, verify),
+        prefetch=ARCHIVE_PREFETCH,
+        queue_size=ARCHIVE_READ_AHEAD,
+        compression=zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED,
+        # 流式打包更看重速度，使用最快的压缩级别
+        compresslevel=1 if compress else None
+    )
+    response = Response(chunks, status=200, mimetype="application/zip", direct_passthrough=True)
+    _set_attachment(response, name)
+    return response
+
+
+@app.route('/preview', methods=['GET'])
+def preview_file():
+    """
+    图片缩略图 / PDF 首页预览（JPEG），size 为长边像素，默认 256（取整到支持的尺寸）。
+    预览图首次请求时生成并加密保存为派生对象，之后直接读取；
+    ETag 由源文件内容标识和尺寸组成，浏览器在 PREVIEW_MAX_AGE 秒内直接使用本地缓存
+    """
+    bucket_name = request.args.get('bucket', DEFAULT_BUCKET)
+    object_name = request.args.get('object_name')
+    if not object_name:
+        return jsonify({"error": "object_name parameter is required"}), 400
+    try:
+        size = preview_size(int(request.args.get('size', 256)))
+    except ValueError:
+        return jsonify({"error": "size must be an integer"}), 400
+
+    try:
+        stat = minio_client.stat_object(bucket_name, object_name)
+        kind = preview_kind(object_name, stat.content_type)
+        if kind is None:
+            return jsonify({"error": "Preview is not supported for this file type"}), 415
+        source_bucket, source_name, source_size, digest, key_id = _resolve_source(bucket_name, object_name, stat)
+        source_key = digest or stat.etag
+        etag = f"{source_key}-{size}"
+        if request.if_none_match.contains(etag):
+            response = _not_modified(stat, etag)
+        else:
+            with preview_store.lock(source_key, size):
+                data = preview_store.get(minio_client, source_key, size)
+                if data is None:
+                    if source_size > PREVIEW_MAX_SOURCE + STREAM_HEADER.size:
+                        return jsonify({"error": "File is too large to preview"}), 413
+                    data = render_preview(_read_plaintext(source_bucket, source_name, key_id), kind, size)
+                    preview_store.put(minio_client, source_key, size, data)
+            response = Response(data, status=200, mimetype="image/jpeg")
+            response.set_etag(etag)
+            response.last_modified = stat.last_modified
+        response.cache_control.private = True
+        response.cache_control.max_age = PREVIEW_MAX_AGE
+        return response
+    except PreviewUnavailable as e:
+        return jsonify({"error": str(e)}), 501
+    except PreviewError as e:
+        return jsonify({"error": str(e)}), 422
+    except S3Error as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def _cache_meta(stat, total: int, digest, key_id) -> dict:
+    """内容缓存条目的元数据，etag 为 MinIO 中对象本身的 ETag，用于确认缓存是否过期"""
+    return {
+        "etag": stat.etag,
+        "size": total,
+        "content_type": stat.content_type,
+        "last_modified": stat.last_modified,
+        "digest": digest,
+        "key_id": key_id,
+    }
+
+
+def _invalidate_listing(bucket_name: str, *object_names: str):
+    """
+    对象增删改后清除受影响目录（对象所在目录及其所有上级目录，含文件夹统计）的列表缓存，
+    这些目录的存在性缓存（删除最后一个对象后目录即不存在），以及这些对象的内容缓存
+    """
+    affected = lambda key: key[0] == bucket_name and any(name.startswith(key[1]) for name in object_names)
+    list_cache.invalidate(affected)
+    folder_cache.invalidate(affected)
+    content_cache.invalidate(bucket_name, *object_names)
+
+
+def _bucket_exists(bucket_name: str) -> bool:
+    """存储桶是否存在，存在的结果缓存 EXISTS_CACHE_TTL 秒"""
+    if bucket_cache.get(bucket_name):
+        return True
+    exists = minio_client.bucket_exists(bucket_name)
+    if exists:
+        bucket_cache.set(bucket_name, True)
+    return exists
+
+
+def _ensure_bucket(bucket_name: str):
+    """确保存储桶存在，不存在则创建"""
+    if not _bucket_exists(bucket_name):
+        try:
+            minio_client.make_bucket(bucket_name)
+        except S3Error as e:
+            # 并发请求可能已经创建了该存储桶
+            if e.code not in ("BucketAlreadyOwnedByYou", "BucketAlreadyExists"):
+                raise
+        bucket_cache.set(bucket_name, True)
+
+
+def _forget_bucket(bucket_name: str, error: Exception):
+    """存储桶在外部被删除时清除其缓存"""
+    if isinstance(error, S3Error) and error.code == "NoSuchBucket":
+        bucket_cache.pop(bucket_name)
+
+
+def _folder_exists(bucket_name: str, folder: str) -> bool:
+    """文件夹（前缀下有任何对象）是否存在，存在的结果缓存到其下对象被删除或移走为止"""
+    if folder_cache.get((bucket_name, folder)):
+        return True
+    exists = next(iter(minio_client.list_objects(bucket_name, prefix=folder)), None) is not None
+    if exists:
+        folder_cache.set((bucket_name, folder), True)
+    return exists
+
+
+def _record_write(bucket_name: str, object_name: str, size: int, etag, content_type=None, plaintext_size=None, sm3=None):
+    """写入对象后同步列表缓存和元数据索引"""
+    _invalidate_listing(bucket_name, object_name)
+    if metadata_index:
+        metadata_index.upsert(bucket_name, object_name, size, etag,
+                              content_type=content_type, plaintext_size=plaintext_size, sm3=sm3)
+
+
+def _record_delete(bucket_name: str, *object_names: str):
+    _invalidate_listing(bucket_name, *object_names)
+    if metadata_index:
+        metadata_index.delete(bucket_name, *object_names)
+
+
+def _record_rename(bucket_name: str, source_name: str, target_name: str):
+    _invalidate_listing(bucket_name, source_name, target_name)
+    if metadata_index:
+        metadata_index.rename(bucket_name, source_name, target_name)
+
+
+def _after_move_batch(bucket_name: str, moved: list):
+    """文件夹移动每批复制完成后：迁移去重引用标记，同步列表缓存和元数据索引"""
+    for source_name, target_name, size in moved:
+        if size == REF_FORMAT.size:
+            ref = dedup_store.read_ref(minio_client, bucket_name, source_name)
+            if ref is not None:
+                dedup_store.rename(minio_client, bucket_name, source_name, target_name, ref[0])
+    pairs = [(source_name, target_name) for source_name, target_name, _ in moved]
+    _invalidate_listing(bucket_name, *(name for pair in pairs for name in pair))
+    if metadata_index:
+        metadata_index.rename_many(bucket_name, pairs)
+
+
+def _object_exists(bucket_name: str, object_name: str) -> bool:
+    """对象是否存在：索引已就绪时查本地索引，否则 stat MinIO"""
+    if metadata_index and metadata_index.is_ready(bucket_name):
+        return metadata_index.get(bucket_name, object_name) is not None
+    try:
+        minio_client.stat_object(bucket_name, object_name)
+        return True
+    except S3Error as e:
+        if e.code == "NoSuchKey":
+            return False
+        raise
+
+
+def _encode_list_token(after: str, offset: int) -> str:
+    payload = json.dumps({"after": after, "offset": offset}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+def _decode_list_token(token: str) -> tuple:
+    """续页令牌 -> (上一页的最后一项, 下一页的起始偏移量)"""
+    state = json.loads(base64.urlsafe_b64decode(token.encode()))
+    after, offset = state["after"], int(state["offset"])
+    if not isinstance(after, str) or offset < 0:
+        raise ValueError("Invalid continuation_token")
+    return after, offset
+
+
+def _list_start(items: list, after: str, offset: int, by_name: bool) -> int:
+    """
+    上一页最后一项之后的下标。按名称排序（文件夹在前）时二分查找，该项已被删除也能接上；
+    其他排序先看偏移量处是否仍是该项，否则查找，找不到时退回偏移量
+    """
+    if by_name:
+        return bisect.bisect_right(items, (not after.endswith('/'), after), key=lambda x: (not x.is_folder, x.name))
+    if 0 < offset <= len(items) and items[offset - 1].name == after:
+        return offset
+    for index, item in enumerate(items):
+        if item.name == after:
+            return index + 1
+    return offset
+
+
 @app.route('/list', methods=['GET'])
 def list_files():
     """
     列出存储桶中指定路径下的文件和文件夹
+    可选参数：
+        limit               每页条数，不传则返回全部
+        continuation_token  上一页返回的 next_continuation_token
+        sort                name / size / last_modified（文件夹始终在前）
+        order               asc / desc
+        q                   名称包含的关键字（不区分大小写）
+        type                只返回 file 或 folder
+        aggregate           为 1 时统计每个子文件夹的总大小(size)和文件数(count)
     返回结构：
     {
         "bucket": "bucket-name",
@@ -130,68 +1081,140 @@ def list_files():
         "files": [
             {"name": "file.txt", "size": 123, "last_modified": "2023-01-01T00:00:00", "type": "file"},
             {"name": "subfolder/", "size": 0, "last_modified": null, "type": "folder"}
-        ]
+        ],
+        "total": 2,
+        "is_truncated": false,
+        "next_continuation_token": null
     }
+    按名称升序分页（传 limit）且目录列表不在缓存中时只读取本页，total 为 null
     """
     bucket_name = request.args.get('bucket', DEFAULT_BUCKET)
     prefix = request.args.get('prefix', '')
+    limit = request.args.get('limit', type=int)
+    token = request.args.get('continuation_token')
+    sort = request.args.get('sort', 'name')
+    order = request.args.get('order', 'asc')
+    keyword = request.args.get('q', '').lower()
+    item_type = request.args.get('type')
+    aggregate = request.args.get('aggregate') in ('1', 'true')
+    
+    if sort not in ('name', 'size', 'last_modified') or order not in ('asc', 'desc'):
+        return jsonify({"error": "sort must be name/size/last_modified and order asc/desc"}), 400
+    if limit is not None and limit <= 0:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+    
+    after, offset = None, 0
+    if token:
+        try:
+            after, offset = _decode_list_token(token)
+        except (ValueError, KeyError, TypeError):
+            return jsonify({"error": "Invalid continuation_token"}), 400
+    
+    def matches(x):
+        return (not keyword or keyword in x.name[len(prefix):].lower()) and (not item_type or x.type == item_type)
     
     try:
-        if not minio_client.bucket_exists(bucket_name):
-            return jsonify({"error": "Bucket does not exist"}), 404
-        
-        # 获取对象列表（非递归）
-        objects = minio_client.list_objects(bucket_name, prefix=prefix, recursive=False)
-
-        items = []
-        seen_folders = set()  # 用于去重文件夹
-        
-        for obj in objects:
-            # 处理文件夹（以/结尾的对象）
-            if obj.object_name.endswith('/'):
-                folder_name = obj.object_name
-                # 跳过与当前 prefix 完全匹配的文件夹（不显示正在列出的目录本身）
-                if folder_name == prefix:
-                    continue
-                if folder_name not in seen_folders:
-                    items.append({
-                        "name": folder_name,
-                        "size": 0,
-                        "last_modified": None,
-                        "type": "folder"
-                    })
-                    seen_folders.add(folder_name)
-                continue
-                
-            # 处理普通文件
-            # 如果是嵌套在子目录中的文件，提取其直接父目录
-            if '/' in obj.object_name[len(prefix):]:
-                dir_path = prefix + obj.object_name[len(prefix):].split('/')[0] + '/'
-                if dir_path not in seen_folders:
-                    items.append({
-                        "name": dir_path,
-                        "size": 0,
-                        "last_modified": None,
-                        "type": "folder"
-                    })
-                    seen_folders.add(dir_path)
-                continue
+        # 热点目录直接命中缓存，不访问 MinIO
+        cache_key = (bucket_name, prefix, aggregate)
+        indexed = metadata_index and metadata_index.is_ready(bucket_name) and (not prefix or prefix.endswith('/'))
+        items = None if indexed else list_cache.get(cache_key)
+        by_name = sort == 'name' and order == 'asc'
+        if items is None and limit is not None and by_name and not aggregate:
+            # 按名称分页：从上一页最后一项之后逐项读取（本地索引或 MinIO），凑够一页即停止，不列出整个目录；
+            # 此时不知道总数，total 为 null
+            if indexed:
+                iterate = lambda kind, start: metadata_index.iter_directory(bucket_name, prefix, kind, start)
+            else:
+                if not _bucket_exists(bucket_name):
+                    return jsonify({"error": "Bucket does not exist"}), 404
+                iterate = lambda kind, start: iter_directory(minio_client, bucket_name, prefix, kind, start)
+            page, more = page_directory(
+                iterate, limit, after, kinds=(item_type,) if item_type else ("folder", "file"), match=matches
+            )
+            total = None
+            stop = offset + len(page)
+        else:
+            if indexed:
+                # 本地索引就绪时直接查 SQLite
+                items = metadata_index.list_directory(bucket_name, prefix, aggregate=aggregate)
+            elif items is None:
+                if not _bucket_exists(bucket_name):
+                    return jsonify({"error": "Bucket does not exist"}), 404
+                items = list_directory(minio_client, bucket_name, prefix, aggregate=aggregate)
+                list_cache.set(cache_key, items)
             
-            # 普通文件
-            items.append({
-                "name": obj.object_name,
-                "size": obj.size,
-                "last_modified": obj.last_modified.isoformat() if obj.last_modified else None,
-                "type": "file"
-            })
+            # 过滤与排序都在缓存的列表上完成，不再访问 MinIO
+            if keyword or item_type:
+                items = [x for x in items if matches(x)]
+            if not by_name:
+                def sort_key(x):
+                    value = getattr(x, sort)
+                    return value is None, value if value is not None else 0, x.name
+                items = sorted(items, key=sort_key, reverse=order == 'desc')
+                items.sort(key=lambda x: not x.is_folder)
+            
+            total = len(items)
+            start = _list_start(items, after, offset, by_name) if token else 0
+            stop = total if limit is None else start + limit
+            page = items[start:stop]
+            more = stop < total
+        next_token = _encode_list_token(page[-1].name, stop) if page and more else None
         
-        # 按类型排序：文件夹在前，文件在后
-        items.sort(key=lambda x: (x["type"] != "folder", x["name"]))
+        return jsonify({
+            "bucket": bucket_name,
+            "prefix": prefix,
+            "files": [x.to_dict() for x in page],
+            "total": total,
+            "is_truncated": next_token is not None,
+            "next_continuation_token": next_token
+        }), 200
+        
+    except S3Error as e:
+        _forget_bucket(bucket_name, e)
+        return jsonify({"error": str(e)}), 500
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/search', methods=['GET'])
+def search_files():
+    """
+    按名称搜索文件和文件夹（不区分大小写）
+    参数：q（关键字）、bucket、prefix（限定搜索范围）、limit（默认 100）
+    启用元数据索引时直接查询本地索引，否则递归遍历 MinIO
+    """
+    bucket_name = request.args.get('bucket', DEFAULT_BUCKET)
+    prefix = request.args.get('prefix', '')
+    keyword = request.args.get('q', '')
+    limit = request.args.get('limit', 100, type=int)
+    
+    if not keyword:
+        return jsonify({"error": "q parameter is required"}), 400
+    
+    try:
+        if metadata_index and metadata_index.is_ready(bucket_name):
+            items = metadata_index.search(bucket_name, keyword, prefix=prefix, limit=limit)
+        else:
+            if not _bucket_exists(bucket_name):
+                return jsonify({"error": "Bucket does not exist"}), 404
+            items = []
+            folders = set()
+            lowered = keyword.lower()
+            for obj in minio_client.list_objects(bucket_name, prefix=prefix, recursive=True):
+                # 对象路径中隐含的目录也参与匹配
+                for path in ancestors_of(obj.object_name):
+                    if path.startswith(prefix) and path not in folders and lowered in path.lower():
+                        folders.add(path)
+                        items.append(DirectoryEntry(path, "folder"))
+                if not obj.is_dir and lowered in obj.object_name.lower():
+                    items.append(DirectoryEntry(obj.object_name, "file", obj.size, obj.last_modified))
+            items.sort(key=lambda x: (not x.is_folder, x.name))
+            items = items[:limit]
         
         return jsonify({
             "bucket": bucket_name,
             "prefix": prefix,
-            "files": items
+            "q": keyword,
+            "files": [x.to_dict() for x in items]
         }), 200
         
     except S3Error as e:
@@ -211,16 +1234,19 @@ def delete_file():
         return jsonify({"error": "object_name parameter is required"}), 400
     
     try:
-        # 检查文件是否存在
+        # 读取对象头判断是否为去重引用，同时检查文件是否存在
         try:
-            minio_client.stat_object(bucket_name, object_name)
+            ref = dedup_store.read_ref(minio_client, bucket_name, object_name, missing_ok=False)
         except S3Error as e:
             if e.code == "NoSuchKey":
                 return jsonify({"error": f"File {object_name} does not exist"}), 404
             raise
         
-        # 删除文件
+        # 删除文件，去重引用同时释放引用计数
         minio_client.remove_object(bucket_name, object_name)
+        if ref is not None:
+            dedup_store.release(minio_client, bucket_name, object_name, ref[0])
+        _record_delete(bucket_name, object_name)
         
         return jsonify({
             "message": "File deleted successfully",
@@ -233,6 +1259,60 @@ def delete_file():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/batch-delete', methods=['POST'])
+def batch_delete():
+    """
+    批量删除文件，使用 MinIO 多对象删除（每批最多 1000 个）
+    JSON 请求体：bucket、keys（对象名列表）、prefixes（递归删除的文件夹列表）
+    返回每个对象的删除结果；keys 中不存在的对象记为 not_found（与 /delete 返回 404 一致），不计入 deleted
+    """
+    body = request.get_json(silent=True) or {}
+    bucket_name = body.get('bucket', request.args.get('bucket', DEFAULT_BUCKET))
+    keys = body.get('keys', [])
+    prefixes = body.get('prefixes', [])
+    
+    if not isinstance(keys, list) or not isinstance(prefixes, list) or \
+            not all(isinstance(x, str) and x for x in keys + prefixes):
+        return jsonify({"error": "keys and prefixes must be lists of non-empty strings"}), 400
+    if not keys and not prefixes:
+        return jsonify({"error": "keys or prefixes is required"}), 400
+    
+    try:
+        if not _bucket_exists(bucket_name):
+            return jsonify({"error": "Bucket does not exist"}), 404
+        
+        # 对象名 -> 大小；显式指定的键先 stat，区分出不存在的对象
+        objects = stat_sizes(minio_client, bucket_name, dict.fromkeys(keys), max_workers=MOVE_CONCURRENCY)
+        objects.update(list_prefixes(minio_client, bucket_name, [p.rstrip('/') + '/' for p in prefixes]))
+        missing = [name for name in dict.fromkeys(keys) if name not in objects]
+        refs = dedup_store.find_refs(minio_client, bucket_name, objects, max_workers=MOVE_CONCURRENCY)
+        
+        names = list(objects)
+        errors = remove_objects(minio_client, bucket_name, names)
+        deleted = [name for name in names if name not in errors]
+        for name in deleted:
+            if name in refs:
+                dedup_store.release(minio_client, bucket_name, name, refs[name])
+        if deleted:
+            _record_delete(bucket_name, *deleted)
+        
+        return jsonify({
+            "bucket": bucket_name,
+            "deleted": len(deleted),
+            "failed": len(errors),
+            "not_found": len(missing),
+            "results": [
+                {"name": name, "status": "error", "error": errors[name]} if name in errors
+                else {"name": name, "status": "deleted"}
+                for name in names
+            ] + [{"name": name, "status": "not_found"} for name in missing]
+        }), 200
+        
+    except S3Error as e:
+        return jsonify({"error": str(e)}), 500
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/rename', methods=['POST'])
 def rename_file():
     """
@@ -249,31 +1329,26 @@ def rename_file():
         return jsonify({"error": "source and target names are the same"}), 400
     
     try:
-        # 检查源文件是否存在
+        # 读取源对象头判断是否为去重引用，同时检查源文件是否存在
         try:
-            minio_client.stat_object(bucket_name, source_name)
+            ref = dedup_store.read_ref(minio_client, bucket_name, source_name, missing_ok=False)
         except S3Error as e:
             if e.code == "NoSuchKey":
                 return jsonify({"error": f"Source file {source_name} does not exist"}), 404
             raise
         
         # 检查目标文件是否已存在
-        try:
-            minio_client.stat_object(bucket_name, target_name)
+        if _object_exists(bucket_name, target_name):
             return jsonify({"error": f"Target file {target_name} already exists"}), 409
-        except S3Error as e:
-            if e.code != "NoSuchKey":
-                raise
         
-        # 复制文件到新名称
-        minio_client.copy_object(
-            bucket_name,
-            target_name,
-            CopySource(bucket_name, source_name)  # 使用CopySource类
-        )
+        # 复制文件到新名称，元数据一并带过去（去重引用只复制引用对象本身）
+        copy_with_metadata(minio_client, bucket_name, target_name, bucket_name, source_name)
         
         # 删除原文件
         minio_client.remove_object(bucket_name, source_name)
+        if ref is not None:
+            dedup_store.rename(minio_client, bucket_name, source_name, target_name, ref[0])
+        _record_rename(bucket_name, source_name, target_name)
         
         return jsonify({
             "message": "File renamed successfully",
@@ -287,6 +1362,308 @@ def rename_file():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
+@app.route('/move', methods=['POST'])
+def move_folder():
+    """
+    在服务端移动（重命名）整个文件夹，后台并发复制后批量删除源对象
+    参数：bucket、source（源文件夹）、target（目标文件夹）、
+    overwrite（目标文件夹非空时是否合并覆盖，中断后重新发起时需要指定）
+    返回任务信息，进度通过 /move/status 查询
+    """
+    bucket_name = request.args.get('bucket', DEFAULT_BUCKET)
+    source = request.args.get('source', '')
+    target = request.args.get('target', '')
+    overwrite = request.args.get('overwrite', '0') in ('1', 'true')
+    
+    if not source or not target:
+        return jsonify({"error": "source and target parameters are required"}), 400
+    
+    source = source.rstrip('/') + '/'
+    target = target.rstrip('/') + '/'
+    if source == target:
+        return jsonify({"error": "source and target folders are the same"}), 400
+    if target.startswith(source):
+        return jsonify({"error": "Cannot move a folder into itself"}), 400
+    
+    try:
+        if not _bucket_exists(bucket_name):
+            return jsonify({"error": "Bucket does not exist"}), 404
+        if not _folder_exists(bucket_name, source):
+            return jsonify({"error": f"Folder {source} does not exist"}), 404
+        if not overwrite and _folder_exists(bucket_name, target):
+            return jsonify({"error": f"Target folder {target} already exists"}), 409
+        
+        # 同一源和目标已有任务在排队或运行时直接返回该任务
+        job = job_queue.submit("move", {"bucket": bucket_name, "source": source, "target": target}, unique=True)
+        return jsonify(_move_status(job)), 202
+        
+    except S3Error as e:
+        return jsonify({"error": str(e)}), 500
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/move/status', methods=['GET'])
+def move_status():
+    """
+    查询文件夹移动任务的进度
+    """
+    job = job_queue.get(request.args.get('job_id', ''))
+    if job is None or job["type"] != "move":
+        return jsonify({"error": "Move job not found"}), 404
+    return jsonify(_move_status(job)), 200
+
+
+def _move_status(job: dict) -> dict:
+    """/move 与 /move/status 沿用原来的返回格式，排队中（含等待重试）的任务也报告为 running"""
+    params, progress = job["params"], job["progress"]
+    return {
+        "job_id": job["job_id"],
+        "bucket": params["bucket"],
+        "source": params["source"],
+        "target": params["target"],
+        "state": "running" if job["state"] in ACTIVE_STATES else job["state"],
+        "copied": progress.get("copied", 0),
+        "deleted": progress.get("deleted", 0),
+        "failed": [{"name": name, "error": error} for name, error in progress.get("failed", {}).items()],
+        "error": job["error"],
+        "elapsed": job["elapsed"] or 0,
+    }
+
+
+def _for_each_object(job, params: dict, process) -> dict:
+    """
+    按名称顺序对前缀下的每个对象（不含文件夹占位对象）并发执行 process(对象名, 限速器)，
+    返回 ("updated" 或 "skipped", 处理的明文字节数)。任务参数 concurrency 为同时处理的对象数
+    （默认 JOB_OBJECT_CONCURRENCY），rate 为所有对象合计每秒读取的明文字节数上限（默认不限速）。
+    进度中的 checkpoint 是已确认处理完的最后一个对象名，任务中断、取消或失败后重新执行时从它之后继续；
+    scanned / updated / skipped / failed / bytes 为本次执行的计数
+    """
+    bucket_name = params["bucket"]
+    checkpoint = job.values.get("checkpoint")
+    limiter = RateLimiter(float(params.get("rate") or 0))
+    counts = {"scanned": 0, "updated": 0, "skipped": 0, "failed": 0, "bytes": 0}
+    errors = {}
+    names = (
+        obj.object_name
+        for obj in minio_client.list_objects(
+            bucket_name, prefix=params.get("prefix", ""), recursive=True, start_after=checkpoint
+        )
+        if not obj.object_name.endswith("/")
+    )
+
+    def on_done(name, result, error, latest):
+        nonlocal checkpoint
+        counts["scanned"] += 1
+        if error is None:
+            outcome, size = result
+            counts[outcome] += 1
+            counts["bytes"] += size
+        else:
+            counts["failed"] += 1
+            if len(errors) < JOB_ERRORS_LIMIT:
+                errors[name] = str(error)
+        checkpoint = latest or checkpoint
+        job.progress(errors=errors, checkpoint=checkpoint, **counts)
+
+    concurrency = int(params.get("concurrency") or JOB_OBJECT_CONCURRENCY)
+    process_in_order(names, lambda name: process(name, limiter), concurrency, on_done)
+    job.progress(force=True, errors=errors, checkpoint=checkpoint, **counts)
+    if counts["failed"]:
+        raise RuntimeError(f"{counts['failed']} objects failed")
+    return counts
+
+
+def _move_job(job, params: dict) -> dict:
+    return prefix_mover.run(minio_client, job, params["bucket"], params["source"], params["target"])
+
+
+def _digest_job(job, params: dict) -> dict:
+    """为没有记录明文 SM3 的对象（早期上传的对象）补算摘要并写入元数据，已有摘要的对象跳过"""
+    bucket_name = params["bucket"]
+
+    def process(name: str, limiter) -> tuple:
+        stat = minio_client.stat_object(bucket_name, name)
+        if stat.size == 0 or _resolve_source(bucket_name, name, stat)[3]:
+            return "skipped", 0
+        return "updated", _digest_object(bucket_name, name, stat, limiter)[1]
+
+    return _for_each_object(job, params, process)
+
+
+def _reencrypt_object(bucket_name: str, object_name: str, limiter, stat=None) -> tuple:
+    """
+    把一个对象改写为当前密钥加密的 SM4-CTR 格式（原来是其他密钥，或旧的整文件 ECB 格式），
+    返回 ("updated" 或 "skipped", 明文字节数)。
+    明文边解密边加密上传到系统存储桶中的暂存对象，不整体驻留内存（ECB 格式除外），有摘要时边读边校验；
+    完成后以原对象的 ETag 为条件服务端复制回原位置，不会用旧内容覆盖并发写入的新内容
+    """
+    stat = stat or minio_client.stat_object(bucket_name, object_name)
+    key_id = (stat.metadata or {}).get(KEY_ID_METADATA)
+    if stat.size == 0 or key_id == key_ring.active_id:
+        return "skipped", 0
+    if (key_id is None and key_ring.active_id == LEGACY_KEY_ID and stat.size >= STREAM_HEADER.size
+            and _read_stream_header(bucket_name, object_name) is not None):
+        # 没有记录密钥 ID 的 CTR 对象用的就是旧密钥，当前密钥仍是它时无需改写
+        return "skipped", 0
+    info, chunks = _open_plaintext(bucket_name, object_name, verify=True)
+    _ensure_bucket(SYSTEM_BUCKET)
+    staging = f"{REENCRYPT_STAGING_PREFIX}{uuid.uuid4().hex}"
+    try:
+        plaintext_size, _, digest = _put_encrypted(
+            SYSTEM_BUCKET, staging, ChunkReader(chunks, limiter), info["size"], stat.content_type, digest=info["sm3"]
+        )
+        # 暂存对象的元数据（摘要、明文长度、密钥 ID、Content-Type）随复制一起带过去；
+        # 以原对象的 ETag 为条件写入，期间对象被改写（新内容已用当前密钥加密）时不覆盖
+        try:
+            result = copy_with_metadata(minio_client, bucket_name, object_name, SYSTEM_BUCKET, staging,
+                                        if_match=stat.etag)
+        except S3Error as e:
+            if e.code == "PreconditionFailed":
+                return "skipped", 0
+            raise
+    finally:
+        try:
+            minio_client.remove_object(SYSTEM_BUCKET, staging)
+        except S3Error:
+            pass
+    if bucket_name != DEDUP_BUCKET:
+        _record_write(bucket_name, object_name, STREAM_HEADER.size + plaintext_size, result.etag,
+                      content_type=stat.content_type, plaintext_size=plaintext_size, sm3=digest)
+    return "updated", plaintext_size
+
+
+def _reencrypt_job(job, params: dict) -> dict:
+    """
+    密钥轮换 / 格式升级：把前缀下不是用当前密钥加密的对象（包括旧的 ECB 格式对象）改用当前密钥重新加密，
+    已是当前密钥的对象只需一次 stat 即跳过。去重引用对象改写它指向的数据块（引用本身不含密文）。
+    可用 rate、concurrency 参数限速，取消后重试从检查点继续，也可在重试时调整这两个参数
+    """
+    bucket_name = params["bucket"]
+
+    def process(name: str, limiter) -> tuple:
+        stat = minio_client.stat_object(bucket_name, name)
+        source_bucket, source_name = _resolve_source(bucket_name, name, stat)[:2]
+        if (source_bucket, source_name) != (bucket_name, name):
+            return _reencrypt_object(source_bucket, source_name, limiter)
+        return _reencrypt_object(bucket_name, name, limiter, stat)
+
+    return _for_each_object(job, params, process)
+
+
+job_queue.register("move", _move_job)
+job_queue.register("digest", _digest_job)
+job_queue.register("reencrypt", _reencrypt_job)
+
+
+def start_background_workers():
+    """
+    启动后台任务的工作线程和元数据索引的对账线程。导入本模块不会启动任何线程，
+    由 serve.py 在每个工作进程中、或开发服务器启动时调用（重复调用无效）
+    """
+    job_queue.start()
+    if metadata_index:
+        metadata_index.start_reconciler(minio_client, METADATA_INDEX_BUCKETS, METADATA_INDEX_SCAN_INTERVAL)
+
+
+# 可通过 POST /jobs 直接提交的任务类型（移动文件夹需要先校验，走 /move）
+OBJECT_JOB_TYPES = ("digest", "reencrypt")
+
+
+def _job_tuning(body: dict) -> dict:
+    """校验并取出逐对象任务的 rate（字节/秒，0 为不限）和 concurrency 参数"""
+    tuning = {}
+    if body.get("rate") is not None:
+        rate = body["rate"]
+        if isinstance(rate, bool) or not isinstance(rate, (int, float)) or rate < 0:
+            raise ValueError("rate must be a non-negative number of bytes per second")
+        tuning["rate"] = rate
+    if body.get("concurrency") is not None:
+        concurrency = body["concurrency"]
+        if isinstance(concurrency, bool) or not isinstance(concurrency, int) or not 1 <= concurrency <= 64:
+            raise ValueError("concurrency must be an integer between 1 and 64")
+        tuning["concurrency"] = concurrency
+    return tuning
+
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """
+    提交后台任务，立即返回任务信息（202），进度通过 /jobs/<job_id> 查询
+    JSON 参数：type（digest 补算摘要 / reencrypt 改用当前密钥重新加密）、bucket、prefix（默认整个存储桶）、
+    rate（每秒处理的明文字节数上限，默认不限）、concurrency（同时处理的对象数，默认 JOB_OBJECT_CONCURRENCY）
+    """
+    body = request.get_json(silent=True) or {}
+    job_type = body.get("type")
+    bucket_name = body.get("bucket") or DEFAULT_BUCKET
+    prefix = body.get("prefix") or ""
+    if job_type not in OBJECT_JOB_TYPES:
+        return jsonify({"error": f"type must be one of: {', '.join(OBJECT_JOB_TYPES)}"}), 400
+    if not isinstance(prefix, str):
+        return jsonify({"error": "prefix must be a string"}), 400
+    try:
+        tuning = _job_tuning(body)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        if not _bucket_exists(bucket_name):
+            return jsonify({"error": "Bucket does not exist"}), 404
+        job = job_queue.submit(job_type, dict({"bucket": bucket_name, "prefix": prefix}, **tuning), unique=True)
+        return jsonify(job), 202
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    """
+    按提交时间倒序列出后台任务
+    参数：state、type（可选过滤）、limit（默认 50，最多 500）
+    """
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    jobs = job_queue.list(request.args.get('state'), request.args.get('type'), limit)
+    return jsonify({"jobs": jobs}), 200
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """
+    查询后台任务的状态、进度和结果
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job), 200
+
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """
+    取消后台任务：排队中的任务立即取消，运行中的任务在下一个检查点停止（已处理的对象保持处理后的状态）
+    """
+    job = job_queue.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job), 200
+
+
+@app.route('/jobs/<job_id>/retry', methods=['POST'])
+def retry_job(job_id):
+    """
+    重新执行失败或已取消的任务，补算摘要 / 重新加密任务从检查点继续；
+    可提交 JSON {"rate": ..., "concurrency": ...} 调整限速和并发数
+    """
+    try:
+        tuning = _job_tuning(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        job = job_queue.retry(job_id, tuning)
+    except JobStateError as e:
+        return jsonify({"error": str(e)}), 409
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job), 200
+
 @app.route('/create-folder', methods=['POST'])
 def create_folder():
     """
@@ -300,25 +1677,27 @@ def create_folder():
     
     try:
         # 确保存储桶存在
-        if not minio_client.bucket_exists(bucket_name):
+        if not _bucket_exists(bucket_name):
             return jsonify({"error": "Bucket does not exist"}), 404
         
         # 规范化文件夹名称（确保以/结尾）
         normalized_name = folder_name.rstrip('/') + '/'
         
-        # 检查文件夹是否已存在（考虑MinIO的两种表示方式）
-        objects = minio_client.list_objects(bucket_name, prefix=normalized_name, recursive=False)
-        if any(obj.object_name == normalized_name for obj in objects):
-            return jsonify({"error": f"Folder '{folder_name}' already exists"}), 409
-        
-        # 创建文件夹（上传一个0字节的对象）
-        minio_client.put_object(
-            bucket_name,
-            normalized_name,
-            io.BytesIO(b''),
-            0,
-            content_type='application/x-directory'  # 明确标记为目录
-        )
+        # 创建文件夹（上传一个0字节的对象）。条件写入由存储端原子地判断
+        # 占位对象是否已存在，无需先列举再写入
+        try:
+            result = minio_client.put_if_absent(
+                bucket_name,
+                normalized_name,
+                b'',
+                content_type="application/x-directory"  # 明确标记为目录
+            )
+        except S3Error as e:
+            if e.code == "PreconditionFailed":
+                return jsonify({"error": f"Folder '{folder_name}' already exists"}), 409
+            raise
+        _record_write(bucket_name, normalized_name, 0, result.etag, content_type='application/x-directory')
+        folder_cache.set((bucket_name, normalized_name), True)
         
         return jsonify({
             "message": "Folder created successfully",
@@ -330,6 +1709,72 @@ def create_folder():
         return jsonify({"error": str(e)}), 500
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-        
+
+
+@app.route('/encryption', methods=['GET'])
+def encryption_info():
+    """
+    查看当前启用的 SM4 引擎、SM3 实现和密钥环中的密钥 ID（不含密钥本身）
+    """
+    return jsonify({
+        "engine": key_ring.active.engine_name,
+        "sm3": sm3_hasher.BACKEND,
+        "contexts": key_ring.active.contexts.size,
+        "chunk_size": STREAM_CHUNK_SIZE,
+        "active_key": key_ring.active_id,
+        "keys": key_ring.ids
+    }), 200
+
+
+@app.route('/storage', methods=['GET'])
+def storage_info():
+    """
+    查看存储后端配置、MinIO 连接池和内容缓存的使用情况
+    """
+    return jsonify({
+        "backend": storage_config.backend,
+        "endpoint": storage_config.endpoint if storage_config.backend == "minio" else storage_config.local_root,
+        "pool_size": storage_config.pool_size,
+        "pool_block": storage_config.pool_block,
+        "pools": pool_stats(minio_client),
+        "content_cache": content_cache.stats()
+    }), 200
+
+
+@metrics.REGISTRY.collector
+def _storage_metrics():
+    """抓取时导出内容缓存和 MinIO 连接池的统计"""
+    cache = content_cache.stats()
+    pools = pool_stats(minio_client)
+    return [
+        ("content_cache_hits_total", "counter", "Content cache hits", [({}, cache["hits"])]),
+        ("content_cache_misses_total", "counter", "Content cache misses", [({}, cache["misses"])]),
+        ("content_cache_items", "gauge", "Objects held by each content cache tier",
+         [({"tier": tier}, cache[tier]["items"]) for tier in ("memory", "disk")]),
+        ("content_cache_bytes", "gauge", "Bytes held by each content cache tier",
+         [({"tier": tier}, cache[tier]["bytes"]) for tier in ("memory", "disk")]),
+        ("minio_pool_connections_created_total", "counter", "Connections opened by each MinIO connection pool",
+         [({"host": pool["host"]}, pool["created"]) for pool in pools]),
+        ("minio_pool_idle_connections", "gauge", "Idle connections in each MinIO connection pool",
+         [({"host": pool["host"]}, pool["idle"]) for pool in pools]),
+    ]
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """
+    Prometheus 文本格式的指标：各接口请求数/耗时/字节数、处理阶段耗时、MinIO 调用、缓存与连接池。
+    指标只统计本进程，多进程部署时每个进程分别抓取
+    """
+    if not METRICS_ENABLED:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return Response(metrics.REGISTRY.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    # 仅用于本地开发；生产环境请使用 serve.py
+    debug = os.environ.get("FLASK_DEBUG", "1") == "1"
+    # 调试模式下重载器的监视进程不处理请求，只在实际服务的子进程中启动后台任务
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_workers()
+    app.run(host='0.0.0.0', port=5000, debug=debug, threaded=True)
\ No newline at end of file
@@ -0,0 +1,349 @@
+"""
+大文件加密分片并行上传。
+
+明文按分片顺序读入，各分片在线程池中并行完成 SM4-CTR 加密和 UploadPart，
+全部分片成功后一次 CompleteMultipartUpload，对象要么完整出现要么不出现；
+任何分片失败都会 AbortMultipartUpload，不会留下残缺对象。
+
+CTR 模式下各分片的密文只取决于其明文偏移，因此分片之间完全独立。
+加密默认在上传线程中进行；配置 cipher_processes 后改由进程池加密，绕开 GIL 占满多核。
+
+ResumableUploads 在同样的格式上提供可续传的分块上传协议，供浏览器逐块 PUT。
+两者都在创建分片上传时写入密钥 ID 元数据，合并后的对象直接带有该元数据。
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Optional
+
+from minio.datatypes import Part
+from minio.error import S3Error
+
+import sm3_hasher
+from encryption import EncryptionService, KEY_ID_METADATA, KeyRing, STREAM_CHUNK_SIZE, STREAM_HEADER, STREAM_MAGIC
+from metrics import phase, submit
+from storage import LockTimeout, object_lock
+
+# S3 要求除最后一个分片外每个分片不小于 5MiB，一次分片上传最多 10000 个分片
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+# 续传分块的上限：每个进行中的分块在服务端占用与分块大小相同的内存（密文）
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+# 读取分块请求体时每次读入的明文字节数
+CHUNK_READ_SIZE = 1024 * 1024
+
+# 进程池中每个工作进程各自持有的加密服务
+_worker_service = None
+
+
+def _init_cipher_worker(key: bytes, engine: str):
+    global _worker_service
+    _worker_service = EncryptionService(key, engine)
+
+
+def _encrypt_in_worker(data: bytes, iv: bytes, offset: int) -> bytes:
+    return _worker_service.crypt_ctr(data, iv, offset)
+
+
+def read_exact(source, size: int) -> bytes:
+    """从流中读满 size 字节，除非已到达末尾"""
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = source.read(size - len(buffer))
+        if not chunk:
+            break
+        buffer += chunk
+    return bytes(buffer)
+
+
+class ParallelUploader:
+    def __init__(
+        self,
+        service: EncryptionService,
+        part_size: int = 16 * 1024 * 1024,
+        concurrency: int = 4,
+        cipher_processes: int = 0,
+    ):
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f"part_size must be at least {MIN_PART_SIZE} bytes")
+        self.service = service
+        self.part_size = part_size
+        self.concurrency = max(1, concurrency)
+        self.cipher_processes = cipher_processes
+        self._cipher_pool: Optional[ProcessPoolExecutor] = None
+
+    def _encrypt(self, data: bytes, iv: bytes, offset: int) -> bytes:
+        if self.cipher_processes <= 0:
+            return self.service.crypt_ctr(data, iv, offset)
+        if self._cipher_pool is None:
+            self._cipher_pool = ProcessPoolExecutor(
+                max_workers=self.cipher_processes,
+                initializer=_init_cipher_worker,
+                initargs=(self.service.key, self.service.engine_name),
+            )
+        return self._cipher_pool.submit(_encrypt_in_worker, data, iv, offset).result()
+
+    def _upload_part(self, client, bucket_name, object_name, upload_id, part_number, prefix, data, iv, offset):
+        with phase("encrypt"):
+            body = prefix + self._encrypt(data, iv, offset)
+        etag = client.upload_part(bucket_name, object_name, upload_id, part_number, body)
+        return Part(part_number, etag)
+
+    def upload(self, client, bucket_name: str, object_name: str, source, content_type: Optional[str] = None,
+               metadata: Optional[dict] = None, hashing: bool = True) -> tuple:
+        """
+        加密并以分片方式并行上传 source，返回 (明文字节数, ETag, 明文 SM3)。
+        同时在途的分片不超过 concurrency 个，内存占用约为 concurrency × part_size × 2。
+        metadata 为创建分片上传时一并写入的用户元数据；摘要事先已知时传 hashing=False，返回的摘要为 None
+        """
+        iv = os.urandom(16)
+        header = STREAM_HEADER.pack(STREAM_MAGIC, STREAM_CHUNK_SIZE, iv)
+        metadata = dict(metadata or {})
+        if self.service.key_id:
+            metadata[KEY_ID_METADATA] = self.service.key_id
+        upload_id = client.create_multipart(bucket_name, object_name, content_type, metadata)
+
+        # 明文按顺序读入，摘要在读取线程中顺序计算
+        hasher = self.service.sm3() if hashing else None
+        pool = ThreadPoolExecutor(max_workers=self.concurrency)
+        pending = set()
+        parts = []
+        offset = 0
+        part_number = 0
+        try:
+            while True:
+                # 第一个分片以对象头开头，保证每个分片的密文长度都等于 part_size
+                prefix = header if part_number == 0 else b""
+                size = self.part_size - len(prefix)
+                with phase("read"):
+                    data = read_exact(source, size)
+                if not data and part_number > 0:
+                    break
+                part_number += 1
+                if hasher is not None:
+                    with phase("hash"):
+                        hasher.update(data)
+                pending.add(submit(
+                    pool, self._upload_part, client, bucket_name, object_name, upload_id,
+                    part_number, prefix, data, iv, offset
+                ))
+                offset += len(data)
+                if len(pending) >= self.concurrency:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    parts.extend(future.result() for future in done)
+                if len(data) < size:
+                    break
+            parts.extend(future.result() for future in pending)
+            parts.sort(key=lambda part: part.part_number)
+            result = client.complete_multipart(bucket_name, object_name, upload_id, parts)
+        except BaseException:
+            pool.shutdown(wait=True, cancel_futures=True)
+            client.abort_multipart(bucket_name, object_name, upload_id)
+            raise
+        finally:
+            pool.shutdown(wait=True)
+        return offset, result.etag, hasher.hexdigest() if hasher is not None else None
+
+
+class UploadSessionError(ValueError):
+    """续传会话无效或分块不符合会话约定"""
+
+
+class ResumableUploads:
+    """
+    可续传的分块上传，直接建立在 MinIO 分片上传之上。
+
+    会话不保存在服务端内存里：会话令牌中编码了存储桶、对象名、MinIO 分片上传 ID、
+    分块大小、文件总大小和密钥 ID，并用该密钥的 HMAC-SM3 做完整性校验；IV 同样用 HMAC-SM3 由分片上传 ID 派生，
+    已到达的分块通过 ListParts 查询。因此服务重启或多进程部署时会话依然有效，
+    上传过程中轮换了当前密钥也不影响：同一会话的所有分块始终用创建会话时的密钥加密。
+
+    第 n 块（从 1 开始）是明文 [(n-1)*chunk_size, n*chunk_size) 的 SM4-CTR 密文，
+    第 1 块前额外带上对象头，合并后的对象与普通上传的格式完全一致。
+    同一会话的 IV 固定，同一分块换了内容重新上传会重用密钥流，因此已到达的分块只接受内容相同的重传。
+    检查分块是否已到达与上传分块在 lock_bucket 中的分块锁（locks/uploads/<分片上传 ID>/<分块号>）内进行，
+    同一分块的并发上传（包括其他进程、其他服务器）只有一个能写入，其余按重传处理。
+    """
+
+    def __init__(self, keys: KeyRing, chunk_size: int = 8 * 1024 * 1024, lock_bucket: str = "sm4-system",
+                 lock_timeout: float = 60, lock_stale: float = 600):
+        if not MIN_PART_SIZE <= chunk_size <= MAX_CHUNK_SIZE:
+            raise ValueError(f"chunk_size must be between {MIN_PART_SIZE} and {MAX_CHUNK_SIZE} bytes")
+        self.keys = keys
+        self.chunk_size = chunk_size
+        self.lock_bucket = lock_bucket
+        # 持锁期间要上传整个分块，失效时间按慢速上传留足余量
+        self.lock_timeout = lock_timeout
+        self.lock_stale = lock_stale
+        self._lock_bucket_ready = False
+
+    def _ensure_lock_bucket(self, client):
+        if self._lock_bucket_ready:
+            return
+        if not client.bucket_exists(self.lock_bucket):
+            try:
+                client.make_bucket(self.lock_bucket)
+            except S3Error as e:
+                if e.code not in ("BucketAlreadyOwnedByYou", "BucketAlreadyExists"):
+                    raise
+        self._lock_bucket_ready = True
+
+    @staticmethod
+    def _sign(service: EncryptionService, payload: bytes) -> str:
+        return sm3_hasher.hmac_sm3(service.key, b"upload-session\x00" + payload).hex()
+
+    @staticmethod
+    def _iv(service: EncryptionService, upload_id: str) -> bytes:
+        return sm3_hasher.hmac_sm3(service.key, b"upload-iv\x00" + upload_id.encode())[:16]
+
+    def _encode(self, session: dict) -> str:
+        payload = json.dumps(session, separators=(",", ":"), sort_keys=True).encode()
+        signature = self._sign(self.keys.get(session.get("key")), payload)
+        return base64.urlsafe_b64encode(payload).decode().rstrip("=") + "." + signature
+
+    def decode(self, token: str) -> dict:
+        """解析并校验会话令牌（用会话记录的密钥校验，早期的会话没有记录密钥 ID）"""
+        try:
+            encoded, signature = token.rsplit(".", 1)
+            payload = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4))
+            session = json.loads(payload)
+            service = self.keys.get(session.get("key"))
+        except (ValueError, AttributeError, KeyError):
+            raise UploadSessionError("Invalid upload_id")
+        if not hmac.compare_digest(signature, self._sign(service, payload)):
+            raise UploadSessionError("Invalid upload_id")
+        return session
+
+    @staticmethod
+    def chunk_count(session: dict) -> int:
+        return max(1, -(-session["size"] // session["chunk_size"]))
+
+    def initiate(self, client, bucket_name: str, object_name: str, size: int,
+                 content_type: Optional[str] = None, chunk_size: Optional[int] = None) -> dict:
+        """创建 MinIO 分片上传并返回会话信息"""
+        chunk_size = chunk_size or self.chunk_size
+        if size < 0:
+            raise UploadSessionError("size must not be negative")
+        if not MIN_PART_SIZE <= chunk_size <= MAX_CHUNK_SIZE:
+            raise UploadSessionError(f"chunk_size must be between {MIN_PART_SIZE} and {MAX_CHUNK_SIZE} bytes")
+        if -(-size // chunk_size) > MAX_PARTS:
+            raise UploadSessionError(f"File too large: at most {MAX_PARTS} chunks of {chunk_size} bytes")
+        service = self.keys.active
+        upload_id = client.create_multipart(bucket_name, object_name, content_type, {KEY_ID_METADATA: service.key_id})
+        session = {
+            "bucket": bucket_name,
+            "object": object_name,
+            "upload": upload_id,
+            "chunk_size": chunk_size,
+            "size": size,
+            "key": service.key_id,
+        }
+        return {
+            "upload_id": self._encode(session),
+            "bucket": bucket_name,
+            "object": object_name,
+            "chunk_size": chunk_size,
+            "chunks": self.chunk_count(session),
+        }
+
+    def _uploaded_part(self, client, session: dict, part_number: int) -> Optional[Part]:
+        result = client.list_parts(
+            session["bucket"], session["object"], session["upload"], max_parts=1, part_number_marker=part_number - 1
+        )
+        return next((part for part in result.parts if part.part_number == part_number), None)
+
+    def put_chunk(self, client, token: str, part_number: int, source, length: Optional[int] = None) -> str:
+        """
+        从 source 边读边加密一个分块并上传，length 为请求声明的长度（未知时为 None）。
+        已到达的分块再次上传时，内容相同直接返回（幂等重试），内容不同则拒绝
+        """
+        session = self.decode(token)
+        chunks = self.chunk_count(session)
+        if not 1 <= part_number <= chunks:
+            raise UploadSessionError(f"part_number must be between 1 and {chunks}")
+        offset = (part_number - 1) * session["chunk_size"]
+        expected = min(session["chunk_size"], session["size"] - offset)
+        if length is not None and length != expected:
+            raise UploadSessionError(f"Chunk {part_number} must be {expected} bytes, got {length}")
+        service = self.keys.get(session.get("key"))
+        iv = self._iv(service, session["upload"])
+        body = bytearray(STREAM_HEADER.pack(STREAM_MAGIC, STREAM_CHUNK_SIZE, iv) if part_number == 1 else b"")
+        cipher = service.ctr_stream(iv, offset)
+        received = 0
+        while received < expected:
+            with phase("read"):
+                data = source.read(min(CHUNK_READ_SIZE, expected - received))
+            if not data:
+                break
+            with phase("encrypt"):
+                body += cipher.update(data)
+            received += len(data)
+        if received != expected or source.read(1):
+            raise UploadSessionError(f"Chunk {part_number} must be {expected} bytes")
+        with phase("hash"):
+            etag = hashlib.md5(body).hexdigest()
+        self._ensure_lock_bucket(client)
+        lock = f"locks/uploads/{session['upload']}/{part_number}"
+        try:
+            with object_lock(client, self.lock_bucket, lock, self.lock_timeout, self.lock_stale):
+                existing = self._uploaded_part(client, session, part_number)
+                if existing is not None:
+                    # 分块的 ETag 是密文的 MD5：相同说明是同一内容的重试（存储端开启服务端加密时 ETag 不是 MD5，
+                    # 重试一律拒绝，客户端可先查询 status 跳过已到达的分块）
+                    if existing.etag.strip('"') == etag:
+                        return etag
+                    raise UploadSessionError(f"Chunk {part_number} was already uploaded with different content")
+                return client.upload_part(session["bucket"], session["object"], session["upload"], part_number, body)
+        except LockTimeout:
+            raise UploadSessionError(f"Chunk {part_number} is being uploaded by another request")
+
+    def _parts(self, client, session: dict) -> list:
+        parts = []
+        marker = None
+        while True:
+            result = client.list_parts(
+                session["bucket"], session["object"], session["upload"], part_number_marker=marker
+            )
+            parts.extend(result.parts)
+            if not result.is_truncated:
+                return parts
+            marker = result.next_part_number_marker
+
+    def status(self, client, token: str) -> dict:
+        """查询已到达的分块，客户端据此只补传缺失的部分"""
+        session = self.decode(token)
+        chunks = self.chunk_count(session)
+        received = sorted(part.part_number for part in self._parts(client, session))
+        return {
+            "upload_id": token,
+            "bucket": session["bucket"],
+            "object": session["object"],
+            "chunk_size": session["chunk_size"],
+            "size": session["size"],
+            "chunks": chunks,
+            "received": received,
+            "missing": sorted(set(range(1, chunks + 1)) - set(received)),
+        }
+
+    def complete(self, client, token: str) -> dict:
+        """所有分块到齐后合并为最终对象，返回会话信息及对象的 ETag"""
+        session = self.decode(token)
+        chunks = self.chunk_count(session)
+        parts = sorted(self._parts(client, session), key=lambda part: part.part_number)
+        missing = sorted(set(range(1, chunks + 1)) - {part.part_number for part in parts})
+        if missing:
+            raise UploadSessionError(f"Missing chunks: {missing}")
+        result = client.complete_multipart(
+            session["bucket"], session["object"], session["upload"],
+            [Part(part.part_number, part.etag) for part in parts]
+        )
+        return dict(session, etag=result.etag)
+
+    def abort(self, client, token: str) -> dict:
+        """放弃上传，释放 MinIO 中已上传的分块"""
+        session = self.decode(token)
+        client.abort_multipart(session["bucket"], session["object"], session["upload"])
+        return session
@@ -0,0 +1,184 @@
+"""
+文件预览：为图片生成限定尺寸的缩略图，为 PDF 渲染首页预览。
+
+预览图只生成一次，加密后作为派生对象保存在预览存储桶中：
+    previews/<源文件标识>/<尺寸>.jpg
+源文件标识优先使用明文 SM3（内容相同的文件共用预览图），没有摘要的旧对象使用 ETag。
+源文件被改写后标识随之变化，旧预览图不会再被使用，无需主动失效；
+派生对象不随源文件删除，可为预览存储桶配置生命周期规则定期清理。
+
+可选依赖：Pillow（图片）、pypdfium2（PDF 首页，同时需要 Pillow），
+缺失时对应类型返回“不支持预览”。
+"""
+import io
+import os
+import threading
+import zlib
+from typing import Optional
+
+from minio.error import S3Error
+
+from encryption import EncryptedUploadStream, KEY_ID_METADATA, STREAM_HEADER, STREAM_MAGIC
+
+# 可生成的预览尺寸（长边像素），请求的尺寸向上取整到其中之一，限制派生对象的数量
+PREVIEW_SIZES = (64, 128, 256, 512, 1024)
+PREVIEW_QUALITY = 80
+# 图片像素数上限，防止解压炸弹
+MAX_PIXELS = 100_000_000
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp", ".tif", ".tiff"}
+PDF_EXTENSIONS = {".pdf"}
+
+# pdfium 不是线程安全的，所有 PDF 渲染串行进行
+_pdfium_lock = threading.Lock()
+
+
+class PreviewError(ValueError):
+    """文件内容无法生成预览"""
+
+
+class PreviewUnavailable(PreviewError):
+    """缺少生成该类型预览所需的库"""
+
+
+def preview_kind(object_name: str, content_type: Optional[str]) -> Optional[str]:
+    """可预览的类型：image / pdf，不支持时返回 None"""
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    extension = os.path.splitext(object_name)[1].lower()
+    if content_type == "application/pdf" or extension in PDF_EXTENSIONS:
+        return "pdf"
+    if (content_type.startswith("image/") and content_type != "image/svg+xml") or extension in IMAGE_EXTENSIONS:
+        return "image"
+    return None
+
+
+def preview_size(requested: int) -> int:
+    """把请求的尺寸取整到 PREVIEW_SIZES 中不小于它的最小值"""
+    for size in PREVIEW_SIZES:
+        if requested <= size:
+            return size
+    return PREVIEW_SIZES[-1]
+
+
+def _import_pillow():
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        raise PreviewUnavailable("Pillow is required for previews")
+    return Image, ImageOps
+
+
+def _encode(image) -> bytes:
+    """编码为 JPEG，透明背景合成为白色"""
+    Image, _ = _import_pillow()
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+    output = io.BytesIO()
+    image.save(output, "JPEG", quality=PREVIEW_QUALITY, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def _render_image(data: bytes, size: int) -> bytes:
+    Image, ImageOps = _import_pillow()
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image.width * image.height > MAX_PIXELS:
+                raise PreviewError("Image is too large to preview")
+            # JPEG 解码时即可按 1/2、1/4、1/8 缩小，大照片省去大部分解码开销
+            image.draft("RGB", (size, size))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((size, size), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            return _encode(image)
+    except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise PreviewError(f"Cannot decode image: {e}")
+
+
+def _render_pdf(data: bytes, size: int) -> bytes:
+    _import_pillow()
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        raise PreviewUnavailable("pypdfium2 is required for PDF previews")
+    with _pdfium_lock:
+        try:
+            pdf = pdfium.PdfDocument(data)
+        except pdfium.PdfiumError as e:
+            raise PreviewError(f"Cannot open PDF: {e}")
+        try:
+            if len(pdf) == 0:
+                raise PreviewError("PDF has no pages")
+            page = pdf[0]
+            width, height = page.get_size()
+            image = page.render(scale=size / max(width, height, 1)).to_pil()
+        finally:
+            pdf.close()
+    return _encode(image)
+
+
+def render_preview(data: bytes, kind: str, size: int) -> bytes:
+    """生成长边不超过 size 像素的 JPEG 预览图"""
+    if kind == "pdf":
+        return _render_pdf(data, size)
+    return _render_image(data, size)
+
+
+class PreviewStore:
+    """加密保存的预览图，按源文件标识和尺寸寻址；用当前密钥加密，读取时按记录的密钥 ID 解密"""
+
+    def __init__(self, keys, bucket_name: str = "sm4-previews"):
+        self.keys = keys
+        self.bucket_name = bucket_name
+        # 同一预览图并发请求时只生成一次；按名称哈希分片加锁，锁的数量固定
+        self._locks = [threading.Lock() for _ in range(64)]
+        self._bucket_ready = False
+
+    @staticmethod
+    def object_name(source_key: str, size: int) -> str:
+        return f"previews/{source_key}/{size}.jpg"
+
+    def lock(self, source_key: str, size: int) -> threading.Lock:
+        return self._locks[zlib.crc32(self.object_name(source_key, size).encode()) % len(self._locks)]
+
+    def _ensure_bucket(self, client):
+        if not self._bucket_ready:
+            if not client.bucket_exists(self.bucket_name):
+                client.make_bucket(self.bucket_name)
+            self._bucket_ready = True
+
+    def get(self, client, source_key: str, size: int) -> Optional[bytes]:
+        """读取并解密预览图，不存在时返回 None"""
+        try:
+            response = client.get_object(self.bucket_name, self.object_name(source_key, size))
+        except S3Error as e:
+            if e.code in ("NoSuchKey", "NoSuchBucket"):
+                return None
+            raise
+        try:
+            data = response.read()
+            key_id = response.headers.get(KEY_ID_METADATA)
+        finally:
+            response.close()
+            response.release_conn()
+        if len(data) < STREAM_HEADER.size or not data.startswith(STREAM_MAGIC):
+            return None
+        iv = STREAM_HEADER.unpack(data[:STREAM_HEADER.size])[2]
+        return self.keys.get(key_id).crypt_ctr(data[STREAM_HEADER.size:], iv)
+
+    def put(self, client, source_key: str, size: int, data: bytes):
+        """加密保存预览图（与普通对象相同的 SM4-CTR 格式）"""
+        self._ensure_bucket(client)
+        service = self.keys.active
+        payload = EncryptedUploadStream(io.BytesIO(data), service).read()
+        client.put_object(
+            self.bucket_name,
+            self.object_name(source_key, size),
+            io.BytesIO(payload),
+            len(payload),
+            content_type="image/jpeg",
+            metadata={KEY_ID_METADATA: service.key_id}
+        )
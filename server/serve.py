@@ -0,0 +1,116 @@
+"""
+生产环境启动入口（替代 minio_server.py 中的 Flask 开发服务器）：
+
+    python serve.py
+
+配置按以下顺序读取，前者优先：进程环境变量 > 项目根目录 .env.production > .env
+
+    SERVER_MODE          gunicorn（默认）/ waitress（Windows 或未安装 gunicorn 时自动使用）
+    SERVER_HOST          监听地址，默认 0.0.0.0
+    SERVER_PORT          监听端口，默认 5000
+    SERVER_WORKERS       工作进程数，默认 1
+    SERVER_THREADS       每个进程的线程数，默认 32
+    SERVER_WORKER_CLASS  gunicorn 工作模式：gthread（默认）或 gevent
+    SERVER_TIMEOUT       工作进程无响应多少秒后重启 / waitress 连接空闲超时，默认 300
+    SERVER_KEEPALIVE     HTTP keep-alive 秒数，默认 5
+
+上传下载都是流式处理的，同一进程内的所有线程共享一个 MinIO 客户端及其连接池。
+gthread 模式下每个进行中的传输占用一个线程，慢客户端较多时可以调大 SERVER_THREADS，
+或安装 gevent 后使用 SERVER_WORKER_CLASS=gevent，由协程承载连接、不再占用线程。
+
+后台任务（文件夹移动、补算摘要、重新加密）保存在 JOBS_DB_PATH 指向的 SQLite 文件中
+（默认 server/data/jobs.db，可用 DATA_DIR 改变目录），工作线程由本入口在每个进程中启动，
+SERVER_WORKERS 大于 1 时各进程共享同一任务表，任务只会被一个进程领取，任一进程都能查询进度。
+
+加密密钥由 ENCRYPTION_KEYS（或 ENCRYPTION_KEYS_FILE 指向的文件）配置，格式为 "密钥ID:32位十六进制"。
+轮换密钥时追加新密钥并重启所有进程（各进程的配置必须一致），再提交 reencrypt 任务改写旧对象，
+全部完成后才能从配置中移除旧密钥。
+"""
+import importlib.util
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENV_FILES = (".env.production", ".env")
+
+
+def load_env_files(directory: str = ROOT_DIR, names=ENV_FILES):
+    """读取 .env 文件中的 KEY=VALUE，已存在的环境变量不会被覆盖"""
+    for name in names:
+        path = os.path.join(directory, name)
+        if not os.path.isfile(path):
+            continue
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#") or "=" not in line:
+                    continue
+                key, value = line.split("=", 1)
+                os.environ.setdefault(key.strip(), value.strip().strip("'\""))
+
+
+def settings() -> dict:
+    return {
+        "mode": os.environ.get("SERVER_MODE", "gunicorn"),
+        "host": os.environ.get("SERVER_HOST", "0.0.0.0"),
+        "port": int(os.environ.get("SERVER_PORT", 5000)),
+        "workers": int(os.environ.get("SERVER_WORKERS", 1)),
+        "threads": int(os.environ.get("SERVER_THREADS", 32)),
+        "worker_class": os.environ.get("SERVER_WORKER_CLASS", "gthread"),
+        "timeout": int(os.environ.get("SERVER_TIMEOUT", 300)),
+        "keepalive": int(os.environ.get("SERVER_KEEPALIVE", 5)),
+    }
+
+
+def run_gunicorn(config: dict):
+    from gunicorn.app.base import BaseApplication
+
+    class GunicornApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{config['host']}:{config['port']}")
+            self.cfg.set("workers", config["workers"])
+            self.cfg.set("threads", config["threads"])
+            self.cfg.set("worker_class", config["worker_class"])
+            self.cfg.set("timeout", config["timeout"])
+            self.cfg.set("graceful_timeout", config["timeout"])
+            self.cfg.set("keepalive", config["keepalive"])
+            self.cfg.set("accesslog", "-")
+
+        def load(self):
+            # 在每个工作进程中各自导入应用并启动后台任务线程，后台线程不会跨 fork 共享
+            from minio_server import app, start_background_workers
+            start_background_workers()
+            return app
+
+    GunicornApplication().run()
+
+
+def run_waitress(config: dict):
+    from waitress import serve
+
+    from minio_server import app, start_background_workers
+
+    start_background_workers()
+    if config["workers"] > 1:
+        print("waitress runs a single process; SERVER_WORKERS is ignored", file=sys.stderr)
+    serve(
+        app,
+        host=config["host"],
+        port=config["port"],
+        threads=config["threads"],
+        channel_timeout=config["timeout"],
+    )
+
+
+def main():
+    load_env_files()
+    config = settings()
+    if config["mode"] == "gunicorn" and sys.platform != "win32":
+        if importlib.util.find_spec("gunicorn") is not None:
+            return run_gunicorn(config)
+        print("gunicorn is not installed, falling back to waitress", file=sys.stderr)
+    run_waitress(config)
+
+
+if __name__ == "__main__":
+    main()
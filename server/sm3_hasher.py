@@ -0,0 +1,200 @@
+"""
+增量 SM3 哈希。
+
+gmssl 的 sm3_hash 只接受整条消息的 int 列表，每个字节都要变成一个 Python 对象，
+大文件既慢又占内存。这里提供 hashlib 风格的增量接口（update / digest / hexdigest），
+直接处理 bytes / memoryview 分块，内存占用与数据总量无关。
+
+按速度从快到慢依次尝试：
+    openssl       —— hashlib 中 OpenSSL 提供的 sm3
+    cryptography  —— cryptography 包装的 OpenSSL SM3
+    python        —— 纯 Python 分组实现，作为兜底
+
+所有实现在启用前都会用 GB/T 32905-2016 附录 A 的测试向量校验。
+"""
+import hashlib
+import hmac
+import logging
+import os
+import struct
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+DIGEST_SIZE = 32
+BLOCK_SIZE = 64
+
+# GB/T 32905-2016 附录 A 的标准测试向量
+_KAT = [
+    (b"abc", "66c7f0f462eeedd9d1f2d46bdc10e4e24167c4875cf2f7a2297da02b8f4ba8e0"),
+    (b"abcd" * 16, "debe9ff92275b8a138604889c18e5a4d6fdb70e5387e5765293dcba39c0c5732"),
+]
+
+_IV = (0x7380166F, 0x4914B2B9, 0x172442D7, 0xDA8A0600, 0xA96F30BC, 0x163138AA, 0xE38DEE4D, 0xB0FB0E4E)
+_MASK = 0xFFFFFFFF
+
+
+def _rotl(x: int, n: int) -> int:
+    return ((x << n) | (x >> (32 - n))) & _MASK
+
+
+# 每轮的 T_j <<< j 只与轮数有关，预先算好
+_T = [_rotl(0x79CC4519 if j < 16 else 0x7A879D8A, j % 32) for j in range(64)]
+_WORDS = struct.Struct(">16I")
+
+
+def _compress(v, block) -> tuple:
+    w = list(_WORDS.unpack(block))
+    for j in range(16, 68):
+        x = w[j - 16] ^ w[j - 9] ^ _rotl(w[j - 3], 15)
+        w.append((x ^ _rotl(x, 15) ^ _rotl(x, 23)) ^ _rotl(w[j - 13], 7) ^ w[j - 6])
+
+    a, b, c, d, e, f, g, h = v
+    for j in range(64):
+        a12 = _rotl(a, 12)
+        ss1 = _rotl((a12 + e + _T[j]) & _MASK, 7)
+        ss2 = ss1 ^ a12
+        if j < 16:
+            ff = a ^ b ^ c
+            gg = e ^ f ^ g
+        else:
+            ff = (a & b) | (a & c) | (b & c)
+            gg = (e & f) | (~e & g)
+        tt1 = (ff + d + ss2 + (w[j] ^ w[j + 4])) & _MASK
+        tt2 = (gg + h + ss1 + w[j]) & _MASK
+        d, c, b, a = c, _rotl(b, 9), a, tt1
+        h, g, f = g, _rotl(f, 19), e
+        e = tt2 ^ _rotl(tt2, 9) ^ _rotl(tt2, 17)
+    return (a ^ v[0], b ^ v[1], c ^ v[2], d ^ v[3], e ^ v[4], f ^ v[5], g ^ v[6], h ^ v[7])
+
+
+class PythonSM3:
+    """纯 Python 的增量 SM3，只缓存不足一个分组的尾部数据"""
+
+    name = "sm3"
+    digest_size = DIGEST_SIZE
+    block_size = BLOCK_SIZE
+
+    def __init__(self, data: bytes = b""):
+        self._v = _IV
+        self._tail = b""
+        self._length = 0
+        if data:
+            self.update(data)
+
+    def update(self, data):
+        data = memoryview(data).cast("B")
+        self._length += len(data)
+        if self._tail:
+            need = BLOCK_SIZE - len(self._tail)
+            self._tail += bytes(data[:need])
+            data = data[need:]
+            if len(self._tail) < BLOCK_SIZE:
+                return
+            self._v = _compress(self._v, self._tail)
+            self._tail = b""
+        end = len(data) - len(data) % BLOCK_SIZE
+        v = self._v
+        for i in range(0, end, BLOCK_SIZE):
+            v = _compress(v, data[i:i + BLOCK_SIZE])
+        self._v = v
+        self._tail = bytes(data[end:])
+
+    def copy(self) -> "PythonSM3":
+        other = PythonSM3()
+        other._v, other._tail, other._length = self._v, self._tail, self._length
+        return other
+
+    def digest(self) -> bytes:
+        tail = self._tail + b"\x80" + b"\x00" * ((55 - len(self._tail)) % BLOCK_SIZE)
+        tail += struct.pack(">Q", self._length * 8)
+        v = self._v
+        for i in range(0, len(tail), BLOCK_SIZE):
+            v = _compress(v, tail[i:i + BLOCK_SIZE])
+        return struct.pack(">8I", *v)
+
+    def hexdigest(self) -> str:
+        return self.digest().hex()
+
+
+class CryptographySM3:
+    """cryptography 的 SM3 只能 finalize 一次，这里包装成可重复取摘要的接口"""
+
+    name = "sm3"
+    digest_size = DIGEST_SIZE
+    block_size = BLOCK_SIZE
+
+    def __init__(self, data: bytes = b"", _ctx=None):
+        from cryptography.hazmat.primitives import hashes
+
+        self._ctx = _ctx if _ctx is not None else hashes.Hash(hashes.SM3())
+        if data:
+            self.update(data)
+
+    def update(self, data):
+        self._ctx.update(data)
+
+    def copy(self) -> "CryptographySM3":
+        return CryptographySM3(_ctx=self._ctx.copy())
+
+    def digest(self) -> bytes:
+        return self._ctx.copy().finalize()
+
+    def hexdigest(self) -> str:
+        return self.digest().hex()
+
+
+def _openssl_sm3(data: bytes = b""):
+    return hashlib.new("sm3", data)
+
+
+BACKENDS = {
+    "openssl": _openssl_sm3,
+    "cryptography": CryptographySM3,
+    "python": PythonSM3,
+}
+
+
+def _verify(factory) -> bool:
+    for message, expected in _KAT:
+        hasher = factory()
+        # 分两段喂入，同时校验增量路径
+        hasher.update(message[:1])
+        hasher.update(message[1:])
+        if hasher.hexdigest() != expected:
+            return False
+    return True
+
+
+def select_backend(preferred: Optional[str] = None):
+    """选择可用的最快 SM3 实现，返回 (名称, 工厂函数)"""
+    names = list(BACKENDS)
+    if preferred:
+        names.sort(key=lambda name: name != preferred)
+    for name in names:
+        try:
+            if _verify(BACKENDS[name]):
+                logger.info("SM3 backend: %s", name)
+                return name, BACKENDS[name]
+            logger.warning("SM3 backend %s failed verification, skipped", name)
+        except Exception as e:
+            logger.debug("SM3 backend %s unavailable: %s", name, e)
+    raise RuntimeError("No usable SM3 backend")
+
+
+BACKEND, _factory = select_backend(os.environ.get("SM3_BACKEND"))
+
+
+def new(data: bytes = b""):
+    """创建增量 SM3 哈希对象"""
+    return _factory(data)
+
+
+def sm3_hexdigest(data) -> str:
+    """一次性计算 SM3 摘要（十六进制）"""
+    return _factory(data).hexdigest()
+
+
+def hmac_sm3(key: bytes, message: bytes) -> bytes:
+    """HMAC-SM3（RFC 2104 构造，GB/T 15852.2 中的 MAC 算法 2），用于消息认证与密钥派生"""
+    return hmac.new(key, message, new).digest()
@@ -0,0 +1,319 @@
+"""
+SM4 分组密码的可插拔实现。
+
+按速度从快到慢依次尝试：
+    cryptography  —— OpenSSL 原生实现
+    numpy         —— 查表法(T 表) + 按分组向量化
+    gmssl         —— 纯 Python 逐块实现，作为兜底
+
+所有实现在启用前都会与 gmssl 的结果逐字节比对，不一致的实现会被跳过。
+
+轮密钥在引擎创建时只扩展一次，之后由 CipherContextPool 为每个线程派生
+独立的上下文（共享只读的轮密钥，各自持有可变的工作状态），多线程下无需加锁。
+"""
+import logging
+import os
+import threading
+from typing import Optional
+
+from gmssl.sm4 import CryptSM4, SM4_BOXES_TABLE, SM4_ENCRYPT, SM4_DECRYPT
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 16
+_COUNTER_MASK = (1 << 128) - 1
+
+# GB/T 32907-2016 附录 A 的标准测试向量
+_KAT_KEY = bytes.fromhex("0123456789abcdeffedcba9876543210")
+_KAT_PLAIN = bytes.fromhex("0123456789abcdeffedcba9876543210")
+_KAT_CIPHER = bytes.fromhex("681edf34d206965e86b3e94f536e4246")
+
+
+def _counter_blocks(iv: bytes, first_block: int, count: int) -> bytes:
+    """生成 CTR 模式的计数器分组（128 位大端，按 2^128 回绕）"""
+    counter = int.from_bytes(iv, "big") + first_block
+    return b"".join(((counter + i) & _COUNTER_MASK).to_bytes(BLOCK_SIZE, "big") for i in range(count))
+
+
+class SM4Engine:
+    """
+    SM4 引擎基类，子类至少实现无填充的 ECB 分组加解密。
+    一个实例就是一个加密上下文，只应在单个线程内使用，跨线程请通过 spawn() 派生。
+    """
+
+    name = "base"
+
+    def __init__(self, key: bytes, schedule=None):
+        self.key = key
+        self.schedule = schedule if schedule is not None else self.expand_key(key)
+
+    @classmethod
+    def expand_key(cls, key: bytes):
+        """预计算轮密钥，结果只读，可被多个上下文共享"""
+        return None
+
+    def spawn(self) -> "SM4Engine":
+        """派生一个共享轮密钥的新上下文"""
+        return type(self)(self.key, self.schedule)
+
+    def ctr_stream(self, iv: bytes, offset: int = 0) -> "CTRStream":
+        """按顺序处理连续数据的 CTR 流"""
+        return CTRStream(self, iv, offset)
+
+    def encrypt_blocks(self, data: bytes) -> bytes:
+        raise NotImplementedError
+
+    def decrypt_blocks(self, data: bytes) -> bytes:
+        raise NotImplementedError
+
+    def ctr(self, data: bytes, iv: bytes, offset: int = 0) -> bytes:
+        """SM4-CTR 加解密，offset 为 data 在整个明文中的字节偏移"""
+        if not data:
+            return b""
+        skip = offset % BLOCK_SIZE
+        size = len(data)
+        count = (skip + size + BLOCK_SIZE - 1) // BLOCK_SIZE
+        keystream = self.encrypt_blocks(_counter_blocks(iv, offset // BLOCK_SIZE, count))
+        keystream = int.from_bytes(keystream[skip:skip + size], "big")
+        return (int.from_bytes(data, "big") ^ keystream).to_bytes(size, "big")
+
+
+class CTRStream:
+    """顺序 CTR 加解密：记录当前偏移，逐段调用 update()"""
+
+    def __init__(self, engine: SM4Engine, iv: bytes, offset: int = 0):
+        self.engine = engine
+        self.iv = iv
+        self.offset = offset
+
+    def update(self, data: bytes) -> bytes:
+        out = self.engine.ctr(data, self.iv, self.offset)
+        self.offset += len(data)
+        return out
+
+
+class GmsslEngine(SM4Engine):
+    """gmssl 纯 Python 实现"""
+
+    name = "gmssl"
+
+    def __init__(self, key: bytes, schedule=None):
+        super().__init__(key, schedule)
+        self._encrypt_sk, self._decrypt_sk = self.schedule
+        self._sm4 = CryptSM4()
+
+    @classmethod
+    def expand_key(cls, key: bytes):
+        sm4 = CryptSM4()
+        sm4.set_key(key, SM4_ENCRYPT)
+        encrypt_sk = tuple(sm4.sk)
+        sm4.set_key(key, SM4_DECRYPT)
+        return encrypt_sk, tuple(sm4.sk)
+
+    def _crypt(self, data: bytes, sk) -> bytes:
+        out = bytearray()
+        for i in range(0, len(data), BLOCK_SIZE):
+            out += bytes(self._sm4.one_round(sk, data[i:i + BLOCK_SIZE]))
+        return bytes(out)
+
+    def encrypt_blocks(self, data: bytes) -> bytes:
+        return self._crypt(data, self._encrypt_sk)
+
+    def decrypt_blocks(self, data: bytes) -> bytes:
+        return self._crypt(data, self._decrypt_sk)
+
+
+class NumpyEngine(SM4Engine):
+    """
+    查表法实现：把 S 盒与线性变换 L 合并成 4 张 256 项的 T 表，
+    每轮只需 4 次查表和若干异或，并用 numpy 同时处理所有分组。
+    """
+
+    name = "numpy"
+
+    def __init__(self, key: bytes, schedule=None):
+        import numpy as np
+
+        super().__init__(key, schedule)
+        self._np = np
+        self._tables, self._encrypt_rk, self._decrypt_rk = self.schedule
+
+    @classmethod
+    def expand_key(cls, key: bytes):
+        import numpy as np
+
+        tables = tuple(np.array(t, dtype=np.uint32) for t in _t_tables())
+        encrypt_sk, decrypt_sk = GmsslEngine.expand_key(key)
+        return tables, tuple(np.uint32(k) for k in encrypt_sk), tuple(np.uint32(k) for k in decrypt_sk)
+
+    def _crypt(self, data: bytes, rk) -> bytes:
+        np = self._np
+        if not data:
+            return b""
+        t0, t1, t2, t3 = self._tables
+        words = np.frombuffer(data, dtype=">u4").astype(np.uint32).reshape(-1, 4)
+        x0, x1, x2, x3 = (words[:, i].copy() for i in range(4))
+        for k in rk:
+            t = x1 ^ x2 ^ x3 ^ k
+            t = t0[t >> 24] ^ t1[(t >> 16) & 0xFF] ^ t2[(t >> 8) & 0xFF] ^ t3[t & 0xFF]
+            x0, x1, x2, x3 = x1, x2, x3, x0 ^ t
+        return np.stack([x3, x2, x1, x0], axis=1).astype(">u4").tobytes()
+
+    def encrypt_blocks(self, data: bytes) -> bytes:
+        return self._crypt(data, self._encrypt_rk)
+
+    def decrypt_blocks(self, data: bytes) -> bytes:
+        return self._crypt(data, self._decrypt_rk)
+
+    def ctr(self, data: bytes, iv: bytes, offset: int = 0) -> bytes:
+        np = self._np
+        if not data:
+            return b""
+        skip = offset % BLOCK_SIZE
+        size = len(data)
+        count = (skip + size + BLOCK_SIZE - 1) // BLOCK_SIZE
+        # 在 numpy 中直接生成计数器：低 64 位逐块加一，溢出时向高 64 位进位
+        counter = (int.from_bytes(iv, "big") + offset // BLOCK_SIZE) & _COUNTER_MASK
+        base_lo = np.uint64(counter & 0xFFFFFFFFFFFFFFFF)
+        lo = base_lo + np.arange(count, dtype=np.uint64)
+        hi = np.uint64(counter >> 64) + (lo < base_lo).astype(np.uint64)
+        blocks = np.stack([hi, lo], axis=1).astype(">u8").tobytes()
+        keystream = np.frombuffer(self.encrypt_blocks(blocks), dtype=np.uint8)[skip:skip + size]
+        return (np.frombuffer(data, dtype=np.uint8) ^ keystream).tobytes()
+
+
+class CryptographyEngine(SM4Engine):
+    """基于 cryptography 库的 OpenSSL 原生实现"""
+
+    name = "cryptography"
+
+    def __init__(self, key: bytes, schedule=None):
+        from cryptography.hazmat.primitives.ciphers import Cipher, modes
+
+        super().__init__(key, schedule)
+        self._cipher = Cipher
+        self._modes = modes
+        # ECB 无链接状态，同一个 OpenSSL 上下文可在本线程内反复使用，省去每次的密钥扩展
+        self._ecb = Cipher(self.schedule, modes.ECB())
+        self._ecb_encryptor = self._ecb.encryptor()
+        self._ecb_decryptor = self._ecb.decryptor()
+
+    @classmethod
+    def expand_key(cls, key: bytes):
+        from cryptography.hazmat.primitives.ciphers import algorithms
+
+        return algorithms.SM4(key)
+
+    def encrypt_blocks(self, data: bytes) -> bytes:
+        return self._ecb_encryptor.update(data)
+
+    def decrypt_blocks(self, data: bytes) -> bytes:
+        return self._ecb_decryptor.update(data)
+
+    def ctr_stream(self, iv: bytes, offset: int = 0):
+        return _OpenSSLCTRStream(self._ctr_encryptor(iv, offset))
+
+    def _ctr_encryptor(self, iv: bytes, offset: int):
+        counter = _counter_blocks(iv, offset // BLOCK_SIZE, 1)
+        encryptor = self._cipher(self.schedule, self._modes.CTR(counter)).encryptor()
+        if offset % BLOCK_SIZE:
+            encryptor.update(bytes(offset % BLOCK_SIZE))
+        return encryptor
+
+    def ctr(self, data: bytes, iv: bytes, offset: int = 0) -> bytes:
+        if not data:
+            return b""
+        return self._ctr_encryptor(iv, offset).update(data)
+
+
+class _OpenSSLCTRStream:
+    """整条流只建立一次 OpenSSL CTR 上下文"""
+
+    def __init__(self, encryptor):
+        self._encryptor = encryptor
+
+    def update(self, data: bytes) -> bytes:
+        return self._encryptor.update(data)
+
+
+# 按优先级排列
+ENGINES = [CryptographyEngine, NumpyEngine, GmsslEngine]
+
+
+def _t_tables():
+    """生成查表法使用的 4 张 T 表：T_i[x] = L(Sbox(x) << (24 - 8i))"""
+    def rotl(x, n):
+        return ((x << n) | (x >> (32 - n))) & 0xFFFFFFFF
+
+    tables = []
+    for shift in (24, 16, 8, 0):
+        table = []
+        for value in SM4_BOXES_TABLE:
+            b = value << shift
+            table.append(b ^ rotl(b, 2) ^ rotl(b, 10) ^ rotl(b, 18) ^ rotl(b, 24))
+        tables.append(table)
+    return tables
+
+
+class CipherContextPool:
+    """
+    按线程分配加密上下文：轮密钥只在创建原型引擎时扩展一次，
+    每个线程首次使用时从原型派生自己的上下文，此后一直复用
+    """
+
+    def __init__(self, engine: SM4Engine):
+        self.engine = engine
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._created = 0
+
+    def get(self) -> SM4Engine:
+        context = getattr(self._local, "context", None)
+        if context is None:
+            context = self.engine.spawn()
+            self._local.context = context
+            with self._lock:
+                self._created += 1
+        return context
+
+    @property
+    def size(self) -> int:
+        """已创建的上下文数量（约等于使用过加密服务的线程数）"""
+        return self._created
+
+
+def verify_engine(engine: SM4Engine) -> bool:
+    """与 gmssl 的结果逐字节比对（标准向量 + 随机数据的 ECB/CTR）"""
+    reference = GmsslEngine(engine.key)
+    if GmsslEngine(_KAT_KEY).encrypt_blocks(_KAT_PLAIN) != _KAT_CIPHER:
+        return False
+    if engine.name != reference.name and type(engine)(_KAT_KEY).encrypt_blocks(_KAT_PLAIN) != _KAT_CIPHER:
+        return False
+    blocks = os.urandom(BLOCK_SIZE * 8)
+    iv = (_COUNTER_MASK - 2).to_bytes(BLOCK_SIZE, "big")  # 覆盖计数器回绕
+    data = os.urandom(77)
+    return (
+        engine.encrypt_blocks(blocks) == reference.encrypt_blocks(blocks)
+        and engine.decrypt_blocks(blocks) == reference.decrypt_blocks(blocks)
+        and engine.ctr(data, iv, 5) == reference.ctr(data, iv, 5)
+    )
+
+
+def select_engine(key: bytes, preferred: Optional[str] = None) -> SM4Engine:
+    """
+    选择可用的最快 SM4 实现；preferred 指定引擎名时优先使用该引擎，
+    不可用或校验失败时按默认顺序回退
+    """
+    candidates = list(ENGINES)
+    if preferred:
+        candidates.sort(key=lambda cls: cls.name != preferred)
+    for cls in candidates:
+        try:
+            engine = cls(key)
+            if verify_engine(engine):
+                logger.info("SM4 engine: %s", engine.name)
+                return engine
+            logger.warning("SM4 engine %s failed verification, skipped", cls.name)
+        except Exception as e:
+            logger.debug("SM4 engine %s unavailable: %s", cls.name, e)
+    raise RuntimeError("No usable SM4 engine")
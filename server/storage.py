@@ -0,0 +1,382 @@
+"""
+对象存储后端与 MinIO 连接。
+
+服务端通过 StorageBackend 描述的接口访问对象存储（与 minio.Minio 客户端的方法一致），
+STORAGE_BACKEND 选择实现：
+    minio  MinIO / S3（默认），使用下面配置的共享连接池
+    local  本地目录（local_storage.LocalStorage），适合单机、边缘部署和离线测试
+
+minio 默认的连接池每个主机只保留 10 个连接，并发上传、下载、列表时连接不够用，
+多出来的请求会新建 TCP 连接、用完即丢弃。这里按配置创建连接池：
+连接数与服务线程数匹配，开启 TCP keep-alive，设置超时与带退避的重试策略，
+并提供连接池使用情况的统计。
+
+配置（环境变量）：
+    STORAGE_BACKEND        minio（默认）/ local
+    STORAGE_LOCAL_ROOT     local 后端的数据目录，默认 ./storage-data
+    STORAGE_LOCAL_FSYNC    local 后端写入对象后是否 fsync，默认 1
+    MINIO_ENDPOINT / MINIO_ACCESS_KEY / MINIO_SECRET_KEY  minio 后端必填，未配置时启动即报错
+    MINIO_SECURE           是否使用 HTTPS，默认 0
+    MINIO_POOL_SIZE        每个主机保留的连接数，默认 64
+    MINIO_POOL_BLOCK       连接用尽时是否等待空闲连接（1）而不是新建临时连接（0，默认）
+    MINIO_CONNECT_TIMEOUT  建立连接超时（秒），默认 10
+    MINIO_READ_TIMEOUT     读超时（秒），默认 300
+    MINIO_RETRIES          失败重试次数，默认 5
+    MINIO_RETRY_BACKOFF    重试退避系数（秒），第 n 次重试前等待 backoff × 2^(n-1)，默认 0.2
+"""
+import os
+import socket
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import certifi
+import urllib3
+from minio import Minio
+from minio.datatypes import CompleteMultipartUploadResult, Part, parse_copy_object
+from minio.error import S3Error
+from minio.helpers import MAX_PART_SIZE, ObjectWriteResult, md5sum_hash
+from urllib3.connection import HTTPConnection
+from urllib3.util import Retry, Timeout
+
+
+class StorageBackend:
+    """
+    对象存储后端的接口：常用方法与 minio.Minio 客户端的公开方法一致，另加条件写入和分片上传的各个步骤。
+    MinioStorage（MinIO 客户端）和 local_storage.LocalStorage 是它的两种实现。
+    失败时抛出 minio.error.S3Error（NoSuchBucket、NoSuchKey、InvalidRange、PreconditionFailed 等），
+    返回值使用 minio 的数据类型（Object、ObjectWriteResult、DeleteError、Part）。
+    """
+
+    def bucket_exists(self, bucket_name: str) -> bool:
+        raise NotImplementedError
+
+    def make_bucket(self, bucket_name: str):
+        raise NotImplementedError
+
+    def put_object(self, bucket_name: str, object_name: str, data, length: int, content_type: str = "application/octet-stream",
+                   metadata: Optional[dict] = None, part_size: int = 0):
+        """写入对象，length 为 -1 时读到 data 结束为止"""
+        raise NotImplementedError
+
+    def put_if_absent(self, bucket_name: str, object_name: str, data: bytes, content_type: Optional[str] = None,
+                      metadata: Optional[dict] = None):
+        """单次写入小对象，对象已存在时失败（PreconditionFailed），判断与写入在存储端原子完成"""
+        raise NotImplementedError
+
+    def stat_object(self, bucket_name: str, object_name: str):
+        """返回 Object，metadata 中包含 x-amz-meta-* 用户元数据"""
+        raise NotImplementedError
+
+    def get_object(self, bucket_name: str, object_name: str, offset: int = 0, length: int = 0):
+        """读取 [offset, offset + length) 范围（length 为 0 表示到结尾），返回带 read / stream / close / release_conn 的响应"""
+        raise NotImplementedError
+
+    def list_objects(self, bucket_name: str, prefix: Optional[str] = None, recursive: bool = False,
+                     start_after: Optional[str] = None):
+        """按名称顺序惰性列举；非递归时子目录以 is_dir 的 Object 返回"""
+        raise NotImplementedError
+
+    def copy_object(self, bucket_name: str, object_name: str, source, metadata: Optional[dict] = None,
+                    metadata_directive: Optional[str] = None):
+        """服务端复制，source 为 CopySource；metadata_directive 为 REPLACE 时用 metadata 替换元数据"""
+        raise NotImplementedError
+
+    def copy_if_match(self, bucket_name: str, object_name: str, source, etag: str, metadata: Optional[dict] = None):
+        """
+        服务端复制，目标对象的当前 ETag 必须等于 etag（不存在或不同则 PreconditionFailed），判断与写入在存储端原子完成。
+        metadata（Content-Type 和 x-amz-meta-*）非空时替换目标的元数据，否则沿用源对象的元数据
+        """
+        raise NotImplementedError
+
+    def remove_object(self, bucket_name: str, object_name: str):
+        raise NotImplementedError
+
+    def remove_objects(self, bucket_name: str, delete_object_list):
+        """惰性批量删除，迭代返回值时执行，产出删除失败的 DeleteError"""
+        raise NotImplementedError
+
+    # ---- 分片上传 ----
+
+    def create_multipart(self, bucket_name: str, object_name: str, content_type: Optional[str] = None,
+                         metadata: Optional[dict] = None) -> str:
+        """创建分片上传，元数据在此时写入，合并后的对象直接带有；返回上传 ID"""
+        raise NotImplementedError
+
+    def upload_part(self, bucket_name: str, object_name: str, upload_id: str, part_number: int, data) -> str:
+        """上传一个分片，返回分片 ETag"""
+        raise NotImplementedError
+
+    def list_parts(self, bucket_name: str, object_name: str, upload_id: str, max_parts: Optional[int] = None,
+                   part_number_marker: Optional[int] = None):
+        """返回带 parts / is_truncated / next_part_number_marker 的结果"""
+        raise NotImplementedError
+
+    def complete_multipart(self, bucket_name: str, object_name: str, upload_id: str, parts,
+                           if_match: Optional[str] = None, if_none_match: bool = False):
+        """
+        合并分片，返回带 etag 的结果。if_match 时目标对象的当前 ETag 必须相同，
+        if_none_match 时目标对象必须不存在（不满足时 PreconditionFailed）
+        """
+        raise NotImplementedError
+
+    def abort_multipart(self, bucket_name: str, object_name: str, upload_id: str):
+        raise NotImplementedError
+
+
+def metadata_headers(content_type: Optional[str] = None, metadata: Optional[dict] = None) -> dict:
+    """Content-Type 和用户元数据组成的请求头，元数据键统一加上 x-amz-meta- 前缀"""
+    headers = {"Content-Type": content_type or "application/octet-stream"}
+    for key, value in (metadata or {}).items():
+        if key.lower() == "content-type":
+            headers["Content-Type"] = value
+        else:
+            headers[key if key.lower().startswith("x-amz-meta-") else "x-amz-meta-" + key] = str(value)
+    return headers
+
+
+def _conditions(if_match: Optional[str] = None, if_none_match: bool = False) -> dict:
+    headers = {}
+    if if_match is not None:
+        headers["If-Match"] = '"' + if_match.strip('"') + '"'
+    if if_none_match:
+        headers["If-None-Match"] = "*"
+    return headers
+
+
+class LockTimeout(TimeoutError):
+    """等待存储端的锁超时"""
+
+
+def _lock_expired(client, bucket_name: str, name: str, stale: float) -> bool:
+    """锁已不存在或早于 stale 秒前创建"""
+    try:
+        stat = client.stat_object(bucket_name, name)
+    except S3Error as e:
+        if e.code == "NoSuchKey":
+            return True
+        raise
+    return datetime.now(timezone.utc) - stat.last_modified > timedelta(seconds=stale)
+
+
+@contextmanager
+def object_lock(client, bucket_name: str, name: str, timeout: float = 30, stale: float = 60):
+    """
+    持有存储端的锁：锁是 bucket_name 中的 name 对象，用 put_if_absent 创建，
+    因此多个工作进程、多台服务器共用同一存储时同样有效。
+    锁被占用时退避重试，超过 timeout 秒抛出 LockTimeout；持有者崩溃留下的锁超过 stale 秒后视为失效
+    """
+    deadline = time.monotonic() + timeout
+    delay = 0.01
+    while True:
+        try:
+            client.put_if_absent(bucket_name, name, b"")
+            break
+        except S3Error as e:
+            # 并发的条件写入在 S3 上也可能返回 ConditionalRequestConflict
+            if e.code not in ("PreconditionFailed", "ConditionalRequestConflict"):
+                raise
+        if _lock_expired(client, bucket_name, name, stale):
+            client.remove_object(bucket_name, name)
+            continue
+        if time.monotonic() >= deadline:
+            raise LockTimeout(f"Timed out waiting for the lock {bucket_name}/{name}")
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
+    try:
+        yield
+    finally:
+        client.remove_object(bucket_name, name)
+
+
+class MinioStorage(Minio, StorageBackend):
+    """
+    MinIO 客户端：StorageBackend 中 minio 没有公开的方法（条件写入、分片上传的各个步骤）
+    在这里基于 minio 的内部请求实现，服务端的其他代码不直接调用 minio 的内部方法
+    """
+
+    def __init__(self, endpoint: str, http_client: Optional[urllib3.PoolManager] = None, **kwargs):
+        super().__init__(endpoint, http_client=http_client, **kwargs)
+        # 保留传入的连接池供 pool_stats 报告使用情况；未传入时由 minio 自行创建，不报告
+        self.http_client = http_client
+
+    def put_if_absent(self, bucket_name: str, object_name: str, data: bytes, content_type: Optional[str] = None,
+                      metadata: Optional[dict] = None) -> ObjectWriteResult:
+        headers = dict(metadata_headers(content_type, metadata), **_conditions(if_none_match=True))
+        return self._put_object(bucket_name, object_name, bytes(data), headers)
+
+    def copy_if_match(self, bucket_name: str, object_name: str, source, etag: str,
+                      metadata: Optional[dict] = None) -> ObjectWriteResult:
+        headers = _conditions(if_match=etag)
+        if metadata:
+            headers.update(metadata_headers(metadata=metadata))
+            headers["x-amz-metadata-directive"] = "REPLACE"
+        size = self.stat_object(source.bucket_name, source.object_name, version_id=source.version_id).size
+        if size <= MAX_PART_SIZE:
+            headers.update(source.gen_copy_headers())
+            response = self._execute("PUT", bucket_name, object_name, headers=headers)
+            result_etag, last_modified = parse_copy_object(response)
+            return ObjectWriteResult(
+                bucket_name, object_name, response.headers.get("x-amz-version-id"), result_etag, response.headers,
+                last_modified=last_modified,
+            )
+        # 超过单次复制上限：按 5 GiB 分片复制，元数据在创建时写入（未指定时取源对象的），条件在合并时才判断
+        if not metadata:
+            stat = self.stat_object(source.bucket_name, source.object_name, version_id=source.version_id)
+            metadata = {key: value for key, value in (stat.metadata or {}).items()
+                        if key.lower().startswith("x-amz-meta-")}
+            metadata["Content-Type"] = stat.content_type
+        upload_id = self.create_multipart(bucket_name, object_name, metadata=metadata)
+        try:
+            parts = []
+            for part_number, offset in enumerate(range(0, size, MAX_PART_SIZE), 1):
+                part_headers = source.gen_copy_headers()
+                part_headers["x-amz-copy-source-range"] = f"bytes={offset}-{min(offset + MAX_PART_SIZE, size) - 1}"
+                part_etag, _ = self._upload_part_copy(bucket_name, object_name, upload_id, part_number, part_headers)
+                parts.append(Part(part_number, part_etag))
+            return self.complete_multipart(bucket_name, object_name, upload_id, parts, if_match=etag)
+        except BaseException:
+            self.abort_multipart(bucket_name, object_name, upload_id)
+            raise
+
+    def create_multipart(self, bucket_name: str, object_name: str, content_type: Optional[str] = None,
+                         metadata: Optional[dict] = None) -> str:
+        return self._create_multipart_upload(bucket_name, object_name, metadata_headers(content_type, metadata))
+
+    def upload_part(self, bucket_name: str, object_name: str, upload_id: str, part_number: int, data) -> str:
+        return self._upload_part(bucket_name, object_name, data, None, upload_id, part_number)
+
+    def list_parts(self, bucket_name: str, object_name: str, upload_id: str, max_parts: Optional[int] = None,
+                   part_number_marker: Optional[int] = None):
+        return self._list_parts(
+            bucket_name, object_name, upload_id, max_parts=max_parts, part_number_marker=part_number_marker
+        )
+
+    def complete_multipart(self, bucket_name: str, object_name: str, upload_id: str, parts,
+                           if_match: Optional[str] = None, if_none_match: bool = False):
+        headers = _conditions(if_match, if_none_match)
+        if not headers:
+            return self._complete_multipart_upload(bucket_name, object_name, upload_id, parts)
+        # minio 的合并请求不能附加请求头，带条件时自行构造同样的请求
+        body = '<CompleteMultipartUpload xmlns="http://s3.amazonaws.com/doc/2006-03-01/">' + "".join(
+            f"<Part><PartNumber>{part.part_number}</PartNumber><ETag>\"{part.etag}\"</ETag></Part>"
+            for part in parts
+        ) + "</CompleteMultipartUpload>"
+        body = body.encode()
+        headers.update({"Content-Type": "application/xml", "Content-MD5": md5sum_hash(body)})
+        response = self._execute(
+            "POST", bucket_name, object_name, body=body, headers=headers, query_params={"uploadId": upload_id}
+        )
+        return CompleteMultipartUploadResult(response)
+
+    def abort_multipart(self, bucket_name: str, object_name: str, upload_id: str):
+        self._abort_multipart_upload(bucket_name, object_name, upload_id)
+
+
+class StorageConfig:
+    """存储后端与 MinIO 连接配置，默认值来自环境变量"""
+
+    def __init__(self, endpoint: Optional[str] = None, access_key: Optional[str] = None,
+                 secret_key: Optional[str] = None, secure: Optional[bool] = None,
+                 backend: Optional[str] = None, local_root: Optional[str] = None):
+        env = os.environ
+        self.backend = (backend or env.get("STORAGE_BACKEND", "minio")).lower()
+        if self.backend not in ("minio", "local"):
+            raise ValueError(f"Unknown storage backend: {self.backend}")
+        self.local_root = local_root or env.get("STORAGE_LOCAL_ROOT", "storage-data")
+        self.local_fsync = env.get("STORAGE_LOCAL_FSYNC", "1") == "1"
+        self.endpoint = endpoint or env.get("MINIO_ENDPOINT")
+        self.access_key = access_key or env.get("MINIO_ACCESS_KEY")
+        self.secret_key = secret_key or env.get("MINIO_SECRET_KEY")
+        if self.backend == "minio":
+            # 连接信息和密钥只来自配置，缺失时直接失败，不回退到任何内置地址
+            missing = [
+                name for name, value in (
+                    ("MINIO_ENDPOINT", self.endpoint),
+                    ("MINIO_ACCESS_KEY", self.access_key),
+                    ("MINIO_SECRET_KEY", self.secret_key),
+                ) if not value
+            ]
+            if missing:
+                raise ValueError(f"MinIO storage is not configured: set {', '.join(missing)}")
+        self.secure = secure if secure is not None else env.get("MINIO_SECURE", "0") == "1"
+        self.pool_size = int(env.get("MINIO_POOL_SIZE", 64))
+        self.pool_block = env.get("MINIO_POOL_BLOCK", "0") == "1"
+        self.connect_timeout = float(env.get("MINIO_CONNECT_TIMEOUT", 10))
+        self.read_timeout = float(env.get("MINIO_READ_TIMEOUT", 300))
+        self.retries = int(env.get("MINIO_RETRIES", 5))
+        self.retry_backoff = float(env.get("MINIO_RETRY_BACKOFF", 0.2))
+
+
+def _keepalive_options() -> list:
+    """开启 TCP keep-alive，空闲连接不会被中间设备悄悄断开"""
+    options = HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    for name, value in (("TCP_KEEPIDLE", 60), ("TCP_KEEPINTVL", 15), ("TCP_KEEPCNT", 4)):
+        if hasattr(socket, name):
+            options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return options
+
+
+def create_http_client(config: StorageConfig) -> urllib3.PoolManager:
+    return urllib3.PoolManager(
+        num_pools=16,
+        maxsize=config.pool_size,
+        block=config.pool_block,
+        timeout=Timeout(connect=config.connect_timeout, read=config.read_timeout),
+        retries=Retry(
+            total=config.retries,
+            backoff_factor=config.retry_backoff,
+            status_forcelist=[500, 502, 503, 504],
+        ),
+        socket_options=_keepalive_options(),
+        cert_reqs="CERT_REQUIRED",
+        ca_certs=os.environ.get("SSL_CERT_FILE") or certifi.where(),
+    )
+
+
+def create_minio_client(config: Optional[StorageConfig] = None) -> MinioStorage:
+    config = config or StorageConfig()
+    return MinioStorage(
+        config.endpoint,
+        access_key=config.access_key,
+        secret_key=config.secret_key,
+        secure=config.secure,
+        http_client=create_http_client(config),
+    )
+
+
+def create_storage(config: Optional[StorageConfig] = None):
+    """按配置创建存储后端"""
+    config = config or StorageConfig()
+    if config.backend == "local":
+        from local_storage import LocalStorage
+        return LocalStorage(config.local_root, fsync=config.local_fsync)
+    return create_minio_client(config)
+
+
+def pool_stats(client) -> list:
+    """
+    各主机连接池的使用情况：
+    created 为累计新建的连接数（持续增长说明连接池不够用），requests 为累计请求数，
+    idle 为当前空闲可复用的连接数，maxsize 为连接池容量；
+    只有 create_minio_client 创建的客户端（持有 http_client）才有统计，本地存储后端返回空列表
+    """
+    http = getattr(client, "http_client", None)
+    if not isinstance(http, urllib3.PoolManager):
+        return []
+    stats = []
+    for key in list(http.pools.keys()):
+        pool = http.pools.get(key)
+        if pool is None:
+            continue
+        queue = pool.pool
+        idle = sum(1 for conn in list(queue.queue) if conn is not None) if queue is not None else 0
+        stats.append({
+            "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+            "maxsize": queue.maxsize if queue is not None else 0,
+            "created": pool.num_connections,
+            "requests": pool.num_requests,
+            "idle": idle,
+        })
+    return stats
@@ -0,0 +1,403 @@
+"""
+网关基准测试：不需要真实 MinIO，可离线运行。
+
+服务端在进程内运行，存储使用临时目录中的本地存储后端（local_storage.LocalStorage），
+请求通过 Flask 测试客户端发出，测量的是网关自身（加解密、摘要、流式处理、列表）的开销：
+
+    上传 / 下载    不同文件大小、并发数、SM4 引擎下的吞吐量与 p50 / p99 延迟
+    /list          目录中对象数不同时的延迟（列表缓存冷 / 热）
+    重新加密       密钥轮换后 reencrypt 任务按不同对象并发数改写已有对象的吞吐量
+
+结果写成 JSON；传入 --baseline 时与上次的结果逐项比较，
+吞吐下降或延迟（p50、p99）上升超过 --tolerance 时以非 0 状态退出，部署前即可发现热点路径的性能回退。
+
+    python test/benchmark.py                                 # 默认参数，结果写入 benchmark.json
+    python test/benchmark.py --quick                         # 小规模快速检查
+    python test/benchmark.py --engines cryptography,numpy,gmssl --sizes 64K,16M --concurrency 1,8
+    python test/benchmark.py --latency 2                     # 每次存储请求加 2ms 往返，模拟远端 MinIO
+    python test/benchmark.py --baseline benchmark.json --output new.json
+
+SM4 引擎在服务端导入时选定，因此每个引擎在单独的子进程中测试。
+"""
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.dirname(TEST_DIR)
+
+BUCKET = "bench"
+# 比较基线时使用的指标：吞吐越大越好，延迟越小越好
+HIGHER_IS_BETTER = ("throughput_mb_s",)
+LOWER_IS_BETTER = ("p50_ms", "p99_ms")
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().upper().rstrip("B").rstrip("I")
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def parse_list(text: str, convert=str) -> list:
+    return [convert(item) for item in text.split(",") if item.strip()]
+
+
+def percentile(values: list, p: float) -> float:
+    """最近秩百分位数"""
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def latency_summary(latencies: list) -> dict:
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "max_ms": round(max(latencies) * 1000, 3),
+    }
+
+
+def run_concurrently(app, count: int, concurrency: int, request) -> tuple:
+    """
+    用 concurrency 个线程共发出 count 个请求，request(client, i) 返回是否成功。
+    返回 (每个请求的耗时, 失败数, 总耗时)
+    """
+    local = threading.local()
+    latencies = [0.0] * count
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = app.test_client()
+        started = time.perf_counter()
+        ok = request(client, i)
+        latencies[i] = time.perf_counter() - started
+        if not ok:
+            with lock:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(count)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def bench_transfers(server, engine: str, sizes: list, concurrency_levels: list, requests: int) -> list:
+    app = server.app
+    results = []
+    for size in sizes:
+        payload = os.urandom(size)
+        for concurrency in concurrency_levels:
+            count = max(requests, concurrency)
+            prefix = f"transfer/{size}/{concurrency}/"
+
+            def upload(client, i):
+                response = client.post("/upload", data={
+                    "bucket": BUCKET,
+                    "object_name": f"{prefix}{i}",
+                    "file": (io.BytesIO(payload), "payload.bin"),
+                }, content_type="multipart/form-data")
+                return response.status_code == 200
+
+            def download(client, i):
+                response = client.get("/download", query_string={"bucket": BUCKET, "object_name": f"{prefix}{i}"})
+                return response.status_code == 200 and len(response.get_data()) == size
+
+            for op, request in (("upload", upload), ("download", download)):
+                latencies, errors, wall = run_concurrently(app, count, concurrency, request)
+                result = {
+                    "op": op,
+                    "engine": engine,
+                    "size": size,
+                    "concurrency": concurrency,
+                    "requests": count,
+                    "errors": errors,
+                    "wall_s": round(wall, 4),
+                    "throughput_mb_s": round(size * count / wall / 1024 / 1024, 3),
+                }
+                result.update(latency_summary(latencies))
+                results.append(result)
+                log(result)
+            server.minio_client.remove_objects(BUCKET, _delete_list(server.minio_client, prefix))
+    return results
+
+
+def bench_reencrypt(server, engine: str, sizes: list, concurrency_levels: list, objects: int) -> list:
+    """密钥轮换：每轮加入一个新密钥并设为当前密钥，用 reencrypt 任务把 objects 个对象改用新密钥，测量吞吐量"""
+    from encryption import KeyRing
+
+    keys = {}
+    results = []
+    client = server.app.test_client()
+    for size in sizes:
+        payload = os.urandom(size)
+        prefix = f"reencrypt/{size}/"
+        for i in range(objects):
+            client.post("/upload", data={
+                "bucket": BUCKET,
+                "object_name": f"{prefix}{i}",
+                "file": (io.BytesIO(payload), "payload.bin"),
+            }, content_type="multipart/form-data")
+        for concurrency in concurrency_levels:
+            keys[f"bench-{len(keys)}"] = os.urandom(16)
+            server.key_ring = KeyRing(keys, engine=engine)
+            server.parallel_uploader.service = server.key_ring.active
+            started = time.perf_counter()
+            job = server.job_queue.submit(
+                "reencrypt", {"bucket": BUCKET, "prefix": prefix, "concurrency": concurrency}, max_attempts=1
+            )
+            while job["state"] in ("queued", "running"):
+                time.sleep(0.005)
+                job = server.job_queue.get(job["job_id"])
+            wall = time.perf_counter() - started
+            updated = job["progress"].get("updated", 0)
+            result = {
+                "op": "reencrypt",
+                "engine": engine,
+                "size": size,
+                "concurrency": concurrency,
+                "requests": objects,
+                "errors": objects - updated,
+                "wall_s": round(wall, 4),
+                "throughput_mb_s": round(size * updated / wall / 1024 / 1024, 3),
+            }
+            results.append(result)
+            log(result)
+        server.minio_client.remove_objects(BUCKET, _delete_list(server.minio_client, prefix))
+    return results
+
+
+def _delete_list(client, prefix: str):
+    from minio.deleteobjects import DeleteObject
+
+    return [DeleteObject(obj.object_name) for obj in client.list_objects(BUCKET, prefix=prefix, recursive=True)]
+
+
+def bench_list(server, engine: str, folder_sizes: list, requests: int) -> list:
+    """目录中有 N 个对象时 /list 的延迟；cold 每次请求前清空列表缓存，warm 命中缓存"""
+    client = server.minio_client
+    app = server.app
+    results = []
+    for count in folder_sizes:
+        prefix = f"list/{count}/"
+        for i in range(count):
+            client.put_object(BUCKET, f"{prefix}{i:08d}.bin", io.BytesIO(b"x"), 1)
+        # 混入几个子目录，覆盖文件夹统计的路径
+        for i in range(min(10, count)):
+            client.put_object(BUCKET, f"{prefix}sub{i}/file.bin", io.BytesIO(b"x"), 1)
+
+        def request(test_client, i):
+            if cold:
+                server.list_cache.clear()
+            response = test_client.get("/list", query_string={"bucket": BUCKET, "prefix": prefix})
+            return response.status_code == 200
+
+        for cold in (True, False):
+            latencies, errors, wall = run_concurrently(app, requests, 1, request)
+            result = {
+                "op": "list",
+                "engine": engine,
+                "objects": count,
+                "cache": "cold" if cold else "warm",
+                "requests": requests,
+                "errors": errors,
+                "wall_s": round(wall, 4),
+            }
+            result.update(latency_summary(latencies))
+            results.append(result)
+            log(result)
+        client.remove_objects(BUCKET, _delete_list(client, prefix))
+    return results
+
+
+class DelayedStorage:
+    """存储后端包装：每次调用前等待固定时间，模拟与 MinIO 之间的网络往返"""
+
+    def __init__(self, client, delay: float):
+        self._client = client
+        self._delay = delay
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            time.sleep(self._delay)
+            return attr(*args, **kwargs)
+
+        return call
+
+
+def log(result: dict):
+    fields = " ".join(f"{key}={value}" for key, value in result.items())
+    print(fields, file=sys.stderr, flush=True)
+
+
+def run_child(args) -> dict:
+    """在当前进程中导入服务端并测试一个引擎"""
+    sys.path.insert(0, SERVER_DIR)
+    # 对象数据和后台任务库都放在临时目录，不在当前目录留下文件
+    directory = tempfile.mkdtemp(prefix="sm4-bench-")
+    os.environ.update(
+        STORAGE_BACKEND="local",
+        STORAGE_LOCAL_ROOT=os.path.join(directory, "storage"),
+        STORAGE_LOCAL_FSYNC="0",
+        JOBS_DB_PATH=os.path.join(directory, "jobs.db"),
+    )
+    import minio_server
+
+    try:
+        engine = minio_server.key_ring.active.engine_name
+        if engine != args.child:
+            # 请求的引擎不可用时服务端会自动回退到其他引擎，此时不计入结果
+            return {"engine": args.child, "unavailable": True, "results": []}
+
+        if args.latency:
+            minio_server.minio_client = DelayedStorage(minio_server.minio_client, args.latency / 1000)
+        minio_server.minio_client.make_bucket(BUCKET)
+        minio_server.start_background_workers()
+        results = bench_transfers(
+            minio_server, engine,
+            parse_list(args.sizes, parse_size),
+            parse_list(args.concurrency, int),
+            args.requests
+        )
+        results += bench_list(minio_server, engine, parse_list(args.list_sizes, int), args.list_requests)
+        results += bench_reencrypt(
+            minio_server, engine,
+            parse_list(args.sizes, parse_size),
+            parse_list(args.concurrency, int),
+            args.reencrypt_objects
+        )
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return {"engine": engine, "unavailable": False, "results": results}
+
+
+def result_key(result: dict) -> tuple:
+    return tuple(result.get(key) for key in ("op", "engine", "size", "concurrency", "objects", "cache"))
+
+
+def compare(results: list, baseline: list, tolerance: float) -> list:
+    """返回退化超过 tolerance 的指标"""
+    previous = {result_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get(result_key(result))
+        if old is None:
+            continue
+        for metric in HIGHER_IS_BETTER + LOWER_IS_BETTER:
+            if metric not in result or not old.get(metric):
+                continue
+            change = (result[metric] - old[metric]) / old[metric]
+            if (metric in HIGHER_IS_BETTER and change < -tolerance) or (metric in LOWER_IS_BETTER and change > tolerance):
+                regressions.append({
+                    "case": {key: value for key, value in zip(
+                        ("op", "engine", "size", "concurrency", "objects", "cache"), result_key(result)
+                    ) if value is not None},
+                    "metric": metric,
+                    "baseline": old[metric],
+                    "current": result[metric],
+                    "change": round(change, 4),
+                })
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SERVER_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="MinIO 网关基准测试（使用本地存储后端，无需 MinIO）")
+    parser.add_argument("--engines", default="cryptography,numpy", help="SM4 引擎，逗号分隔（gmssl 很慢，默认不测）")
+    parser.add_argument("--sizes", default="4K,1M,16M,40M", help="文件大小，逗号分隔；40M 会走分片并行上传")
+    parser.add_argument("--concurrency", default="1,4,16", help="并发数，逗号分隔")
+    parser.add_argument("--requests", type=int, default=16, help="每个用例的请求数（不少于并发数）")
+    parser.add_argument("--list-sizes", default="10,1000,10000", help="/list 测试的目录对象数，逗号分隔")
+    parser.add_argument("--list-requests", type=int, default=20, help="每个 /list 用例的请求数")
+    parser.add_argument("--reencrypt-objects", type=int, default=16, help="重新加密测试中每种大小的对象数")
+    parser.add_argument("--latency", type=float, default=0.0, help="模拟的 MinIO 请求往返时间（毫秒）")
+    parser.add_argument("--quick", action="store_true", help="小规模快速检查")
+    parser.add_argument("--output", default="benchmark.json", help="结果 JSON 文件")
+    parser.add_argument("--baseline", help="与之比较的上次结果 JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的退化比例，默认 0.2")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.sizes, args.concurrency, args.requests = "4K,1M", "1,4", 8
+        args.list_sizes, args.list_requests = "10,1000", 10
+        args.reencrypt_objects = 4
+
+    if args.child:
+        json.dump(run_child(args), sys.stdout)
+        return 0
+
+    runs = []
+    for engine in parse_list(args.engines):
+        env = dict(os.environ, SM4_ENGINE=engine)
+        command = [sys.executable, os.path.abspath(__file__), "--child", engine] + [
+            f"--{name.replace('_', '-')}={getattr(args, name)}"
+            for name in ("sizes", "concurrency", "requests", "list_sizes", "list_requests", "reencrypt_objects",
+                         "latency")
+        ]
+        print(f"== engine {engine}", file=sys.stderr, flush=True)
+        completed = subprocess.run(command, env=env, stdout=subprocess.PIPE, check=True)
+        runs.append(json.loads(completed.stdout))
+
+    sys.path.insert(0, SERVER_DIR)
+    import sm3_hasher
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "sm3_backend": sm3_hasher.BACKEND,
+            "engines": {run["engine"]: not run["unavailable"] for run in runs},
+            "backend": "local",
+            "latency_ms": args.latency,
+        },
+        "results": [result for run in runs for result in run["results"]],
+    }
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        report["regressions"] = compare(report["results"], baseline, args.tolerance)
+        for regression in report["regressions"]:
+            print(f"REGRESSION {json.dumps(regression, ensure_ascii=False)}", file=sys.stderr)
+        exit_code = 1 if report["regressions"] else 0
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"results written to {args.output}", file=sys.stderr)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
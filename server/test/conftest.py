@@ -0,0 +1,78 @@
+"""
+pytest 公共配置：服务端使用临时目录中的本地存储后端（local_storage.py），不需要 MinIO。
+
+minio_server 在导入时读取环境变量，因此要在导入之前设置好；
+大文件并行上传的分片大小设为 MinIO 允许的最小值，测试用的文件不必很大就能跨越分片边界。
+
+    cd server && python -m pytest -q
+"""
+import io
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+DATA_DIR = tempfile.mkdtemp(prefix="sm4-test-")
+os.environ.update(
+    STORAGE_BACKEND="local",
+    STORAGE_LOCAL_ROOT=os.path.join(DATA_DIR, "storage"),
+    STORAGE_LOCAL_FSYNC="0",
+    DATA_DIR=DATA_DIR,
+    JOBS_DB_PATH=os.path.join(DATA_DIR, "jobs.db"),
+    METADATA_INDEX_PATH="",
+    MULTIPART_PART_SIZE=str(5 * 1024 * 1024),
+    DEDUP_UPLOADS="0",
+    CONTENT_CACHE_MEMORY_MB="0",
+    CONTENT_CACHE_DISK_MB="0",
+)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def server():
+    import minio_server
+    return minio_server
+
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
+
+
+@pytest.fixture
+def bucket(server):
+    """每个测试使用单独的存储桶"""
+    name = f"test-{uuid.uuid4().hex[:12]}"
+    server.minio_client.make_bucket(name)
+    return name
+
+
+@pytest.fixture
+def upload(client):
+    """通过 /upload 上传 data（dedup 时以去重方式上传），返回响应 JSON"""
+    def upload(bucket_name: str, object_name: str, data: bytes, dedup: bool = False) -> dict:
+        response = client.post("/upload", data={
+            "bucket": bucket_name,
+            "object_name": object_name,
+            "dedup": "1" if dedup else "0",
+            "file": (io.BytesIO(data), object_name),
+        }, content_type="multipart/form-data")
+        assert response.status_code == 200, response.json
+        return response.json
+    return upload
+
+
+@pytest.fixture(scope="session")
+def jobs(server):
+    """启动后台任务的工作线程（守护线程，随测试进程退出）"""
+    server.job_queue.start()
+    return server.job_queue
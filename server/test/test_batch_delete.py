@@ -0,0 +1,59 @@
+"""批量删除：显式指定的对象和递归删除的文件夹一次多对象删除完成，不存在的对象记为 not_found"""
+import io
+import os
+
+import pytest
+
+from bulk_ops import DELETE_BATCH_SIZE
+
+
+def batch_delete(client, bucket, keys=(), prefixes=()):
+    return client.post("/batch-delete", json={"bucket": bucket, "keys": list(keys), "prefixes": list(prefixes)})
+
+
+def names(server, bucket):
+    return sorted(obj.object_name for obj in server.minio_client.list_objects(bucket, recursive=True))
+
+
+def test_keys_and_prefixes(server, client, bucket, upload):
+    for name in ("a.bin", "b.bin", "dir/c.bin", "dir/sub/d.bin", "dir2/e.bin", "keep.bin"):
+        upload(bucket, name, os.urandom(10))
+
+    response = batch_delete(client, bucket, keys=["a.bin", "b.bin", "missing.bin"], prefixes=["dir", "dir2/"])
+    assert response.status_code == 200
+    body = response.json
+    assert (body["deleted"], body["failed"], body["not_found"]) == (5, 0, 1)
+    statuses = {item["name"]: item["status"] for item in body["results"]}
+    assert statuses == {
+        "a.bin": "deleted", "b.bin": "deleted", "dir/c.bin": "deleted", "dir/sub/d.bin": "deleted",
+        "dir2/e.bin": "deleted", "missing.bin": "not_found",
+    }
+    assert names(server, bucket) == ["keep.bin"]
+
+
+def test_more_than_one_batch(server, client, bucket):
+    # 超过一次多对象删除的上限，分批提交
+    count = DELETE_BATCH_SIZE + 5
+    for i in range(count):
+        server.minio_client.put_object(bucket, f"dir/{i:04d}", io.BytesIO(b""), 0)
+    body = batch_delete(client, bucket, prefixes=["dir/"]).json
+    assert body["deleted"] == count
+    assert names(server, bucket) == []
+
+
+def test_listing_invalidated(client, bucket, upload):
+    upload(bucket, "a.bin", b"a")
+    upload(bucket, "b.bin", b"b")
+    assert len(client.get("/list", query_string={"bucket": bucket}).json["files"]) == 2
+    batch_delete(client, bucket, keys=["a.bin"])
+    files = client.get("/list", query_string={"bucket": bucket}).json["files"]
+    assert [item["name"] for item in files] == ["b.bin"]
+
+
+@pytest.mark.parametrize("body", [{}, {"keys": "a.bin"}, {"keys": [""]}, {"prefixes": [1]}])
+def test_invalid_request(client, bucket, body):
+    assert client.post("/batch-delete", json=dict(body, bucket=bucket)).status_code == 400
+
+
+def test_missing_bucket(client):
+    assert batch_delete(client, "no-such-bucket-x", keys=["a"]).status_code == 404
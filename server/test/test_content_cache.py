@@ -0,0 +1,157 @@
+"""热点下载的内容缓存：内存层缓存明文、磁盘层缓存密文，LRU 淘汰，ETag 变化或本服务改写、删除对象时失效"""
+import io
+import os
+
+import pytest
+
+from content_cache import ContentCache
+
+
+class Reads:
+    """统计 get_object 的次数，命中缓存的下载不应读取存储"""
+
+    def __init__(self, client):
+        self._client = client
+        self.count = 0
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def get_object(self, *args, **kwargs):
+        self.count += 1
+        return self._client.get_object(*args, **kwargs)
+
+
+@pytest.fixture
+def cache(server, tmp_path, monkeypatch):
+    """内存层放 1000 字节以内的对象，磁盘层放其余的；revalidate 为 0 时每次下载都确认 ETag"""
+    cache = ContentCache(memory_size=4000, memory_item_size=1000, disk_size=1024 * 1024,
+                         disk_item_size=512 * 1024, directory=str(tmp_path), revalidate=0)
+    monkeypatch.setattr(server, "content_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def reads(server, monkeypatch):
+    reads = Reads(server.minio_client)
+    monkeypatch.setattr(server, "minio_client", reads)
+    return reads
+
+
+def download(client, bucket, name, **headers):
+    response = client.get("/download", query_string={"bucket": bucket, "object_name": name}, headers=headers)
+    return response.status_code, response.get_data()
+
+
+@pytest.mark.parametrize("size, tier", [(500, "memory"), (100000, "disk")])
+def test_hit_skips_storage(server, client, bucket, upload, cache, reads, size, tier):
+    data = os.urandom(size)
+    upload(bucket, "a.bin", data)
+
+    assert download(client, bucket, "a.bin") == (200, data)
+    stats = cache.stats()
+    assert stats[tier]["items"] == 1 and stats[tier]["bytes"] == size
+    reads.count = 0
+    assert download(client, bucket, "a.bin") == (200, data)
+    assert download(client, bucket, "a.bin", Range="bytes=10-19") == (206, data[10:20])
+    assert reads.count == 0
+    assert cache.stats()["hits"] == 2
+    if tier == "disk":
+        # 磁盘层只保存密文
+        etag = server.minio_client.stat_object(bucket, "a.bin").etag
+        path = cache.get(bucket, "a.bin", etag).path
+        with open(path, "rb") as f:
+            assert data[:64] not in f.read()
+
+
+def test_too_large_is_not_cached(client, bucket, upload, cache):
+    data = os.urandom(600 * 1024)
+    upload(bucket, "a.bin", data)
+    assert download(client, bucket, "a.bin") == (200, data)
+    stats = cache.stats()
+    assert stats["memory"]["items"] == stats["disk"]["items"] == 0
+
+
+def test_range_download_is_not_cached(client, bucket, upload, cache):
+    upload(bucket, "a.bin", os.urandom(500))
+    download(client, bucket, "a.bin", Range="bytes=0-9")
+    stats = cache.stats()
+    assert stats["memory"]["items"] == stats["disk"]["items"] == 0
+
+
+def test_lru_eviction():
+    cache = ContentCache(memory_size=1000, memory_item_size=1000)
+    meta = {"etag": "e", "content_type": None, "last_modified": None}
+    for name in ("a", "b"):
+        cache.put("bucket", name, dict(meta, size=400), b"x" * 400)
+    # 访问 a 后 b 成为最久未用的条目
+    assert cache.get("bucket", "a", "e") is not None
+    cache.put("bucket", "c", dict(meta, size=400), b"x" * 400)
+    assert cache.get("bucket", "b", "e") is None
+    assert cache.get("bucket", "a", "e") is not None
+    assert cache.stats()["memory"]["bytes"] == 800
+
+
+def test_disk_eviction_removes_file(tmp_path):
+    cache = ContentCache(disk_size=1000, disk_item_size=1000, directory=str(tmp_path))
+    meta = {"etag": "e", "content_type": None, "last_modified": None, "size": 600}
+    paths = []
+    for name in ("a", "b"):
+        writer = cache.disk_writer("bucket", name, meta, b"\0" * 16)
+        writer.write(b"x" * 600)
+        writer.commit()
+        paths.append(writer.path)
+    assert cache.get("bucket", "a", "e") is None
+    assert not os.path.exists(paths[0]) and os.path.exists(paths[1])
+
+
+def test_etag_revalidation(server, client, bucket, upload, cache):
+    upload(bucket, "a.bin", b"old content")
+    download(client, bucket, "a.bin")
+    # 绕过本服务直接改写存储中的对象，缓存没有被主动失效
+    newer = os.urandom(300)
+    ciphertext = server.key_ring.active.encrypt(newer)
+    server.minio_client.put_object(bucket, "a.bin", io.BytesIO(ciphertext), len(ciphertext))
+    assert download(client, bucket, "a.bin") == (200, newer)
+
+
+def test_revalidate_window(server, client, bucket, upload, cache, reads):
+    cache.revalidate = 60
+    data = os.urandom(500)
+    upload(bucket, "a.bin", data)
+    download(client, bucket, "a.bin")
+    reads.count = 0
+    stat_object = server.minio_client.stat_object
+    server.minio_client.stat_object = None
+    try:
+        # 窗口内既不 stat 也不读取对象
+        assert download(client, bucket, "a.bin") == (200, data)
+    finally:
+        server.minio_client.stat_object = stat_object
+    assert reads.count == 0
+
+
+@pytest.mark.parametrize("size", [500, 100000])
+def test_overwrite_and_delete_invalidate(client, bucket, upload, cache, size):
+    cache.revalidate = 60
+    upload(bucket, "a.bin", os.urandom(size))
+    download(client, bucket, "a.bin")
+
+    newer = os.urandom(size)
+    upload(bucket, "a.bin", newer)
+    assert cache.get(bucket, "a.bin") is None
+    assert download(client, bucket, "a.bin") == (200, newer)
+
+    assert client.delete("/delete", query_string={"bucket": bucket, "object_name": "a.bin"}).status_code == 200
+    assert cache.get(bucket, "a.bin") is None
+    assert download(client, bucket, "a.bin")[0] == 404
+
+
+def test_invalidated_while_reading_is_not_stored(cache):
+    meta = {"etag": "e", "content_type": None, "last_modified": None, "size": 3}
+    chunks = cache.collect("bucket", "a", meta, iter([b"abc"]))
+    next(chunks)
+    # 读取过程中对象被改写
+    cache.invalidate("bucket", "a")
+    list(chunks)
+    assert cache.get("bucket", "a", "e") is None
@@ -0,0 +1,113 @@
+"""去重存储的引用计数：删除、改名和覆盖都要释放引用，最后一个引用释放后回收数据块"""
+import os
+import time
+
+import pytest
+from minio.error import S3Error
+
+from multipart_upload import MIN_PART_SIZE
+
+
+def refs(server, digest):
+    """摘要的引用标记，按 (存储桶, 对象名) 返回"""
+    prefix = f"refs/{digest}/"
+    markers = server.minio_client.list_objects(server.DEDUP_BUCKET, prefix=prefix, recursive=True)
+    return {tuple(marker.object_name[len(prefix):].split("/", 1)) for marker in markers}
+
+
+def blob_exists(server, digest):
+    try:
+        server.minio_client.stat_object(server.DEDUP_BUCKET, server.dedup_store.blob_name(digest))
+        return True
+    except S3Error as e:
+        if e.code == "NoSuchKey":
+            return False
+        raise
+
+
+def download(client, bucket, name):
+    return client.get("/download", query_string={"bucket": bucket, "object_name": name}).data
+
+
+def test_shared_blob_reclaimed_after_last_delete(server, client, bucket, upload):
+    data = os.urandom(1000)
+    first = upload(bucket, "a.bin", data, dedup=True)
+    second = upload(bucket, "b.bin", data, dedup=True)
+    digest = first["sm3"]
+    assert (first["deduplicated"], second["deduplicated"]) == (False, True)
+    assert refs(server, digest) == {(bucket, "a.bin"), (bucket, "b.bin")}
+
+    assert client.delete("/delete", query_string={"bucket": bucket, "object_name": "a.bin"}).status_code == 200
+    assert refs(server, digest) == {(bucket, "b.bin")}
+    assert blob_exists(server, digest)
+    assert download(client, bucket, "b.bin") == data
+
+    assert client.delete("/delete", query_string={"bucket": bucket, "object_name": "b.bin"}).status_code == 200
+    assert refs(server, digest) == set()
+    assert not blob_exists(server, digest)
+
+
+def test_batch_delete_releases_refs(server, client, bucket, upload):
+    digest = upload(bucket, "dir/a.bin", os.urandom(1000), dedup=True)["sm3"]
+    upload(bucket, "b.bin", os.urandom(1000), dedup=False)
+    response = client.post("/batch-delete", json={"bucket": bucket, "keys": ["b.bin"], "prefixes": ["dir/"]})
+    assert response.json["deleted"] == 2
+    assert refs(server, digest) == set()
+    assert not blob_exists(server, digest)
+
+
+def test_rename_moves_ref(server, client, bucket, upload):
+    data = os.urandom(1000)
+    digest = upload(bucket, "a.bin", data, dedup=True)["sm3"]
+    response = client.post("/rename", query_string={"bucket": bucket, "source_name": "a.bin", "target_name": "b.bin"})
+    assert response.status_code == 200
+    assert refs(server, digest) == {(bucket, "b.bin")}
+    assert download(client, bucket, "b.bin") == data
+
+    client.delete("/delete", query_string={"bucket": bucket, "object_name": "b.bin"})
+    assert not blob_exists(server, digest)
+
+
+def test_folder_move_moves_refs(server, client, bucket, upload, jobs):
+    digest = upload(bucket, "src/a.bin", os.urandom(1000), dedup=True)["sm3"]
+    job_id = client.post("/move", query_string={"bucket": bucket, "source": "src", "target": "dst"}).json["job_id"]
+    deadline = time.monotonic() + 10
+    while client.get("/move/status", query_string={"job_id": job_id}).json["state"] == "running":
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+    assert refs(server, digest) == {(bucket, "dst/a.bin")}
+
+
+@pytest.mark.parametrize("dedup", [False, True])
+def test_overwrite_releases_ref(server, client, bucket, upload, dedup):
+    digest = upload(bucket, "a.bin", os.urandom(1000), dedup=True)["sm3"]
+    data = os.urandom(1000)
+    upload(bucket, "a.bin", data, dedup=dedup)
+    assert refs(server, digest) == set()
+    assert not blob_exists(server, digest)
+    assert download(client, bucket, "a.bin") == data
+
+
+def test_same_content_overwrite_keeps_blob(server, client, bucket, upload):
+    data = os.urandom(1000)
+    digest = upload(bucket, "a.bin", data, dedup=True)["sm3"]
+    assert upload(bucket, "a.bin", data, dedup=True)["deduplicated"]
+    assert refs(server, digest) == {(bucket, "a.bin")}
+    assert blob_exists(server, digest)
+    assert download(client, bucket, "a.bin") == data
+
+
+def test_resumable_overwrite_releases_ref(server, client, bucket, upload):
+    digest = upload(bucket, "a.bin", os.urandom(1000), dedup=True)["sm3"]
+    assert refs(server, digest) == {(bucket, "a.bin")}
+
+    data = os.urandom(MIN_PART_SIZE)
+    token = client.post("/upload/initiate", query_string={
+        "bucket": bucket, "object_name": "a.bin", "size": len(data), "chunk_size": MIN_PART_SIZE,
+    }).json["upload_id"]
+    client.put("/upload/chunk", query_string={"upload_id": token, "part_number": 1}, data=data)
+    assert client.post("/upload/complete", query_string={"upload_id": token}).status_code == 200
+
+    assert refs(server, digest) == set()
+    assert not blob_exists(server, digest)
+    assert download(client, bucket, "a.bin") == data
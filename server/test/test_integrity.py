@@ -0,0 +1,84 @@
+"""上传时记录的明文 SM3：密文被篡改后完整下载必须失败，而不是返回错误的内容"""
+import io
+import os
+import zipfile
+
+import pytest
+
+from bulk_ops import object_metadata
+from encryption import STREAM_HEADER
+from multipart_upload import MIN_PART_SIZE
+
+
+def tamper(server, bucket, name, position):
+    """翻转密文中的一个字节（position 为明文偏移），元数据保持不变"""
+    stat = server.minio_client.stat_object(bucket, name)
+    response = server.minio_client.get_object(bucket, name)
+    try:
+        ciphertext = bytearray(response.read())
+    finally:
+        response.close()
+        response.release_conn()
+    ciphertext[STREAM_HEADER.size + position] ^= 0x01
+    metadata = object_metadata(stat)
+    content_type = metadata.pop("Content-Type")
+    server.minio_client.put_object(bucket, name, io.BytesIO(bytes(ciphertext)), len(ciphertext),
+                                   content_type=content_type, metadata=metadata)
+
+
+@pytest.mark.parametrize("size, position", [(1, 0), (200000, 0), (200000, 199999)])
+def test_tampered_download(server, client, bucket, upload, size, position):
+    upload(bucket, "t.bin", os.urandom(size))
+    tamper(server, bucket, "t.bin", position)
+
+    # 响应体是流式输出的，错误在读取响应体的过程中抛出
+    with pytest.raises(server.IntegrityError):
+        client.get("/download", query_string={"bucket": bucket, "object_name": "t.bin"}).get_data()
+
+    info, chunks = server._open_plaintext(bucket, "t.bin", verify=True)
+    with pytest.raises(server.IntegrityError):
+        b"".join(chunks)
+
+
+def test_verify_can_be_skipped(server, client, bucket, upload):
+    data = os.urandom(1000)
+    upload(bucket, "t.bin", data)
+    tamper(server, bucket, "t.bin", 10)
+
+    response = client.get("/download", query_string={"bucket": bucket, "object_name": "t.bin", "verify": "0"})
+    assert response.status_code == 200
+    assert len(response.data) == len(data)
+    assert response.data != data
+
+
+def test_tampered_archive_entry_is_reported(server, client, bucket, upload):
+    upload(bucket, "dir/good.bin", b"good")
+    upload(bucket, "dir/bad.bin", b"bad")
+    tamper(server, bucket, "dir/bad.bin", 0)
+
+    response = client.get("/download-archive", query_string={"bucket": bucket, "prefix": "dir/"})
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+        assert archive.read("dir/good.bin") == b"good"
+        assert "dir/bad.bin" not in archive.namelist()
+        assert "dir/bad.bin" in archive.read("_errors.txt").decode()
+
+
+def test_resumable_upload_records_digest(server, client, bucket):
+    data = os.urandom(MIN_PART_SIZE + 1000)
+    token = client.post("/upload/initiate", query_string={
+        "bucket": bucket, "object_name": "r.bin", "size": len(data), "chunk_size": MIN_PART_SIZE,
+    }).json["upload_id"]
+    for part_number, start in enumerate(range(0, len(data), MIN_PART_SIZE), 1):
+        client.put("/upload/chunk", query_string={"upload_id": token, "part_number": part_number},
+                   data=data[start:start + MIN_PART_SIZE])
+    response = client.post("/upload/complete", query_string={"upload_id": token})
+    digest = server.sm3_hasher.sm3_hexdigest(data)
+    assert response.json["sm3"] == digest
+    metadata = server.minio_client.stat_object(bucket, "r.bin").metadata
+    assert metadata["x-amz-meta-sm3"] == digest
+    assert metadata["x-amz-meta-plaintext-size"] == str(len(data))
+
+    tamper(server, bucket, "r.bin", len(data) - 1)
+    with pytest.raises(server.IntegrityError):
+        client.get("/download", query_string={"bucket": bucket, "object_name": "r.bin"}).get_data()
@@ -0,0 +1,198 @@
+"""后台任务队列：任务记录持久化，进程退出后心跳超时的任务被其他进程重新领取并从检查点继续，进度可轮询，取消与重试"""
+import os
+import threading
+import time
+
+import pytest
+
+from jobs import Job, JobCancelled, JobQueue, JobStateError
+
+
+@pytest.fixture
+def path(tmp_path):
+    return os.path.join(tmp_path, "jobs.db")
+
+
+def queue(path, handler=None, **kwargs):
+    """handler 为 None 时注册一个直接返回参数的处理函数"""
+    kwargs.setdefault("retry_delay", 0)
+    result = JobQueue(path, **kwargs)
+    result.register("echo", handler or (lambda job, params: params))
+    return result
+
+
+def run_next(jobs):
+    """在当前线程中领取并执行一个任务"""
+    row = jobs._claim()
+    assert row is not None
+    jobs._run(row)
+    return jobs.get(row["id"])
+
+
+def wait(jobs, job_id, until, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = jobs.get(job_id)
+        if until(job) or time.monotonic() > deadline:
+            return job
+        time.sleep(0.01)
+
+
+def age_heartbeat(jobs, job_id, seconds):
+    jobs._conn.execute("UPDATE jobs SET heartbeat = heartbeat - ? WHERE id = ?", (seconds, job_id))
+
+
+def test_persisted_across_instances(path):
+    job = queue(path).submit("echo", {"n": 1})
+    assert (job["state"], job["params"], job["progress"]) == ("queued", {"n": 1}, {})
+
+    # 重启后新实例看到排队中的任务并执行
+    restarted = queue(path)
+    assert [item["job_id"] for item in restarted.list(state="queued")] == [job["job_id"]]
+    done = run_next(restarted)
+    assert (done["state"], done["result"], done["attempts"]) == ("completed", {"n": 1}, 1)
+    assert queue(path).get(job["job_id"])["result"] == {"n": 1}
+
+
+def test_submit(path):
+    jobs = queue(path)
+    with pytest.raises(ValueError):
+        jobs.submit("unknown", {})
+    first = jobs.submit("echo", {"a": 1, "b": 2}, unique=True)
+    # 参数相同（与键的顺序无关）的任务仍在排队时直接返回该任务
+    assert jobs.submit("echo", {"b": 2, "a": 1}, unique=True)["job_id"] == first["job_id"]
+    assert jobs.submit("echo", {"a": 1, "b": 2})["job_id"] != first["job_id"]
+    run_next(jobs)
+    assert jobs.submit("echo", {"a": 1, "b": 2}, unique=True)["job_id"] != first["job_id"]
+
+
+def test_lost_worker_is_reclaimed(path):
+    crashed = queue(path, stale_after=60)
+    job_id = crashed.submit("echo", {})["job_id"]
+    row = crashed._claim()
+    resumed_from = {}
+
+    # 第一个进程保存检查点后退出，不再写心跳
+    Job(crashed, job_id, "echo", row["attempts"]).progress(force=True, checkpoint="b")
+    age_heartbeat(crashed, job_id, 30)
+
+    def resume(job, params):
+        resumed_from.update(job.values)
+        job.progress(force=True, checkpoint="c")
+        return "resumed"
+    survivor = queue(path, resume, stale_after=60)
+    # 心跳还没有超时，任务不会被其他进程领取
+    assert survivor._claim() is None
+    age_heartbeat(crashed, job_id, 60)
+
+    done = run_next(survivor)
+    assert resumed_from == {"checkpoint": "b"}
+    assert (done["state"], done["result"], done["attempts"]) == ("completed", "resumed", 2)
+    assert done["progress"] == {"checkpoint": "c"}
+
+    # 原来的进程迟到的结束记录和进度不覆盖新的结果
+    stale = Job(crashed, job_id, "echo", 1, {"checkpoint": "b"})
+    stale.progress(force=True, checkpoint="z")
+    crashed._finish(stale, "failed", error="late")
+    assert crashed.get(job_id)["state"] == "completed"
+    assert crashed.get(job_id)["progress"] == {"checkpoint": "c"}
+
+
+def test_lost_worker_attempts_exhausted(path):
+    crashed = queue(path, max_attempts=1, stale_after=60)
+    job_id = crashed.submit("echo", {})["job_id"]
+    crashed._claim()
+    age_heartbeat(crashed, job_id, 120)
+
+    assert queue(path, stale_after=60)._claim() is None
+    job = crashed.get(job_id)
+    assert (job["state"], job["error"]) == ("failed", "Worker lost")
+
+
+def test_progress_polling(path):
+    release = threading.Event()
+
+    def handler(job, params):
+        for i in range(1, 4):
+            job.progress(force=True, done=i, total=3)
+        release.wait(10)
+        return {"done": 3}
+    jobs = queue(path, handler, poll_interval=0.05)
+    jobs.start()
+    job_id = jobs.submit("echo", {})["job_id"]
+
+    running = wait(jobs, job_id, lambda job: job["progress"].get("done") == 3)
+    assert running["state"] == "running"
+    assert running["progress"] == {"done": 3, "total": 3}
+    assert running["elapsed"] is not None
+    release.set()
+    done = wait(jobs, job_id, lambda job: job["state"] != "running")
+    assert (done["state"], done["result"]) == ("completed", {"done": 3})
+
+
+def test_cancel(path):
+    started = threading.Event()
+
+    def handler(job, params):
+        started.set()
+        while True:
+            job.progress(force=True)
+            time.sleep(0.01)
+    jobs = queue(path, handler, poll_interval=0.05)
+
+    queued = jobs.submit("echo", {})["job_id"]
+    assert jobs.cancel(queued)["state"] == "cancelled"
+    assert jobs.cancel("missing") is None
+
+    jobs.start()
+    running = jobs.submit("echo", {})["job_id"]
+    assert started.wait(10)
+    assert jobs.cancel(running)["cancel_requested"]
+    assert wait(jobs, running, lambda job: job["state"] != "running")["state"] == "cancelled"
+
+
+def test_cancelled_handler(path):
+    def handler(job, params):
+        raise JobCancelled(job.id)
+    jobs = queue(path, handler)
+    jobs.submit("echo", {})
+    assert run_next(jobs)["state"] == "cancelled"
+
+
+def test_retry(path):
+    calls = []
+
+    def handler(job, params):
+        calls.append(job.values)
+        job.progress(force=True, checkpoint=len(calls))
+        if not params.get("fixed"):
+            raise RuntimeError("broken")
+        return "ok"
+    jobs = queue(path, handler, max_attempts=2)
+    job_id = jobs.submit("echo", {"fixed": False})["job_id"]
+
+    # 第一次失败后自动重新排队，达到 max_attempts 后记为失败
+    assert run_next(jobs)["state"] == "queued"
+    failed = run_next(jobs)
+    assert (failed["state"], failed["error"], failed["attempts"]) == ("failed", "broken", 2)
+    assert jobs._claim() is None
+
+    # 手动重试时覆盖参数，保留进度
+    retried = jobs.retry(job_id, {"fixed": True})
+    assert (retried["state"], retried["attempts"], retried["error"]) == ("queued", 0, None)
+    with pytest.raises(JobStateError):
+        jobs.retry(job_id)
+    done = run_next(jobs)
+    assert (done["state"], done["result"], done["params"]) == ("completed", "ok", {"fixed": True})
+    assert calls == [{}, {"checkpoint": 1}, {"checkpoint": 2}]
+    assert jobs.retry("missing") is None
+
+
+def test_retry_backoff(path):
+    def handler(job, params):
+        raise RuntimeError("broken")
+    jobs = queue(path, handler, retry_delay=60)
+    jobs.submit("echo", {})
+    assert run_next(jobs)["state"] == "queued"
+    # 退避时间未到，不会被领取
+    assert jobs._claim() is None
@@ -0,0 +1,44 @@
+"""引入流式格式之前写入的对象：整文件 SM4-ECB + PKCS7，没有对象头和密钥 ID 元数据"""
+import io
+import os
+import zipfile
+
+import pytest
+
+from encryption import LEGACY_KEY_ID
+
+
+def put_legacy(server, bucket, name, data):
+    ciphertext = server.key_ring.get(LEGACY_KEY_ID).encrypt(data)
+    server.minio_client.put_object(bucket, name, io.BytesIO(ciphertext), len(ciphertext))
+
+
+@pytest.mark.parametrize("size", [0, 1, 15, 16, 17, 100000])
+def test_download(server, client, bucket, size):
+    data = os.urandom(size)
+    put_legacy(server, bucket, "old.bin", data)
+
+    response = client.get("/download", query_string={"bucket": bucket, "object_name": "old.bin"})
+    assert response.status_code == 200
+    assert response.data == data
+
+
+def test_range(server, client, bucket):
+    data = os.urandom(1000)
+    put_legacy(server, bucket, "old.bin", data)
+
+    response = client.get("/download", query_string={"bucket": bucket, "object_name": "old.bin"},
+                          headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.data == data[10:20]
+    assert response.headers["Content-Range"] == "bytes 10-19/1000"
+
+
+def test_archive(server, client, bucket):
+    data = os.urandom(5000)
+    put_legacy(server, bucket, "dir/old.bin", data)
+
+    response = client.get("/download-archive", query_string={"bucket": bucket, "prefix": "dir/"})
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+        assert archive.read("dir/old.bin") == data
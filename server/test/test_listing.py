@@ -0,0 +1,126 @@
+"""目录列表分页：按名称分页时从上一页最后一项之后读取，不列出整个目录；各种来源的分页结果与完整列表一致"""
+import io
+import os
+
+import pytest
+
+from cache import TTLCache
+from metadata_index import MetadataIndex
+
+# 文件夹和文件的名称交错排列
+NAMES = [f"d{i:02d}/x" for i in range(7)] + [f"d{i:02d}.txt" for i in range(11)] + ["e/", "e/y", "é.txt"]
+
+
+class Counting:
+    """统计 list_objects 实际产出的条目数"""
+
+    def __init__(self, client):
+        self._client = client
+        self.listed = 0
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def list_objects(self, *args, **kwargs):
+        for obj in self._client.list_objects(*args, **kwargs):
+            self.listed += 1
+            yield obj
+
+
+@pytest.fixture
+def tree(server, bucket, monkeypatch):
+    for name in NAMES:
+        server.minio_client.put_object(bucket, name, io.BytesIO(b"x"), 1)
+    # 每个测试从空的列表缓存开始
+    monkeypatch.setattr(server, "list_cache", TTLCache())
+    return bucket
+
+
+def list_page(client, bucket, **params):
+    response = client.get("/list", query_string=dict(bucket=bucket, **params))
+    assert response.status_code == 200, response.json
+    return response.json
+
+
+def pages(client, bucket, limit, **params):
+    names, token = [], None
+    while True:
+        query = dict(params, limit=limit)
+        if token:
+            query["continuation_token"] = token
+        body = list_page(client, bucket, **query)
+        assert len(body["files"]) <= limit
+        names.extend(item["name"] for item in body["files"])
+        token = body["next_continuation_token"]
+        assert body["is_truncated"] == (token is not None)
+        if token is None:
+            return names
+
+
+def full(client, bucket, **params):
+    return [item["name"] for item in list_page(client, bucket, **params)["files"]]
+
+
+@pytest.mark.parametrize("limit", [1, 3, 7, 100])
+@pytest.mark.parametrize("params", [{}, {"type": "file"}, {"type": "folder"}, {"q": "1"}])
+def test_pages_match_full_listing(server, client, tree, monkeypatch, limit, params):
+    monkeypatch.setattr(server, "list_cache", TTLCache(ttl=0))
+    expected = full(client, tree, **params)
+    assert expected
+    assert pages(client, tree, limit, **params) == expected
+
+
+def test_page_reads_only_what_it_needs(server, client, tree, monkeypatch):
+    counting = Counting(server.minio_client)
+    monkeypatch.setattr(server, "minio_client", counting)
+
+    first = list_page(client, tree, limit=2)
+    assert first["total"] is None
+    assert [item["name"] for item in first["files"]] == ["d00/", "d01/"]
+    # 读到第 3 个文件夹为止（d00.txt 排在 d00/ 之前）
+    assert counting.listed == 6
+
+    # 文件页从上一页最后一个文件之后开始列举
+    counting.listed = 0
+    token = None
+    for _ in range(5):
+        body = list_page(client, tree, limit=2, **({"continuation_token": token} if token else {}))
+        token = body["next_continuation_token"]
+    assert [item["name"] for item in body["files"]] == ["d00.txt", "d01.txt"]
+    counting.listed = 0
+    list_page(client, tree, limit=2, continuation_token=token)
+    # d01/、d02.txt、d02/、d03.txt、d03/、d04.txt
+    assert counting.listed == 6
+
+
+def test_cached_and_streamed_tokens_interchangeable(server, client, tree):
+    first = list_page(client, tree, limit=5)
+    # 完整列表进入缓存，下一页从缓存中定位
+    expected = full(client, tree)
+    second = list_page(client, tree, limit=5, continuation_token=first["next_continuation_token"])
+    assert second["total"] == len(expected)
+    assert [item["name"] for item in first["files"] + second["files"]] == expected[:10]
+
+
+def test_token_survives_deleted_item(server, client, tree):
+    first = list_page(client, tree, limit=9)
+    assert first["files"][-1]["name"] == "d00.txt"
+    server.minio_client.remove_object(tree, "d00.txt")
+    server.list_cache.clear()
+    second = list_page(client, tree, limit=1, continuation_token=first["next_continuation_token"])
+    assert [item["name"] for item in second["files"]] == ["d01.txt"]
+
+
+def test_index_pages(server, client, tree, tmp_path, monkeypatch):
+    index = MetadataIndex(os.path.join(tmp_path, "index.db"))
+    index.reconcile(server.minio_client, tree)
+    monkeypatch.setattr(server, "metadata_index", index)
+    expected = full(client, tree)
+    assert pages(client, tree, 4) == expected
+    assert pages(client, tree, 4, type="file") == full(client, tree, type="file")
+
+
+@pytest.mark.parametrize("token", ["garbage", "e30=", "eyJhZnRlciI6MSwib2Zmc2V0IjowfQ=="])
+def test_invalid_token(client, tree, token):
+    response = client.get("/list", query_string={"bucket": tree, "limit": 2, "continuation_token": token})
+    assert response.status_code == 400
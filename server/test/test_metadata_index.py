@@ -0,0 +1,96 @@
+"""元数据索引的对账：扫描期间的写入和删除不能被过时的列表结果覆盖或写回"""
+import io
+import os
+
+import pytest
+
+from metadata_index import MetadataIndex
+
+
+class DuringScan:
+    """在对账列出第一个对象之后执行 action，模拟扫描进行中发生的写操作"""
+
+    def __init__(self, client, action):
+        self._client = client
+        self._action = action
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def list_objects(self, *args, **kwargs):
+        for i, obj in enumerate(self._client.list_objects(*args, **kwargs)):
+            yield obj
+            if i == 0:
+                self._action()
+
+
+@pytest.fixture
+def index(tmp_path):
+    return MetadataIndex(os.path.join(tmp_path, "index.db"))
+
+
+def put(server, bucket, name, data=b"x"):
+    return server.minio_client.put_object(bucket, name, io.BytesIO(data), len(data))
+
+
+def test_reconcile(server, bucket, index):
+    put(server, bucket, "a/b.txt")
+    put(server, bucket, "c.txt", b"hello")
+    index.upsert(bucket, "gone.txt", 1)
+
+    assert index.reconcile(server.minio_client, bucket) == 2
+    assert index.is_ready(bucket)
+    assert index.get(bucket, "c.txt")["size"] == 5
+    assert index.get(bucket, "gone.txt") is None
+    assert [entry.name for entry in index.list_directory(bucket, "")] == ["a/", "c.txt"]
+
+
+def test_delete_during_scan_is_not_restored(server, bucket, index):
+    put(server, bucket, "a.txt")
+    put(server, bucket, "b.txt")
+
+    def delete():
+        server.minio_client.remove_object(bucket, "a.txt")
+        index.delete(bucket, "a.txt")
+
+    # a.txt 已经被列出，删除发生在写入该批列表结果之前
+    index.reconcile(DuringScan(server.minio_client, delete), bucket)
+    assert index.get(bucket, "a.txt") is None
+    assert index.get(bucket, "b.txt") is not None
+
+    # 之后重新创建的同名对象照常记录
+    put(server, bucket, "a.txt")
+    index.reconcile(server.minio_client, bucket)
+    assert index.get(bucket, "a.txt") is not None
+
+
+def test_write_during_scan_is_not_overwritten(server, bucket, index):
+    put(server, bucket, "a.txt", b"old")
+
+    def overwrite():
+        result = put(server, bucket, "a.txt", b"newer")
+        index.upsert(bucket, "a.txt", 5, result.etag, sm3="digest")
+
+    index.reconcile(DuringScan(server.minio_client, overwrite), bucket)
+    entry = index.get(bucket, "a.txt")
+    assert entry["size"] == 5
+    assert entry["sm3"] == "digest"
+
+    # 下一次对账列表结果与索引一致，摘要保留
+    index.reconcile(server.minio_client, bucket)
+    assert index.get(bucket, "a.txt")["sm3"] == "digest"
+
+
+def test_stale_listing_does_not_replace_newer_row(server, bucket, index):
+    put(server, bucket, "a.txt", b"old")
+    index.reconcile(server.minio_client, bucket)
+    stat = server.minio_client.stat_object(bucket, "a.txt")
+    # 索引中的记录比存储端的列表结果新（例如另一个进程刚写入，列表还没有反映出来）
+    newer = stat.last_modified.replace(year=stat.last_modified.year + 1)
+    index.upsert(bucket, "a.txt", 99, "newer-etag", last_modified=newer)
+    index._conn.execute("UPDATE objects SET scan_id = 0")
+
+    index.reconcile(server.minio_client, bucket)
+    entry = index.get(bucket, "a.txt")
+    assert entry["size"] == 99
+    assert entry["etag"] == "newer-etag"
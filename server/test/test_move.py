@@ -0,0 +1,103 @@
+"""文件夹移动：后台任务复制后删除源对象，目标已存在时需要 overwrite，列表缓存和元数据索引随之更新"""
+import os
+import time
+
+import pytest
+
+from metadata_index import MetadataIndex
+
+
+@pytest.fixture
+def index(server, tmp_path, monkeypatch):
+    """启用元数据索引（对账由测试在写入数据后进行）"""
+    index = MetadataIndex(os.path.join(tmp_path, "index.db"))
+    monkeypatch.setattr(server, "metadata_index", index)
+    return index
+
+
+def move(client, bucket, source, target, **params):
+    return client.post("/move", query_string=dict(bucket=bucket, source=source, target=target, **params))
+
+
+def wait(client, job_id, timeout=10):
+    """轮询 /move/status 直到任务结束"""
+    deadline = time.monotonic() + timeout
+    while True:
+        status = client.get("/move/status", query_string={"job_id": job_id}).json
+        if status["state"] != "running" or time.monotonic() > deadline:
+            return status
+        time.sleep(0.02)
+
+
+def names(server, bucket, prefix=""):
+    return sorted(obj.object_name for obj in server.minio_client.list_objects(bucket, prefix=prefix, recursive=True))
+
+
+def listing(client, bucket):
+    return [item["name"] for item in client.get("/list", query_string={"bucket": bucket}).json["files"]]
+
+
+def download(client, bucket, name):
+    return client.get("/download", query_string={"bucket": bucket, "object_name": name}).data
+
+
+def test_move(server, client, bucket, upload, jobs):
+    files = {"src/a.bin": os.urandom(100), "src/sub/b.bin": os.urandom(200), "other.bin": b"x"}
+    for name, data in files.items():
+        upload(bucket, name, data)
+    assert listing(client, bucket) == ["src/", "other.bin"]
+
+    response = move(client, bucket, "src", "dst")
+    assert response.status_code == 202
+    status = wait(client, response.json["job_id"])
+    assert (status["state"], status["copied"], status["deleted"], status["failed"]) == ("completed", 2, 2, [])
+
+    assert names(server, bucket) == ["dst/a.bin", "dst/sub/b.bin", "other.bin"]
+    assert download(client, bucket, "dst/a.bin") == files["src/a.bin"]
+    assert download(client, bucket, "dst/sub/b.bin") == files["src/sub/b.bin"]
+    # 元数据（摘要、密钥 ID）随对象一起移动
+    assert server.minio_client.stat_object(bucket, "dst/a.bin").metadata["x-amz-meta-sm3"] == \
+        server.sm3_hasher.sm3_hexdigest(files["src/a.bin"])
+    # 移动前缓存的目录列表已失效
+    assert listing(client, bucket) == ["dst/", "other.bin"]
+
+
+@pytest.mark.parametrize("source, target", [("a", "a"), ("a", "a/b")])
+def test_invalid_target(client, bucket, upload, source, target):
+    upload(bucket, "a/x.bin", b"x")
+    assert move(client, bucket, source, target).status_code == 400
+
+
+def test_missing_source(client, bucket):
+    assert move(client, bucket, "nope", "dst").status_code == 404
+
+
+def test_target_exists(server, client, bucket, upload, jobs):
+    upload(bucket, "src/a.bin", b"new a")
+    upload(bucket, "src/b.bin", b"new b")
+    upload(bucket, "dst/a.bin", b"old a")
+    upload(bucket, "dst/c.bin", b"old c")
+
+    response = move(client, bucket, "src", "dst")
+    assert response.status_code == 409
+    assert names(server, bucket, "src/") == ["src/a.bin", "src/b.bin"]
+
+    # overwrite 时合并到已有文件夹，同名文件被覆盖
+    status = wait(client, move(client, bucket, "src", "dst", overwrite=1).json["job_id"])
+    assert status["state"] == "completed"
+    assert names(server, bucket) == ["dst/a.bin", "dst/b.bin", "dst/c.bin"]
+    assert download(client, bucket, "dst/a.bin") == b"new a"
+    assert download(client, bucket, "dst/c.bin") == b"old c"
+
+
+def test_index_updated(server, client, bucket, upload, jobs, index):
+    upload(bucket, "src/a.bin", b"aaa")
+    upload(bucket, "keep.bin", b"k")
+    index.reconcile(server.minio_client, bucket)
+
+    status = wait(client, move(client, bucket, "src", "dst").json["job_id"])
+    assert status["state"] == "completed"
+    assert index.get(bucket, "src/a.bin") is None
+    entry = index.get(bucket, "dst/a.bin")
+    assert entry["sm3"] == server.sm3_hasher.sm3_hexdigest(b"aaa")
+    assert [entry.name for entry in index.list_directory(bucket, "")] == ["dst/", "keep.bin"]
@@ -0,0 +1,130 @@
+"""可续传分块上传：会话令牌的 HMAC-SM3 校验、分块重传（含并发重传）和大小限制"""
+import base64
+import io
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from multipart_upload import MAX_CHUNK_SIZE, MAX_PARTS, MIN_PART_SIZE, UploadSessionError
+
+CHUNK_SIZE = MIN_PART_SIZE
+
+
+def initiate(client, bucket, name, size, chunk_size=CHUNK_SIZE):
+    return client.post("/upload/initiate", query_string={
+        "bucket": bucket, "object_name": name, "size": size, "chunk_size": chunk_size,
+    })
+
+
+def put_chunk(client, token, part_number, data):
+    return client.put("/upload/chunk", query_string={"upload_id": token, "part_number": part_number}, data=data)
+
+
+def forge(token, **changes):
+    """修改令牌中的会话字段，保留原签名"""
+    encoded, signature = token.rsplit(".", 1)
+    session = json.loads(base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4)))
+    session.update(changes)
+    payload = json.dumps(session, separators=(",", ":"), sort_keys=True).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=") + "." + signature
+
+
+def test_upload_out_of_order(client, bucket):
+    data = os.urandom(2 * CHUNK_SIZE + 1234)
+    response = initiate(client, bucket, "r.bin", len(data))
+    assert response.status_code == 200
+    assert response.json["chunks"] == 3
+    token = response.json["upload_id"]
+
+    for part_number in (3, 1, 2):
+        start = (part_number - 1) * CHUNK_SIZE
+        assert put_chunk(client, token, part_number, data[start:start + CHUNK_SIZE]).status_code == 200
+    assert client.get("/upload/status", query_string={"upload_id": token}).json["missing"] == []
+    assert client.post("/upload/complete", query_string={"upload_id": token}).status_code == 200
+
+    response = client.get("/download", query_string={"bucket": bucket, "object_name": "r.bin"})
+    assert response.data == data
+
+
+@pytest.mark.parametrize("changes", [{"object": "evil.bin"}, {"size": 1}, {"chunk_size": MIN_PART_SIZE + 1}])
+def test_forged_token_rejected(client, bucket, changes):
+    token = initiate(client, bucket, "r.bin", CHUNK_SIZE + 5).json["upload_id"]
+    forged = forge(token, **changes)
+
+    response = put_chunk(client, forged, 1, b"x" * CHUNK_SIZE)
+    assert response.status_code == 400
+    assert response.json["error"] == "Invalid upload_id"
+    for method, path in (("get", "/upload/status"), ("post", "/upload/complete"), ("delete", "/upload/abort")):
+        assert getattr(client, method)(path, query_string={"upload_id": forged}).status_code == 400
+    assert client.get("/upload/status", query_string={"upload_id": token}).json["received"] == []
+
+
+@pytest.mark.parametrize("token", ["", "garbage", "abc.def", "e30.00"])
+def test_malformed_token_rejected(client, token):
+    response = client.get("/upload/status", query_string={"upload_id": token})
+    assert response.status_code == 400
+
+
+def test_chunk_resend(client, bucket):
+    data = os.urandom(CHUNK_SIZE + 5)
+    token = initiate(client, bucket, "r.bin", len(data)).json["upload_id"]
+
+    first = put_chunk(client, token, 1, data[:CHUNK_SIZE])
+    again = put_chunk(client, token, 1, data[:CHUNK_SIZE])
+    assert first.status_code == again.status_code == 200
+    assert first.json["etag"] == again.json["etag"]
+    # 换了内容重传会重用同一段密钥流，必须拒绝
+    assert put_chunk(client, token, 1, os.urandom(CHUNK_SIZE)).status_code == 400
+    # 长度与会话不符的分块
+    assert put_chunk(client, token, 2, data[CHUNK_SIZE:] + b"x").status_code == 400
+
+
+@pytest.mark.parametrize("size, chunk_size", [
+    (10, MIN_PART_SIZE - 1),
+    (10, MAX_CHUNK_SIZE + 1),
+    ((MAX_PARTS + 1) * CHUNK_SIZE, CHUNK_SIZE),
+    (-1, CHUNK_SIZE),
+])
+def test_initiate_limits(client, bucket, size, chunk_size):
+    assert initiate(client, bucket, "r.bin", size, chunk_size).status_code == 400
+
+
+class SlowParts:
+    """上传分块前等待，让并发的同一分块上传在检查之后、写入之前交错"""
+
+    def __init__(self, client, delay=0.2):
+        self._client = client
+        self._delay = delay
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def upload_part(self, *args, **kwargs):
+        time.sleep(self._delay)
+        return self._client.upload_part(*args, **kwargs)
+
+
+def test_concurrent_chunk_with_different_content(server, client, bucket):
+    data = os.urandom(CHUNK_SIZE + 5)
+    token = initiate(client, bucket, "r.bin", len(data)).json["upload_id"]
+    storage = SlowParts(server.minio_client)
+    bodies = [data[:CHUNK_SIZE], os.urandom(CHUNK_SIZE)]
+
+    def put(body):
+        try:
+            return server.resumable_uploads.put_chunk(storage, token, 1, io.BytesIO(body), len(body))
+        except UploadSessionError as e:
+            return e
+
+    with ThreadPoolExecutor(2) as pool:
+        results = list(pool.map(put, bodies))
+    # 只有一个写入成功，另一个被当作内容不同的重传拒绝
+    assert sum(isinstance(result, UploadSessionError) for result in results) == 1
+    winner = bodies[0] if isinstance(results[1], UploadSessionError) else bodies[1]
+    assert put_chunk(client, token, 2, data[CHUNK_SIZE:]).status_code == 200
+    assert client.post("/upload/complete", query_string={"upload_id": token}).status_code == 200
+    response = client.get("/download", query_string={"bucket": bucket, "object_name": "r.bin"})
+    assert response.data == winner + data[CHUNK_SIZE:]
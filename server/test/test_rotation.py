@@ -0,0 +1,151 @@
+"""密钥轮换：reencrypt 任务把旧密钥、旧 ECB 格式的对象和去重数据块改用当前密钥，可从检查点继续，不覆盖并发写入"""
+import io
+import os
+
+import pytest
+
+from encryption import KEY_ID_METADATA, KeyRing, STREAM_HEADER, STREAM_MAGIC
+
+KEYS = {"old": os.urandom(16), "new": os.urandom(16)}
+
+
+class Job:
+    """reencrypt 处理函数使用的任务句柄：values 为上一次执行保存的进度"""
+
+    def __init__(self, values=None):
+        self.values = dict(values or {})
+
+    def progress(self, force=False, **values):
+        self.values.update(values)
+
+
+class Recording:
+    """记录写入的存储桶；on_copy 在条件复制之前执行，模拟重新加密期间的并发写入"""
+
+    def __init__(self, client, on_copy=None):
+        self._client = client
+        self._on_copy = on_copy
+        self.written = []
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def put_object(self, bucket_name, object_name, *args, **kwargs):
+        self.written.append((bucket_name, object_name))
+        return self._client.put_object(bucket_name, object_name, *args, **kwargs)
+
+    def copy_if_match(self, *args, **kwargs):
+        if self._on_copy is not None:
+            self._on_copy()
+        return self._client.copy_if_match(*args, **kwargs)
+
+
+@pytest.fixture
+def rotate(server, monkeypatch):
+    """先用 old 密钥写入，调用 rotate() 后当前密钥换成 new"""
+    monkeypatch.setattr(server, "key_ring", KeyRing(KEYS, "old"))
+
+    def rotate():
+        monkeypatch.setattr(server, "key_ring", KeyRing(KEYS, "new"))
+    return rotate
+
+
+def reencrypt(server, bucket, values=None):
+    job = Job(values)
+    return server._reencrypt_job(job, {"bucket": bucket, "prefix": ""}), job
+
+
+def download(client, bucket, name):
+    response = client.get("/download", query_string={"bucket": bucket, "object_name": name})
+    assert response.status_code == 200
+    return response.data
+
+
+def key_id(server, bucket, name):
+    return server.minio_client.stat_object(bucket, name).metadata.get(KEY_ID_METADATA)
+
+
+def test_old_key(server, client, bucket, upload, rotate, monkeypatch):
+    data = os.urandom(200000)
+    digest = upload(bucket, "a.bin", data)["sm3"]
+    assert key_id(server, bucket, "a.bin") == "old"
+    rotate()
+    recording = Recording(server.minio_client)
+    monkeypatch.setattr(server, "minio_client", recording)
+
+    result, _ = reencrypt(server, bucket)
+    assert (result["updated"], result["skipped"]) == (1, 0)
+    assert key_id(server, bucket, "a.bin") == "new"
+    assert server.minio_client.stat_object(bucket, "a.bin").metadata["x-amz-meta-sm3"] == digest
+    assert download(client, bucket, "a.bin") == data
+    # 新密文暂存在系统存储桶中，复制回原位置后删除
+    staged = [(b, name) for b, name in recording.written if name.startswith(server.REENCRYPT_STAGING_PREFIX)]
+    assert staged and {b for b, _ in staged} == {server.SYSTEM_BUCKET}
+    assert not list(server.minio_client.list_objects(server.SYSTEM_BUCKET, prefix=server.REENCRYPT_STAGING_PREFIX))
+
+    # 已是当前密钥的对象跳过
+    result, _ = reencrypt(server, bucket)
+    assert (result["updated"], result["skipped"]) == (0, 1)
+
+
+def test_legacy_ecb(server, client, bucket, rotate):
+    data = os.urandom(1000)
+    ciphertext = server.key_ring.get(None).encrypt(data)
+    server.minio_client.put_object(bucket, "old.bin", io.BytesIO(ciphertext), len(ciphertext))
+    rotate()
+
+    result, _ = reencrypt(server, bucket)
+    assert result["updated"] == 1
+    stat = server.minio_client.stat_object(bucket, "old.bin")
+    assert stat.metadata[KEY_ID_METADATA] == "new"
+    assert stat.metadata["x-amz-meta-sm3"] == server.sm3_hasher.sm3_hexdigest(data)
+    assert stat.size == STREAM_HEADER.size + len(data)
+    response = server.minio_client.get_object(bucket, "old.bin")
+    try:
+        assert response.read(len(STREAM_MAGIC)) == STREAM_MAGIC
+    finally:
+        response.close()
+        response.release_conn()
+    assert download(client, bucket, "old.bin") == data
+
+
+def test_dedup_blob(server, client, bucket, upload, rotate):
+    data = os.urandom(5000)
+    digest = upload(bucket, "a.bin", data, dedup=True)["sm3"]
+    blob = server.dedup_store.blob_name(digest)
+    assert key_id(server, server.DEDUP_BUCKET, blob) == "old"
+    rotate()
+
+    result, _ = reencrypt(server, bucket)
+    assert result["updated"] == 1
+    # 改写的是数据块，引用对象不变
+    assert key_id(server, server.DEDUP_BUCKET, blob) == "new"
+    assert server.dedup_store.read_ref(server.minio_client, bucket, "a.bin")[0] == digest
+    assert download(client, bucket, "a.bin") == data
+
+
+def test_resume_from_checkpoint(server, client, bucket, upload, rotate):
+    for name in ("a.bin", "b.bin", "c.bin"):
+        upload(bucket, name, name.encode() * 100)
+    rotate()
+
+    result, job = reencrypt(server, bucket, {"checkpoint": "b.bin"})
+    assert result["scanned"] == result["updated"] == 1
+    assert job.values["checkpoint"] == "c.bin"
+    assert [key_id(server, bucket, name) for name in ("a.bin", "b.bin", "c.bin")] == ["old", "old", "new"]
+    for name in ("a.bin", "b.bin", "c.bin"):
+        assert download(client, bucket, name) == name.encode() * 100
+
+
+def test_concurrent_overwrite_wins(server, client, bucket, upload, rotate, monkeypatch):
+    upload(bucket, "a.bin", os.urandom(1000))
+    rotate()
+    newer = os.urandom(2000)
+    monkeypatch.setattr(server, "minio_client", Recording(
+        server.minio_client, on_copy=lambda: upload(bucket, "a.bin", newer)
+    ))
+
+    result, _ = reencrypt(server, bucket)
+    assert (result["updated"], result["skipped"], result["failed"]) == (0, 1, 0)
+    assert download(client, bucket, "a.bin") == newer
+    assert not list(server.minio_client.list_objects(server.SYSTEM_BUCKET, prefix=server.REENCRYPT_STAGING_PREFIX))
@@ -0,0 +1,109 @@
+"""存储后端的公开接口：条件写入、条件复制和分片上传（本地存储后端）"""
+import io
+
+import pytest
+from minio.commonconfig import CopySource
+from minio.error import S3Error
+
+from local_storage import LocalStorage
+from metrics import InstrumentedClient
+from storage import MinioStorage, StorageBackend, StorageConfig, create_minio_client, pool_stats
+
+
+def put(storage, bucket, name, data):
+    return storage.put_object(bucket, name, io.BytesIO(data), len(data))
+
+
+def read(storage, bucket, name):
+    response = storage.get_object(bucket, name)
+    try:
+        return response.read()
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def test_backends_share_interface():
+    assert issubclass(MinioStorage, StorageBackend)
+    assert issubclass(LocalStorage, StorageBackend)
+
+
+def test_pool_stats():
+    config = StorageConfig(endpoint="localhost:9000", access_key="key", secret_key="secret", backend="minio")
+    client = create_minio_client(config)
+    assert client.http_client is not None and pool_stats(client) == []
+    # 连接池在第一次请求时按主机创建，这里不发出请求，直接取得该主机的连接池
+    client.http_client.connection_from_url("http://localhost:9000")
+    stats = pool_stats(InstrumentedClient(client))
+    assert [(pool["host"], pool["maxsize"], pool["created"]) for pool in stats] == \
+        [("http://localhost:9000", config.pool_size, 0)]
+
+
+def test_pool_stats_without_pool(server):
+    assert pool_stats(server.minio_client) == []
+    assert pool_stats(MinioStorage("localhost:9000")) == []
+
+
+def test_put_if_absent(server, bucket):
+    storage = server.minio_client
+    storage.put_if_absent(bucket, "lock", b"first", metadata={"owner": "a"})
+    with pytest.raises(S3Error) as error:
+        storage.put_if_absent(bucket, "lock", b"second")
+    assert error.value.code == "PreconditionFailed"
+    assert read(storage, bucket, "lock") == b"first"
+    assert storage.stat_object(bucket, "lock").metadata["x-amz-meta-owner"] == "a"
+
+
+def test_copy_if_match(server, bucket):
+    storage = server.minio_client
+    put(storage, bucket, "src", b"new")
+    target = put(storage, bucket, "dst", b"old")
+    source = CopySource(bucket, "src")
+
+    with pytest.raises(S3Error) as error:
+        storage.copy_if_match(bucket, "dst", source, "0" * 32)
+    assert error.value.code == "PreconditionFailed"
+    with pytest.raises(S3Error):
+        storage.copy_if_match(bucket, "missing", source, target.etag)
+    assert read(storage, bucket, "dst") == b"old"
+
+    storage.copy_if_match(bucket, "dst", source, target.etag, metadata={"Content-Type": "text/plain", "k": "v"})
+    stat = storage.stat_object(bucket, "dst")
+    assert read(storage, bucket, "dst") == b"new"
+    assert stat.content_type == "text/plain"
+    assert stat.metadata["x-amz-meta-k"] == "v"
+
+
+def test_multipart(server, bucket):
+    storage = server.minio_client
+    upload_id = storage.create_multipart(bucket, "m.bin", content_type="text/plain", metadata={"k": "v"})
+    etags = {n: storage.upload_part(bucket, "m.bin", upload_id, n, bytes([n]) * 10) for n in (2, 1, 3)}
+
+    listed = storage.list_parts(bucket, "m.bin", upload_id, max_parts=2)
+    assert [part.part_number for part in listed.parts] == [1, 2]
+    assert listed.is_truncated
+    rest = storage.list_parts(bucket, "m.bin", upload_id, part_number_marker=listed.next_part_number_marker)
+    assert [(part.part_number, part.etag) for part in rest.parts] == [(3, etags[3])]
+    assert not rest.is_truncated
+
+    parts = listed.parts + rest.parts
+    with pytest.raises(S3Error) as error:
+        storage.complete_multipart(bucket, "m.bin", upload_id, parts, if_match="0" * 32)
+    assert error.value.code == "PreconditionFailed"
+    storage.complete_multipart(bucket, "m.bin", upload_id, parts, if_none_match=True)
+    assert read(storage, bucket, "m.bin") == b"\x01" * 10 + b"\x02" * 10 + b"\x03" * 10
+    stat = storage.stat_object(bucket, "m.bin")
+    assert stat.content_type == "text/plain"
+    assert stat.metadata["x-amz-meta-k"] == "v"
+    with pytest.raises(S3Error) as error:
+        storage.list_parts(bucket, "m.bin", upload_id)
+    assert error.value.code == "NoSuchUpload"
+
+
+def test_abort_multipart(server, bucket):
+    storage = server.minio_client
+    upload_id = storage.create_multipart(bucket, "m.bin")
+    storage.upload_part(bucket, "m.bin", upload_id, 1, b"x")
+    storage.abort_multipart(bucket, "m.bin", upload_id)
+    with pytest.raises(S3Error):
+        storage.upload_part(bucket, "m.bin", upload_id, 1, b"x")
@@ -0,0 +1,71 @@
+"""上传 / 下载往返：空文件、1 字节、加密分块和并行上传分片边界附近的大小，以及 Range 请求"""
+import os
+
+import pytest
+
+from encryption import STREAM_CHUNK_SIZE, STREAM_HEADER
+
+PART_SIZE = int(os.environ["MULTIPART_PART_SIZE"])
+# 并行上传时第一个分片以对象头开头，明文的分片边界比 PART_SIZE 小一个对象头
+PART_BOUNDARY = PART_SIZE - STREAM_HEADER.size
+
+SIZES = [
+    0,
+    1,
+    STREAM_CHUNK_SIZE - 1,
+    STREAM_CHUNK_SIZE,
+    STREAM_CHUNK_SIZE + 1,
+    # 达到 2 个分片才走并行上传
+    2 * PART_SIZE - 1,
+    2 * PART_SIZE,
+    2 * PART_BOUNDARY + 1,
+    3 * PART_BOUNDARY,
+]
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_round_trip(server, client, bucket, upload, size):
+    data = os.urandom(size)
+    result = upload(bucket, "a.bin", data)
+    assert result["sm3"] == server.sm3_hasher.sm3_hexdigest(data)
+
+    response = client.get("/download", query_string={"bucket": bucket, "object_name": "a.bin"})
+    assert response.status_code == 200
+    assert response.data == data
+    assert int(response.headers["Content-Length"]) == size
+
+    # 密文 = 对象头 + 等长的 CTR 密文
+    stat = server.minio_client.stat_object(bucket, "a.bin")
+    assert stat.size == STREAM_HEADER.size + size
+
+
+@pytest.mark.parametrize("start, stop", [
+    (0, 1),
+    (1, 100),
+    (STREAM_CHUNK_SIZE - 1, STREAM_CHUNK_SIZE + 1),
+    (PART_BOUNDARY - 10, PART_BOUNDARY + 10),
+    (2 * PART_SIZE, 2 * PART_SIZE + 5),
+])
+def test_range(client, bucket, upload, start, stop):
+    data = os.urandom(2 * PART_SIZE + 5)
+    upload(bucket, "r.bin", data)
+
+    response = client.get("/download", query_string={"bucket": bucket, "object_name": "r.bin"},
+                          headers={"Range": f"bytes={start}-{stop - 1}"})
+    assert response.status_code == 206
+    assert response.data == data[start:stop]
+    assert response.headers["Content-Range"] == f"bytes {start}-{stop - 1}/{len(data)}"
+
+
+def test_range_suffix_and_unsatisfiable(client, bucket, upload):
+    data = os.urandom(1000)
+    upload(bucket, "s.bin", data)
+    query = {"bucket": bucket, "object_name": "s.bin"}
+
+    response = client.get("/download", query_string=query, headers={"Range": "bytes=-10"})
+    assert response.status_code == 206
+    assert response.data == data[-10:]
+
+    response = client.get("/download", query_string=query, headers={"Range": "bytes=1000-"})
+    assert response.status_code == 416
+    assert response.headers["Content-Range"] == "bytes */1000"
@@ -19,6 +19,15 @@ import { BasicStatus, FileType } from "#/enum";
 // MinIO 服务配置
 const MINIO_API_URL = "http://127.0.0.1:5000";
 const DEFAULT_BUCKET = "test";
+// 超过该大小的文件使用可续传的分块上传
+const CHUNKED_UPLOAD_THRESHOLD = 8 * 1024 * 1024;
+// 分块上传时同时上传的分块数
+const CHUNK_UPLOAD_CONCURRENCY = 3;
+// 文件夹移动任务的进度轮询间隔（毫秒）
+const MOVE_POLL_INTERVAL = 500;
+// 列表中缩略图的尺寸（请求的预览图长边像素，高分屏下仍然清晰）
+const THUMBNAIL_SIZE = 24;
+const THUMBNAIL_PREVIEW_SIZE = 64;
 
 // 定义默认值
 const defaultFileValue: File = {
@@ -43,6 +52,70 @@ const defaultFolderValue: File = {
   size: 0,
 };
 
+// 分块上传：会话令牌保存在 localStorage 中，同一文件再次上传时只补传缺失的分块
+const uploadInChunks = async (file: globalThis.File, objectPath: string) => {
+  const sessionKey = `upload:${DEFAULT_BUCKET}:${objectPath}:${file.size}:${file.lastModified}`;
+  let uploadId = localStorage.getItem(sessionKey);
+  let session: any = null;
+
+  if (uploadId) {
+    const response = await fetch(`${MINIO_API_URL}/upload/status?${new URLSearchParams({ upload_id: uploadId })}`);
+    if (response.ok) {
+      session = await response.json();
+    } else {
+      localStorage.removeItem(sessionKey);
+    }
+  }
+
+  if (!session) {
+    const response = await fetch(`${MINIO_API_URL}/upload/initiate?${new URLSearchParams({
+      bucket: DEFAULT_BUCKET,
+      object_name: objectPath,
+      size: String(file.size),
+      content_type: file.type || "application/octet-stream"
+    })}`, {
+      method: 'POST'
+    });
+    const data = await response.json();
+    if (!response.ok) {
+      throw new Error(data.error || "Initiate upload failed");
+    }
+    uploadId = data.upload_id as string;
+    localStorage.setItem(sessionKey, uploadId);
+    session = { ...data, missing: Array.from({ length: data.chunks }, (_, i) => i + 1) };
+  }
+
+  // 多个分块并行上传
+  const queue: number[] = [...session.missing];
+  const worker = async () => {
+    while (queue.length) {
+      const partNumber = queue.shift() as number;
+      const start = (partNumber - 1) * session.chunk_size;
+      const response = await fetch(`${MINIO_API_URL}/upload/chunk?${new URLSearchParams({
+        upload_id: uploadId as string,
+        part_number: String(partNumber)
+      })}`, {
+        method: 'PUT',
+        body: file.slice(start, start + session.chunk_size),
+      });
+      if (!response.ok) {
+        const errorData = await response.json();
+        throw new Error(errorData.error || "Chunk upload failed");
+      }
+    }
+  };
+  await Promise.all(Array.from({ length: CHUNK_UPLOAD_CONCURRENCY }, worker));
+
+  const response = await fetch(`${MINIO_API_URL}/upload/complete?${new URLSearchParams({ upload_id: uploadId as string })}`, {
+    method: 'POST'
+  });
+  if (!response.ok) {
+    const errorData = await response.json();
+    throw new Error(errorData.error || "Complete upload failed");
+  }
+  localStorage.removeItem(sessionKey);
+};
+
 // 获取文件类型
 const getFileType = (fileName: string): FileType => {
   if (fileName.endsWith('/')) return FileType.FOLDER;
@@ -59,6 +132,28 @@ const getFileType = (fileName: string): FileType => {
   }
 };
 
+// 图片和 PDF 显示服务端生成的缩略图，不支持或加载失败时退回类型图标
+function FileThumbnail({ objectPath, fallback }: { objectPath: string; fallback: JSX.Element }) {
+  const [failed, setFailed] = useState(false);
+  if (failed) return fallback;
+  const params = new URLSearchParams({
+    bucket: DEFAULT_BUCKET,
+    object_name: objectPath,
+    size: String(THUMBNAIL_PREVIEW_SIZE)
+  });
+  return (
+    <img
+      src={`${MINIO_API_URL}/preview?${params}`}
+      alt=""
+      loading="lazy"
+      width={THUMBNAIL_SIZE}
+      height={THUMBNAIL_SIZE}
+      style={{ objectFit: "cover" }}
+      onError={() => setFailed(true)}
+    />
+  );
+}
+
 export default function FilePage() {
   const { t } = useTranslation();
   const fileInputRef = useRef<HTMLInputElement>(null);
@@ -110,6 +205,32 @@ export default function FilePage() {
   }, [currentFolderId, t]);
 
     
+  // 服务端移动整个文件夹，返回时任务已结束
+  const moveFolder = async (source: string, target: string) => {
+    const response = await fetch(`${MINIO_API_URL}/move?${new URLSearchParams({
+      bucket: DEFAULT_BUCKET,
+      source,
+      target
+    })}`, {
+      method: 'POST'
+    });
+    let job = await response.json();
+    if (!response.ok) {
+      throw new Error(job.error || "Move failed");
+    }
+    while (job.state === 'running') {
+      await new Promise(resolve => setTimeout(resolve, MOVE_POLL_INTERVAL));
+      const statusResponse = await fetch(`${MINIO_API_URL}/move/status?${new URLSearchParams({ job_id: job.job_id })}`);
+      job = await statusResponse.json();
+      if (!statusResponse.ok) {
+        throw new Error(job.error || "Move failed");
+      }
+    }
+    if (job.state !== 'completed') {
+      throw new Error(job.error || `${job.failed.length} objects failed to move`);
+    }
+  };
+
   // 重命名文件或文件夹
   const onRename = async (formValue: File, newName: string) => {
     if (!formValue) {
@@ -122,17 +243,22 @@ export default function FilePage() {
       const sourcePath = currentFolderId ? `${currentFolderId}${formValue.name}` : formValue.name;
       const targetPath = currentFolderId ? `${currentFolderId}${newName}` : newName;
   
-      const response = await fetch(`${MINIO_API_URL}/rename?${new URLSearchParams({
-        bucket: DEFAULT_BUCKET,
-        source_name: sourcePath,
-        target_name: targetPath
-      })}`, {
-        method: 'POST'
-      });
+      if (formValue.type === FileType.FOLDER) {
+        // 文件夹由服务端整体移动，轮询任务进度直到完成
+        await moveFolder(sourcePath, targetPath);
+      } else {
+        const response = await fetch(`${MINIO_API_URL}/rename?${new URLSearchParams({
+          bucket: DEFAULT_BUCKET,
+          source_name: sourcePath,
+          target_name: targetPath
+        })}`, {
+          method: 'POST'
+        });
   
-      if (!response.ok) {
-        const errorData = await response.json();
-        throw new Error(errorData.error || "Rename failed");
+        if (!response.ok) {
+          const errorData = await response.json();
+          throw new Error(errorData.error || "Rename failed");
+        }
       }
   
       message.success(t("sys.menu.file.renameSuccess"));
@@ -206,24 +332,30 @@ export default function FilePage() {
     }
   
     const file = fileInput.files[0];
-    const formData = new FormData();
-    formData.append('file', file);
-    formData.append('bucket', DEFAULT_BUCKET);
     
     // Use the name from form or original filename
     const objectName = values.name || file.name;
     const objectPath = currentFolderId ? `${currentFolderId}${objectName}` : objectName;
-    formData.append('object_name', objectPath);
   
     try {
-      const response = await fetch(`${MINIO_API_URL}/upload`, {
-        method: 'POST',
-        body: formData,
-      });
-  
-      if (!response.ok) {
-        const errorData = await response.json();
-        throw new Error(errorData.error || t("sys.menu.file.uploadFailed"));
+      if (file.size > CHUNKED_UPLOAD_THRESHOLD) {
+        // 大文件分块上传，中断后重新上传同一文件会从断点继续
+        await uploadInChunks(file, objectPath);
+      } else {
+        const formData = new FormData();
+        formData.append('file', file);
+        formData.append('bucket', DEFAULT_BUCKET);
+        formData.append('object_name', objectPath);
+
+        const response = await fetch(`${MINIO_API_URL}/upload`, {
+          method: 'POST',
+          body: formData,
+        });
+    
+        if (!response.ok) {
+          const errorData = await response.json();
+          throw new Error(errorData.error || t("sys.menu.file.uploadFailed"));
+        }
       }
   
       message.success(t("sys.menu.file.uploadSuccess"));
@@ -261,16 +393,17 @@ export default function FilePage() {
       width: 300,
       render: (_, record) => {
         let icon: JSX.Element | null;
+        const objectPath = `${currentFolderId}${record.name}`;
         switch (record.type) {
           case FileType.FOLDER:
             icon = <FaFolder size={24} />;
             break;
           case FileType.JPEG:
           case FileType.PNG:
-            icon = <FaFileImage size={24} />;
+            icon = <FileThumbnail key={objectPath} objectPath={objectPath} fallback={<FaFileImage size={24} />} />;
             break;
           case FileType.PDF:
-            icon = <FaFilePdf size={24} />;
+            icon = <FileThumbnail key={objectPath} objectPath={objectPath} fallback={<FaFilePdf size={24} />} />;
             break;
           case FileType.DOCX:
             icon = <FaFileWord size={24} />;
@@ -416,6 +549,16 @@ export default function FilePage() {
     try {
       // 构建完整的对象路径
       const objectPath = currentFolderId ? `${currentFolderId}${file.name}` : file.name;
+      if (file.type === FileType.FOLDER) {
+        // 文件夹打包为 ZIP 流式下载
+        const params = new URLSearchParams({
+          bucket: DEFAULT_BUCKET,
+          prefix: objectPath
+        });
+        window.open(`${MINIO_API_URL}/download-archive?${params}`, '_blank');
+        message.success(t("sys.menu.file.downloadSuccess"));
+        return;
+      }
       const params = new URLSearchParams({
         bucket: DEFAULT_BUCKET,
         object_name: objectPath
@@ -456,18 +599,27 @@ export default function FilePage() {
       // 构建完整的对象路径
       const objectPath = currentFolderId ? `${currentFolderId}${formValue.name}` : formValue.name;
       
-      const params = new URLSearchParams({
-        bucket: DEFAULT_BUCKET,
-        object_name: objectPath
-      });
-      
-      const response = await fetch(`${MINIO_API_URL}/delete?${params}`, {
-        method: 'DELETE'
-      });
+      let response: Response;
+      if (formValue.type === FileType.FOLDER) {
+        // 文件夹连同其中的所有文件一起批量删除
+        response = await fetch(`${MINIO_API_URL}/batch-delete`, {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({ bucket: DEFAULT_BUCKET, prefixes: [objectPath] })
+        });
+      } else {
+        const params = new URLSearchParams({
+          bucket: DEFAULT_BUCKET,
+          object_name: objectPath
+        });
+        response = await fetch(`${MINIO_API_URL}/delete?${params}`, {
+          method: 'DELETE'
+        });
+      }
   
-      if (!response.ok) {
-        const errorData = await response.json();
-        throw new Error(errorData.error || "Delete failed");
+      const result = await response.json();
+      if (!response.ok || result.failed) {
+        throw new Error(result.error || "Delete failed");
       }
   
       message.success(t("sys.menu.file.deleteSuccess"));